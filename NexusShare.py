@@ -8,28 +8,51 @@
 import os
 import sys
 import json
-import shutil
 import threading
-import socket
-import webbrowser
-import subprocess
-import platform
 import mimetypes
 import time
+import re
+import queue
+import asyncio
+import html
+import uuid
+import atexit
+import glob
+import argparse
+import signal
+import shutil
+import base64
+import bisect
+import heapq
+import contextvars
+import gzip
+import hashlib
+import zlib
+import zipfile
+import errno
+import importlib.util
+import multiprocessing
+import concurrent.futures
+import http.client
+from array import array
+from collections import namedtuple, OrderedDict, deque
+from itertools import compress, repeat
+from operator import contains
 from datetime import datetime
+from http import HTTPStatus
 from http.server import SimpleHTTPRequestHandler, HTTPServer
-from urllib.parse import parse_qs, urlparse
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs, urlparse, quote, unquote
 from io import BytesIO
+from concurrent.futures.process import BrokenProcessPool
 
-# Third-party libraries (must be installed: pip install customtkinter Pillow qrcode)
 try:
-    import customtkinter as ctk
-    from PIL import Image, ImageTk
-    import qrcode
+    import zstandard  # Optional: enables zstd-encoded downloads
 except ImportError:
-    print("FATAL ERROR: Required libraries are missing.")
-    print("Please install them by running: pip install customtkinter Pillow qrcode")
-    sys.exit(1)
+    zstandard = None
+
+# The GUI libraries (customtkinter, Pillow, qrcode) are imported lazily by
+# nexus_gui.py, so the headless server starts without them.
 
 # ==============================================================================
 # CONFIGURATION & CONSTANTS
@@ -42,10 +65,80 @@ UPLOAD_DIR = "uploads"
 CONFIG_FILE = "nexus_config.json"
 LOG_FILE = "nexus_server.log"
 ICON_FILE = f"{APP_NAME}.png"
+CHUNK_SIZE = 64 * 1024  # Read/write buffer size for streamed request bodies
+MAX_PART_HEADER_SIZE = 16 * 1024  # Upper bound for the headers of a single multipart part
+DEFAULT_MAX_WORKERS = 16  # Connections served concurrently by the worker pool
+SERVER_ENGINES = ("threaded", "asyncio")  # Selectable server implementations
+KEEPALIVE_TIMEOUT = 75  # Seconds an idle keep-alive connection is held open by the asyncio engine
+THREADED_KEEPALIVE_TIMEOUT = 5  # Same for the threaded engine, where an idle connection occupies a worker
+MAX_KEEPALIVE_REQUESTS = 100  # Requests served on one connection before it is closed
+CLIENT_READ_TIMEOUT = 60  # Seconds a client may stall mid-request before its connection is dropped
+INTERNAL_DIR_NAME = ".nexus"  # Hidden directory inside UPLOAD_DIR for server-side state, never served
+DEFAULT_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # Chunk size for resumable uploads
+MIN_UPLOAD_CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_SESSION_EXPIRY = 24 * 3600  # Seconds before an abandoned resumable upload is discarded
+MAX_JSON_BODY_SIZE = 64 * 1024  # Upper bound for JSON request bodies of the API endpoints
+MAX_RANGES_PER_REQUEST = 32  # Range headers asking for more segments than this are ignored
+HOT_CACHE_MAX_MB = 64  # Memory for the contents of small, popular downloads (0 disables the cache)
+HOT_CACHE_MAX_FILE_KB = 1024  # Only files up to this size are kept in memory
+INDEX_RECONCILE_INTERVAL = 2.0  # Seconds between checks of UPLOAD_DIR for outside changes
+INDEX_FULL_RESCAN_EVERY = 30  # Reconcile passes between unconditional rescans
+COMPRESS_MIN_SIZE = 1024  # Smaller downloads are always sent as-is
+COMPRESS_LEVEL_GZIP = 6
+COMPRESS_LEVEL_ZSTD = 3
+COMPRESS_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Disk space for cached compressed variants of downloads
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml",
+                      "application/x-ndjson", "application/x-sh", "image/svg+xml", "+xml", "+json")
+ZIP_STORED_EXTENSIONS = frozenset((  # Already compressed: stored in ZIP archives as-is
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif", ".mp3", ".aac", ".ogg", ".opus", ".flac",
+    ".m4a", ".mp4", ".m4v", ".mkv", ".mov", ".webm", ".avi", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst",
+    ".7z", ".rar", ".apk", ".jar", ".docx", ".xlsx", ".pptx", ".odt", ".epub", ".pdf"))
+THUMB_WIDTHS = (64, 128, 256, 512, 1024)  # Widths thumbnails are rendered at; ?w= is rounded up to one of these
+THUMB_DEFAULT_WIDTH = 256  # Also the width pre-generated after an upload
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}  # Pillow format, Content-Type
+THUMB_PREGENERATE_FORMAT = "webp"
+THUMB_QUALITY = 80
+THUMB_CACHE_MAX_BYTES = 128 * 1024 * 1024  # Disk space for cached thumbnails
+THUMB_MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # Processes rendering thumbnails
+THUMB_SOURCE_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"))
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+METRICS_SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3, 4 * 1024 ** 3, 16 * 1024 ** 3)
+METRICS_LATENCY_WINDOW = 2000  # Recent requests used for the latency percentiles in the GUI
+DISK_WRITER_THREADS = 2  # Threads writing upload data to disk, off the request threads
+DISK_WRITER_QUEUE_DEPTH = 64  # Pieces a writer thread may have pending before request threads wait
+FSYNC_MODES = ("none", "file", "batch")  # See DiskWriter
+FSYNC_BATCH_INTERVAL = 1.0  # Seconds between group fsyncs in "batch" mode
+DEDUP_HASH_BLOCK = 1024 * 1024  # Read size when hashing a stored file
+PREFLIGHT_MAX_FILES = 256  # Files one upload preflight request may ask about
+SYNC_PARALLEL = 4  # Files pulled from a peer at the same time
+SYNC_INTERVAL = 30.0  # Seconds between passes of a continuous peer sync
+SYNC_RETRIES = 3  # Resume attempts for an interrupted transfer before it waits for the next pass
+SYNC_RETRY_DELAY = 1.0  # Seconds before the first resume attempt, doubled for each further one
+SYNC_BLOCK_SIZE = 1024 * 1024
+SEARCH_DEFAULT_LIMIT = 50  # Results returned by /api/search unless ?limit= asks for another count...
+SEARCH_MAX_LIMIT = 1000  # ...up to this many
+SEARCH_MAX_QUERY_LENGTH = 256
+SEARCH_COMPACT_MIN_DEAD = 4096  # Removed names left in the search postings before they are rebuilt
+LISTING_DEFAULT_LIMIT = 100  # Files per page of /api/files unless ?limit= asks for another count...
+LISTING_MAX_LIMIT = 1000  # ...up to this many
+DEFAULT_DISK_FREE_MARGIN_MB = 256  # Uploads are refused when they would leave less free space than this
+REFUSED_BODY_DISCARD_LIMIT = 64 * 1024 * 1024  # Refused uploads up to this size are read and dropped so the client sees the error...
+REFUSED_BODY_LINGER = 5.0  # ...for at most this many seconds; larger bodies just get the connection closed
+BANDWIDTH_BURST_SECONDS = 0.5  # Token bucket capacity, in seconds of traffic at the configured rate
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Rotate LOG_FILE once it grows past this size...
+LOG_ROTATE_DAILY = True  # ...or when the date changes
+LOG_BACKUP_COUNT = 7  # Rotated log files kept on disk
+LOG_BATCH_SIZE = 512  # Lines written per batch at most
+LOG_FLUSH_INTERVAL = 1.0  # Seconds a log line may wait before being flushed
+LOG_QUEUE_SIZE = 20000  # Pending lines before new ones are dropped
+LOG_SAMPLE_RATE = 10  # Above 80% queue fill only one line in this many is kept
 
-# Set appearance modes and color themes for CustomTkinter
-ctk.set_appearance_mode("System")  # Default: System
-ctk.set_default_color_theme("blue")  # Default: Blue
+# Common text formats the platform's mime tables may not know about
+mimetypes.add_type("text/plain", ".log")
+mimetypes.add_type("application/x-ndjson", ".ndjson")
+mimetypes.add_type("text/yaml", ".yaml")
+mimetypes.add_type("text/yaml", ".yml")
 
 # ==============================================================================
 # EMBEDDED HTML, CSS, AND JS FOR THE WEB INTERFACE
@@ -141,6 +234,56 @@ HTML_CONTENT = """
             color: white;
             font-size: 0.8em;
         }
+        .upload-options {
+            margin-top: 15px;
+            font-size: 0.9em;
+            color: #5f6368;
+        }
+        .upload-options select {
+            margin-left: 6px;
+        }
+        .upload-list {
+            list-style: none;
+            margin: 20px 0 0;
+            padding: 0;
+            text-align: left;
+            max-height: 300px;
+            overflow-y: auto;
+        }
+        .upload-item {
+            padding: 8px 0;
+            border-bottom: 1px solid #eee;
+            font-size: 0.85em;
+        }
+        .item-head {
+            display: flex;
+            justify-content: space-between;
+            gap: 10px;
+        }
+        .item-name {
+            overflow: hidden;
+            text-overflow: ellipsis;
+            white-space: nowrap;
+        }
+        .item-status {
+            color: #5f6368;
+            white-space: nowrap;
+        }
+        .item-bar {
+            height: 4px;
+            margin-top: 6px;
+            background-color: #e0e0e0;
+            border-radius: 2px;
+        }
+        .item-bar div {
+            width: 0%;
+            height: 100%;
+            background-color: var(--secondary-color);
+            border-radius: 2px;
+        }
+        .upload-item.done .item-bar div { background-color: var(--success-color); }
+        .upload-item.failed .item-bar div { background-color: var(--error-color); }
+        .upload-item.failed .item-status { color: var(--error-color); white-space: normal; }
         #response-message {
             margin-top: 20px;
             padding: 15px;
@@ -148,6 +291,81 @@ HTML_CONTENT = """
             font-weight: bold;
             display: none;
         }
+        .downloads {
+            margin-top: 25px;
+            font-size: 0.9em;
+        }
+        .downloads a {
+            color: var(--primary-color);
+            text-decoration: none;
+        }
+        .files {
+            margin-top: 25px;
+            text-align: left;
+        }
+        .files-head {
+            display: flex;
+            justify-content: space-between;
+            align-items: baseline;
+        }
+        .files-head h2 {
+            margin: 0 0 10px;
+            font-size: 1.1em;
+        }
+        .files-count {
+            color: #5f6368;
+            font-size: 0.85em;
+        }
+        .files-controls {
+            display: flex;
+            gap: 8px;
+            font-size: 0.9em;
+        }
+        .files-controls input {
+            flex: 1;
+            min-width: 0;
+        }
+        .file-list {
+            list-style: none;
+            margin: 10px 0 0;
+            padding: 0;
+            max-height: 360px;
+            overflow-y: auto;
+        }
+        .file-item {
+            display: flex;
+            align-items: center;
+            gap: 10px;
+            padding: 6px 0;
+            border-bottom: 1px solid #eee;
+            font-size: 0.85em;
+        }
+        .file-item img {
+            width: 32px;
+            height: 32px;
+            object-fit: cover;
+            border-radius: 4px;
+            flex: none;
+        }
+        .file-item a {
+            flex: 1;
+            overflow: hidden;
+            text-overflow: ellipsis;
+            white-space: nowrap;
+            color: var(--primary-color);
+            text-decoration: none;
+        }
+        .file-meta {
+            color: #5f6368;
+            white-space: nowrap;
+        }
+        .files-sentinel {
+            padding: 8px 0;
+            color: #5f6368;
+            font-size: 0.85em;
+            text-align: center;
+            cursor: pointer;
+        }
         .success { background-color: #e6f4ea; color: var(--success-color); border: 1px solid #c8e6c9; }
         .error { background-color: #fce8e6; color: var(--error-color); border: 1px solid #f9c2c2; }
     </style>
@@ -160,11 +378,36 @@ HTML_CONTENT = """
             <p>📁 Drag & Drop your files here or click to browse</p>
         </div>
         <input type="file" id="file-input" multiple>
+        <div class="upload-options">
+            <label for="concurrency">Parallel uploads</label>
+            <select id="concurrency">
+                <option>1</option><option>2</option><option>3</option><option>4</option><option>6</option>
+            </select>
+        </div>
         <div class="file-info" id="file-info"></div>
         <div class="progress-bar-container" id="progress-container">
             <div class="progress-bar" id="progress-bar">0%</div>
         </div>
+        <ul class="upload-list" id="upload-list"></ul>
         <div id="response-message"></div>
+        <p class="downloads"><a href="/api/zip">⬇ Download all files as ZIP</a></p>
+        <div class="files">
+            <div class="files-head">
+                <h2>Shared files</h2>
+                <span class="files-count" id="files-count"></span>
+            </div>
+            <div class="files-controls">
+                <select id="files-sort">
+                    <option value="mtime:desc">Newest first</option>
+                    <option value="name:asc">Name</option>
+                    <option value="size:desc">Largest first</option>
+                </select>
+                <input type="text" id="files-ext" placeholder="Only extensions, e.g. pdf, jpg">
+            </div>
+            <ul class="file-list" id="file-list">
+                <li class="files-sentinel" id="files-sentinel"></li>
+            </ul>
+        </div>
     </div>
 
     <script>
@@ -200,7 +443,7 @@ HTML_CONTENT = """
             if (files.length === 0) return;
 
             fileInfo.innerHTML = `<strong>Selected:</strong> ${files.length} file(s). Total size: ${formatFileSize(getTotalFileSize(files))}`;
-            uploadFiles(files);
+            enqueueFiles(files);
         }
 
         function getTotalFileSize(files) {
@@ -219,40 +462,530 @@ HTML_CONTENT = """
             return parseFloat((bytes / Math.pow(k, i)).toFixed(2)) + ' ' + sizes[i];
         }
 
-        function uploadFiles(files) {
-            const formData = new FormData();
+        const CHUNK_SIZE = 4 * 1024 * 1024;
+        const PARALLEL_CHUNKS = 4;
+        const MAX_RETRIES = 6;
+        const FILE_RETRIES = 3;
+        const DEFAULT_CONCURRENCY = 3;
+        const FATAL_STATUSES = [400, 413, 507];  // Refusals that retrying will not fix
+        const DEDUP_MIN_SIZE = 256 * 1024;  // Smaller files are cheaper to send than to hash and ask about
+        const HASH_SLICE_SIZE = 4 * 1024 * 1024;
+        const NATIVE_HASH_MAX_SIZE = 64 * 1024 * 1024;  // crypto.subtle (HTTPS pages only) is used up to this size
+
+        const uploadList = document.getElementById('upload-list');
+        const concurrencySelect = document.getElementById('concurrency');
+        const uploadQueue = [];
+        let batchTasks = [];  // Every file queued since the queue was last empty
+        let activeUploads = 0;
+        let chunkedApiAvailable = true;
+        let preflightAvailable = true;
+
+        try {
+            concurrencySelect.value = localStorage.getItem('nexus.concurrency') || DEFAULT_CONCURRENCY;
+        } catch (e) {
+            concurrencySelect.value = DEFAULT_CONCURRENCY;
+        }
+        concurrencySelect.addEventListener('change', () => {
+            try { localStorage.setItem('nexus.concurrency', concurrencySelect.value); } catch (e) {}
+            pumpQueue();
+        });
+
+        function sleep(ms) {
+            return new Promise((resolve) => setTimeout(resolve, ms));
+        }
+
+        function updateProgress(loaded, total) {
+            const percentComplete = total ? (loaded / total) * 100 : 100;
+            progressBarContainer.style.display = 'block';
+            progressBar.style.width = percentComplete + '%';
+            progressBar.textContent = Math.round(percentComplete) + '%';
+        }
+
+        async function apiRequest(method, url, body) {
+            const options = { method };
+            if (body) {
+                options.headers = { 'Content-Type': 'application/json' };
+                options.body = JSON.stringify(body);
+            }
+            const response = await fetch(url, options);
+            const data = await response.json().catch(() => ({}));
+            if (!response.ok) {
+                const error = new Error(data.message || `HTTP ${response.status}`);
+                error.status = response.status;
+                throw error;
+            }
+            return data;
+        }
+
+        // Every file is its own task in the upload queue. Up to the selected
+        // number run at once, smallest first, and a failed file is retried with
+        // backoff without holding up the others.
+        function enqueueFiles(files) {
+            if (!batchTasks.length) uploadList.innerHTML = '';
             for (const file of files) {
-                formData.append('files[]', file);
+                const task = { file, state: 'queued', message: 'Queued', loaded: 0, attempt: 0, readyAt: 0 };
+                task.row = createUploadRow(file);
+                renderTask(task);
+                uploadQueue.push(task);
+                batchTasks.push(task);
+            }
+            updateBatchProgress();
+            pumpQueue();
+        }
+
+        function pumpQueue() {
+            const limit = Number(concurrencySelect.value) || DEFAULT_CONCURRENCY;
+            const now = Date.now();
+            while (activeUploads < limit) {
+                // Smallest file first among those not waiting out a retry backoff
+                let next = -1;
+                for (let i = 0; i < uploadQueue.length; i++) {
+                    if (uploadQueue[i].readyAt > now) continue;
+                    if (next < 0 || uploadQueue[i].file.size < uploadQueue[next].file.size) next = i;
+                }
+                if (next < 0) return;
+                const task = uploadQueue.splice(next, 1)[0];
+                activeUploads++;
+                runUpload(task).finally(() => {
+                    activeUploads--;
+                    pumpQueue();
+                    finishBatchIfIdle();
+                });
             }
+        }
 
-            const xhr = new XMLHttpRequest();
+        async function runUpload(task) {
+            task.state = 'uploading';
+            task.rate = undefined;
+            task.sampleTime = 0;
+            renderTask(task);
+            const onProgress = (bytes) => {
+                task.loaded = bytes;
+                trackSpeed(task);
+                renderTask(task);
+                updateBatchProgress();
+            };
 
-            xhr.upload.addEventListener('progress', (event) => {
-                if (event.lengthComputable) {
-                    const percentComplete = (event.loaded / event.total) * 100;
-                    progressBarContainer.style.display = 'block';
-                    progressBar.style.width = percentComplete + '%';
-                    progressBar.textContent = Math.round(percentComplete) + '%';
+            try {
+                const { name, dedup } = await uploadOneFile(task, onProgress);
+                task.loaded = task.file.size;
+                task.state = 'done';
+                if (dedup) {
+                    task.message = name === task.file.name ? 'Already on the server' : `Already on the server, saved as ${name}`;
+                } else {
+                    task.message = name === task.file.name ? 'Uploaded' : `Uploaded as ${name}`;
                 }
-            });
+            } catch (error) {
+                task.attempt++;
+                if (FATAL_STATUSES.includes(error.status) || task.attempt > FILE_RETRIES) {
+                    task.state = 'failed';
+                    task.message = error.message;
+                } else {
+                    const delay = 1000 * 2 ** (task.attempt - 1);
+                    task.state = 'queued';
+                    task.message = `Retrying in ${delay / 1000} s: ${error.message}`;
+                    task.readyAt = Date.now() + delay;
+                    uploadQueue.push(task);
+                    setTimeout(pumpQueue, delay);
+                }
+            }
+            renderTask(task);
+            updateBatchProgress();
+        }
+
+        async function uploadOneFile(task, onProgress) {
+            const file = task.file;
+            if (preflightAvailable && file.size >= DEDUP_MIN_SIZE) {
+                // Files the server already stores are not sent again
+                if (!task.sha256) {
+                    task.state = 'hashing';
+                    task.sha256 = await hashFile(file, (bytes) => {
+                        task.message = `Checking ${Math.floor((bytes / file.size) * 100)}%`;
+                        renderTask(task);
+                    });
+                    task.state = 'uploading';
+                }
+                const match = await preflightFile(file, task.sha256);
+                if (match) return { name: match.filename, dedup: match.status };
+            }
+            if (chunkedApiAvailable && file.size >= CHUNK_SIZE) {
+                try {
+                    return { name: await uploadFileChunked(file, onProgress) };
+                } catch (error) {
+                    if (!error.unsupported) throw error;
+                    chunkedApiAvailable = false;  // Old server: everything goes through multipart POST
+                }
+            }
+            return { name: await uploadFileSingle(file, onProgress) };
+        }
+
+        async function preflightFile(file, sha256) {
+            try {
+                const data = await apiRequest('POST', '/api/uploads/preflight', { files: [{ name: file.name, size: file.size, sha256 }] });
+                const result = data.files[0];
+                return result.status === 'upload' ? null : result;
+            } catch (error) {
+                if (![404, 405, 501].includes(error.status)) throw error;
+                preflightAvailable = false;
+                return null;
+            }
+        }
+
+        async function hashFile(file, onProgress) {
+            if (window.crypto && crypto.subtle && file.size <= NATIVE_HASH_MAX_SIZE) {
+                // Native, but needs the whole file in memory
+                const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', await file.arrayBuffer()));
+                return Array.from(digest, (x) => x.toString(16).padStart(2, '0')).join('');
+            }
+            const hash = new Sha256();
+            for (let offset = 0; offset < file.size; offset += HASH_SLICE_SIZE) {
+                const slice = file.slice(offset, offset + HASH_SLICE_SIZE);
+                hash.update(new Uint8Array(await slice.arrayBuffer()));
+                onProgress(Math.min(offset + HASH_SLICE_SIZE, file.size));
+            }
+            return hash.hex();
+        }
+
+        // Incremental SHA-256. crypto.subtle is only offered to HTTPS pages and
+        // cannot hash a file piece by piece, so the page brings its own.
+        const SHA256_K = new Int32Array([
+            0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+            0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+            0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+            0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+            0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+            0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+            0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+            0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+        ]);
+
+        class Sha256 {
+            constructor() {
+                this.state = new Int32Array([0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19]);
+                this.w = new Int32Array(64);  // Signed arrays keep the arithmetic in 32-bit integers
+                this.buffer = new Uint8Array(64);
+                this.buffered = 0;
+                this.length = 0;
+            }
+
+            update(bytes) {
+                let i = 0;
+                this.length += bytes.length;
+                if (this.buffered) {
+                    i = Math.min(64 - this.buffered, bytes.length);
+                    this.buffer.set(bytes.subarray(0, i), this.buffered);
+                    this.buffered += i;
+                    if (this.buffered < 64) return;
+                    this.block(this.buffer, 0);
+                    this.buffered = 0;
+                }
+                for (; i + 64 <= bytes.length; i += 64) this.block(bytes, i);
+                this.buffer.set(bytes.subarray(i));
+                this.buffered = bytes.length - i;
+            }
+
+            block(bytes, offset) {
+                const w = this.w;
+                for (let j = 0; j < 16; j++) {
+                    const p = offset + j * 4;
+                    w[j] = (bytes[p] << 24) | (bytes[p + 1] << 16) | (bytes[p + 2] << 8) | bytes[p + 3];
+                }
+                for (let j = 16; j < 64; j++) {
+                    const x = w[j - 15], y = w[j - 2];
+                    const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+                    const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+                    w[j] = (w[j - 16] + s0 + w[j - 7] + s1) | 0;
+                }
+                const s = this.state;
+                let a = s[0], b = s[1], c = s[2], d = s[3], e = s[4], f = s[5], g = s[6], h = s[7];
+                for (let j = 0; j < 64; j++) {
+                    const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+                    const t1 = (h + S1 + ((e & f) ^ (~e & g)) + SHA256_K[j] + w[j]) | 0;
+                    const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+                    const t2 = (S0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+                    h = g; g = f; f = e; e = (d + t1) | 0;
+                    d = c; c = b; b = a; a = (t1 + t2) | 0;
+                }
+                s[0] = (s[0] + a) | 0; s[1] = (s[1] + b) | 0; s[2] = (s[2] + c) | 0; s[3] = (s[3] + d) | 0;
+                s[4] = (s[4] + e) | 0; s[5] = (s[5] + f) | 0; s[6] = (s[6] + g) | 0; s[7] = (s[7] + h) | 0;
+            }
 
-            xhr.addEventListener('load', () => {
-                progressBarContainer.style.display = 'none';
-                const response = JSON.parse(xhr.responseText);
-                showMessage(response.message, response.status);
-                if (response.status === 'success') {
-                    fileInput.value = ''; // Clear input
-                    fileInfo.innerHTML = '';
+            hex() {
+                const tail = new Uint8Array(this.buffered < 56 ? 64 : 128);
+                tail.set(this.buffer.subarray(0, this.buffered));
+                tail[this.buffered] = 0x80;
+                const bits = this.length * 8;
+                const view = new DataView(tail.buffer);
+                view.setUint32(tail.length - 8, Math.floor(bits / 0x100000000));
+                view.setUint32(tail.length - 4, bits >>> 0);
+                for (let i = 0; i < tail.length; i += 64) this.block(tail, i);
+                return Array.from(this.state, (x) => (x >>> 0).toString(16).padStart(8, '0')).join('');
+            }
+        }
+
+        function finishBatchIfIdle() {
+            if (activeUploads || uploadQueue.length || !batchTasks.length) return;
+            const failed = batchTasks.filter((task) => task.state === 'failed').length;
+            const uploaded = batchTasks.length - failed;
+            progressBarContainer.style.display = 'none';
+            if (failed) {
+                showMessage(`Uploaded ${uploaded} file(s), ${failed} failed.`, 'error');
+            } else {
+                showMessage(`Successfully uploaded ${uploaded} file(s).`, 'success');
+            }
+            batchTasks = [];
+            fileInput.value = ''; // Clear input
+            fileInfo.innerHTML = '';
+            resetFileList();
+        }
+
+        function updateBatchProgress() {
+            let loaded = 0;
+            let total = 0;
+            for (const task of batchTasks) {
+                loaded += task.state === 'failed' ? task.file.size : task.loaded;
+                total += task.file.size;
+            }
+            updateProgress(loaded, total);
+        }
+
+        function trackSpeed(task) {
+            const now = performance.now();
+            if (!task.sampleTime) {
+                task.sampleTime = now;
+                task.sampleBytes = task.loaded;
+                return;
+            }
+            const elapsed = now - task.sampleTime;
+            if (elapsed < 500) return;
+            const rate = Math.max(0, task.loaded - task.sampleBytes) * 1000 / elapsed;
+            task.rate = task.rate === undefined ? rate : 0.7 * task.rate + 0.3 * rate;
+            task.sampleTime = now;
+            task.sampleBytes = task.loaded;
+        }
+
+        function createUploadRow(file) {
+            const row = document.createElement('li');
+            row.innerHTML = '<div class="item-head"><span class="item-name"></span><span class="item-status"></span></div>'
+                + '<div class="item-bar"><div></div></div>';
+            row.querySelector('.item-name').textContent = file.name;
+            uploadList.appendChild(row);
+            return row;
+        }
+
+        function renderTask(task) {
+            const size = task.file.size;
+            const percent = size ? (task.loaded / size) * 100 : (task.state === 'done' ? 100 : 0);
+            let status = task.message;
+            if (task.state === 'uploading') {
+                status = `${Math.floor(percent)}% of ${formatFileSize(size)}`;
+                if (task.rate >= 1) status += ` · ${formatFileSize(task.rate)}/s`;
+            }
+            task.row.className = `upload-item ${task.state}`;
+            task.row.querySelector('.item-bar div').style.width = percent + '%';
+            task.row.querySelector('.item-status').textContent = status;
+        }
+
+        async function uploadFileChunked(file, onProgress) {
+            // The key lets the server hand back an unfinished session for the same file
+            const key = `${file.name}:${file.size}:${file.lastModified}`;
+            let session;
+            try {
+                session = await apiRequest('POST', '/api/uploads', { name: file.name, size: file.size, chunk_size: CHUNK_SIZE, key });
+            } catch (error) {
+                error.unsupported = [404, 405, 501].includes(error.status);
+                throw error;
+            }
+
+            let received = new Set(session.received);
+            const inFlight = new Map();
+            const chunkLength = (index) => Math.min(session.chunk_size, session.size - index * session.chunk_size);
+            const report = () => {
+                let bytes = 0;
+                for (const index of received) bytes += chunkLength(index);
+                for (const loaded of inFlight.values()) bytes += loaded;
+                onProgress(bytes);
+            };
+            report();
+
+            let attempt = 0;
+            while (received.size < session.total_chunks) {
+                const pending = [];
+                for (let index = 0; index < session.total_chunks; index++) {
+                    if (!received.has(index)) pending.push(index);
                 }
+                const before = received.size;
+                let failure = null;
+                const worker = async () => {
+                    while (pending.length && !failure) {
+                        const index = pending.shift();
+                        try {
+                            await putChunk(session, file, index, (loaded) => { inFlight.set(index, loaded); report(); });
+                            received.add(index);
+                        } catch (error) {
+                            failure = error;
+                        } finally {
+                            inFlight.delete(index);
+                            report();
+                        }
+                    }
+                };
+                await Promise.all(Array.from({ length: Math.min(PARALLEL_CHUNKS, pending.length) }, worker));
+                if (!failure) continue;
+
+                // Size and disk-space refusals will not go away by retrying
+                if (FATAL_STATUSES.includes(failure.status)) throw failure;
+                attempt = received.size > before ? 1 : attempt + 1;
+                if (attempt > MAX_RETRIES) throw failure;
+                await sleep(500 * 2 ** attempt);
+                try {
+                    // Resume from whatever the server actually stored
+                    const status = await apiRequest('GET', `/api/uploads/${session.upload_id}`);
+                    received = new Set(status.received);
+                    report();
+                } catch (error) {
+                    if (error.status === 404) throw error;
+                }
+            }
+
+            const result = await apiRequest('POST', `/api/uploads/${session.upload_id}/complete`);
+            return result.files[0];
+        }
+
+        function putChunk(session, file, index, onProgress) {
+            return new Promise((resolve, reject) => {
+                const start = index * session.chunk_size;
+                const xhr = new XMLHttpRequest();
+                xhr.upload.addEventListener('progress', (event) => onProgress(event.loaded));
+                xhr.addEventListener('load', () => {
+                    if (xhr.status === 200) return resolve();
+                    let message = `Chunk ${index} was rejected (HTTP ${xhr.status})`;
+                    try { message = JSON.parse(xhr.responseText).message || message; } catch (e) {}
+                    const error = new Error(message);
+                    error.status = xhr.status;
+                    reject(error);
+                });
+                xhr.addEventListener('error', () => reject(new Error(`Network error on chunk ${index}`)));
+                xhr.open('PUT', `/api/uploads/${session.upload_id}/${index}`);
+                xhr.send(file.slice(start, start + session.chunk_size));
             });
+        }
+
+        // Small files, and every file on servers without the chunked API, go
+        // up as a multipart POST of their own
+        function uploadFileSingle(file, onProgress) {
+            return new Promise((resolve, reject) => {
+                const formData = new FormData();
+                formData.append('files[]', file);
 
-            xhr.addEventListener('error', () => {
-                progressBarContainer.style.display = 'none';
-                showMessage('An unknown error occurred during upload.', 'error');
+                const xhr = new XMLHttpRequest();
+                xhr.upload.addEventListener('progress', (event) => {
+                    if (event.lengthComputable) onProgress(file.size * event.loaded / event.total);
+                });
+                xhr.addEventListener('load', () => {
+                    let response = {};
+                    try { response = JSON.parse(xhr.responseText); } catch (e) {}
+                    const result = (response.results || [])[0];
+                    if (xhr.status === 200 && result && result.status === 'success') return resolve(result.filename);
+                    const error = new Error((result && result.message) || response.message || `HTTP ${xhr.status}`);
+                    error.status = (result && result.code) || xhr.status;
+                    reject(error);
+                });
+                xhr.addEventListener('error', () => reject(new Error('Network error during upload')));
+                xhr.open('POST', '/');
+                xhr.send(formData);
             });
+        }
+
+        // The shared file list is fetched from /api/files one page at a time,
+        // whenever the end of the list scrolls into view.
+        const FILES_PAGE_SIZE = 100;
+        const THUMB_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff'];
+        const fileList = document.getElementById('file-list');
+        const filesSentinel = document.getElementById('files-sentinel');
+        const filesCount = document.getElementById('files-count');
+        const filesSort = document.getElementById('files-sort');
+        const filesExt = document.getElementById('files-ext');
+        let listing = { cursor: null, done: false, loading: false, token: 0 };
+        let sentinelVisible = false;
+        let extFilterTimer = null;
+
+        function resetFileList() {
+            listing = { cursor: null, done: false, loading: false, token: listing.token + 1 };
+            fileList.replaceChildren(filesSentinel);
+            loadFilesPage();
+        }
+
+        async function loadFilesPage() {
+            if (listing.loading || listing.done) return;
+            const current = listing;
+            current.loading = true;
+            filesSentinel.textContent = 'Loading…';
+            const [sort, order] = filesSort.value.split(':');
+            const params = new URLSearchParams({ sort, order, limit: FILES_PAGE_SIZE });
+            if (filesExt.value.trim()) params.set('ext', filesExt.value);
+            if (current.cursor) params.set('cursor', current.cursor);
+            let data;
+            try {
+                data = await apiRequest('GET', '/api/files?' + params);
+            } catch (e) {
+                if (current === listing) {
+                    current.loading = false;
+                    filesSentinel.textContent = 'Could not load the file list. Click to retry.';
+                }
+                return;
+            }
+            if (current !== listing) return;  // Sort or filter changed meanwhile
+            for (const file of data.files) {
+                fileList.insertBefore(createFileRow(file), filesSentinel);
+            }
+            current.cursor = data.next_cursor;
+            current.done = !data.next_cursor;
+            current.loading = false;
+            filesCount.textContent = `${data.total} file(s)`;
+            filesSentinel.textContent = current.done
+                ? (data.total ? '' : 'No files shared yet.')
+                : 'Load more';
+            if (!current.done && sentinelVisible) loadFilesPage();
+        }
+
+        function createFileRow(file) {
+            const row = document.createElement('li');
+            row.className = 'file-item';
+            const url = '/' + encodeURIComponent(file.name);
+            const ext = file.name.includes('.') ? file.name.split('.').pop().toLowerCase() : '';
+            if (THUMB_EXTENSIONS.includes(ext)) {
+                const thumb = document.createElement('img');
+                thumb.loading = 'lazy';
+                thumb.alt = '';
+                thumb.src = '/thumb/' + encodeURIComponent(file.name) + '?w=64';
+                thumb.onerror = () => thumb.remove();
+                row.appendChild(thumb);
+            }
+            const link = document.createElement('a');
+            link.href = url;
+            link.textContent = file.name;
+            link.title = file.name;
+            const meta = document.createElement('span');
+            meta.className = 'file-meta';
+            meta.textContent = `${formatFileSize(file.size)} · ${new Date(file.mtime * 1000).toLocaleDateString()}`;
+            row.append(link, meta);
+            return row;
+        }
 
-            xhr.open('POST', '/');
-            xhr.send(formData);
+        filesSort.addEventListener('change', resetFileList);
+        filesExt.addEventListener('input', () => {
+            clearTimeout(extFilterTimer);
+            extFilterTimer = setTimeout(resetFileList, 300);
+        });
+        filesSentinel.addEventListener('click', loadFilesPage);
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver((entries) => {
+                sentinelVisible = entries[entries.length - 1].isIntersecting;
+                if (sentinelVisible) loadFilesPage();
+            }, { root: fileList }).observe(filesSentinel);
+        } else {
+            loadFilesPage();
         }
 
         function showMessage(message, type) {
@@ -269,574 +1002,4364 @@ HTML_CONTENT = """
 """
 
 # ==============================================================================
-# CUSTOM HTTP REQUEST HANDLER
+# PRE-ENCODED UPLOAD PAGE
 # ==============================================================================
-class NexusShareHandler(SimpleHTTPRequestHandler):
+def parse_accept_encoding(value):
+    """Parse an Accept-Encoding header into a {coding: qvalue} dict."""
+    codings = {}
+    for item in (value or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, val = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class StaticAsset:
     """
-    Custom HTTP request handler to serve the upload page and process file uploads.
+    A fixed response body encoded once at startup: the raw bytes plus gzip and,
+    when the optional brotli package is installed, brotli variants. Each
+    variant carries its own strong ETag, so serving a page view costs a dict
+    lookup and a socket write.
     """
-    def __init__(self, *args, **kwargs):
-        # Ensure the upload directory exists
-        if not os.path.exists(UPLOAD_DIR):
-            os.makedirs(UPLOAD_DIR)
-        super().__init__(*args, directory=UPLOAD_DIR, **kwargs)
+    def __init__(self, body, content_type, cache_control="no-cache"):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {"identity": body}
+        self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        try:
+            import brotli  # Optional: pip install brotli
+            self.variants["br"] = brotli.compress(body, quality=11)
+        except ImportError:
+            pass
+        # Drop encodings that do not actually save anything
+        self.variants = {coding: data for coding, data in self.variants.items()
+                         if coding == "identity" or len(data) < len(body)}
+        self.etags = {coding: f'"{digest}-{coding}"' for coding in self.variants}
 
-    def do_GET(self):
-        """Handle GET requests."""
-        parsed_path = urlparse(self.path)
-        if parsed_path.path == '/':
-            self.send_response(200)
-            self.send_header("Content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(HTML_CONTENT.encode('utf-8'))
-            self.log_message("Served upload page.")
-        else:
-            # Serve files from the uploads directory
-            super().do_GET()
+    def select_encoding(self, accept_encoding):
+        """Pick the smallest variant the client accepts."""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0)
+        candidates = [coding for coding in self.variants
+                      if coding != "identity" and accepted.get(coding, wildcard) > 0]
+        if not candidates:
+            return "identity"
+        return min(candidates, key=lambda coding: len(self.variants[coding]))
 
-    def do_POST(self):
-        """Handle POST requests for file uploads."""
-        content_type = self.headers.get('Content-Type', '')
-        if not content_type.startswith('multipart/form-data'):
-            self.send_error(400, "Bad Request: Content-Type must be multipart/form-data")
-            return
+    def plan_response(self, get_header):
+        """Returns (status, headers, body) for a GET of this asset."""
+        coding = self.select_encoding(get_header('Accept-Encoding'))
+        headers = {"ETag": self.etags[coding], "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = get_header('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            if '*' in tags or self.etags[coding] in tags:
+                return HTTPStatus.NOT_MODIFIED, headers, b''
+        body = self.variants[coding]
+        headers["Content-Type"] = self.content_type
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        headers["Content-Length"] = str(len(body))
+        return HTTPStatus.OK, headers, body
+
+
+UPLOAD_PAGE = StaticAsset(HTML_CONTENT.encode('utf-8'), "text/html; charset=utf-8")
+
+# ==============================================================================
+# BACKGROUND LOG WRITER
+# ==============================================================================
+class LogWriter:
+    """
+    Appends log lines to a file from a background thread.
+
+    Request threads only enqueue; the writer drains the queue in batches and
+    flushes on LOG_BATCH_SIZE lines or LOG_FLUSH_INTERVAL seconds, keeping
+    the file open between batches. The file is rotated by size or by day.
+    When the queue backs up, lines are sampled and then dropped rather than
+    blocking the caller, and the number of lost lines is logged.
+    """
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, rotate_daily=LOG_ROTATE_DAILY,
+                 backup_count=LOG_BACKUP_COUNT, queue_size=LOG_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.backup_count = backup_count
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.high_water = int(queue_size * 0.8)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.file = None
+        self.opened_on = None
+        self.sampled = 0
+        self.dropped = 0
 
+    def write(self, message):
+        """Queue a line for writing. Never blocks."""
+        if self.thread is None:
+            self.start()
+        if self.queue.qsize() >= self.high_water:
+            self.sampled += 1
+            if self.sampled % LOG_SAMPLE_RATE:
+                self.dropped += 1
+                return
         try:
-            # Parse multipart form data
-            form_data = self.parse_multipart()
-            files = form_data.get('files[]', [])
-            
-            if not files:
-                self.send_json_response({"status": "error", "message": "No files received."})
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="nexus-log-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout=2):
+        """Flush everything still queued and stop the writer thread."""
+        if self.thread and self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
                 return
+            self.thread.join(timeout)
 
-            uploaded_files = []
-            for file_data in files:
-                filename = file_data['filename']
-                file_content = file_data['content']
-                
-                # Sanitize filename to prevent path traversal
-                safe_filename = os.path.basename(filename)
-                if not safe_filename:
-                    continue
-                
-                save_path = os.path.join(UPLOAD_DIR, safe_filename)
-                
-                # Handle duplicate filenames
-                counter = 1
-                base_name, ext = os.path.splitext(safe_filename)
-                while os.path.exists(save_path):
-                    safe_filename = f"{base_name}_{counter}{ext}"
-                    save_path = os.path.join(UPLOAD_DIR, safe_filename)
-                    counter += 1
-
-                with open(save_path, 'wb') as f:
-                    f.write(file_content)
-                
-                uploaded_files.append(safe_filename)
-                self.log_message(f"File uploaded: {safe_filename}")
-
-            message = f"Successfully uploaded {len(uploaded_files)} file(s)."
-            self.send_json_response({"status": "success", "message": message, "files": uploaded_files})
+    def run(self):
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
 
-        except Exception as e:
-            self.log_message(f"Error during upload: {e}")
-            self.send_json_response({"status": "error", "message": f"Server error: {e}"})
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                batch.append(f"[{time.strftime('%d/%b/%Y %H:%M:%S')}] Log writer overloaded: {dropped} message(s) dropped\n")
+            if batch:
+                try:
+                    self.write_batch("".join(batch))
+                except OSError as e:
+                    print(f"Could not write log file: {e}", file=sys.stderr)
+        if self.file:
+            self.file.close()
+            self.file = None
 
-    def parse_multipart(self):
-        """Manually parse multipart/form-data."""
-        content_length = int(self.headers.get('Content-Length'))
-        data = self.rfile.read(content_length)
-        
-        boundary = self.headers.get('Content-Type').split('boundary=')[1].encode()
-        parts = data.split(b'--' + boundary)
-        
-        form_data = {}
-        for part in parts:
-            if b'Content-Disposition' in part:
-                headers_end = part.find(b'\r\n\r\n')
-                headers = part[:headers_end].decode('utf-8')
-                content = part[headers_end + 4:].rstrip(b'\r\n')
-                
-                filename = None
-                if 'filename=' in headers:
-                    filename = headers.split('filename="')[1].split('"')[0]
-                
-                if filename:
-                    if 'files[]' not in form_data:
-                        form_data['files[]'] = []
-                    form_data['files[]'].append({'filename': filename, 'content': content})
-        return form_data
-
-    def send_json_response(self, data):
-        """Send a JSON response."""
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+    def write_batch(self, text):
+        data = text.encode("utf-8")
+        if self.file is None:
+            self.open_file()
+        today = datetime.now().date()
+        if (self.rotate_daily and self.opened_on != today) or \
+                (self.max_bytes and self.file.tell() and self.file.tell() + len(data) > self.max_bytes):
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+
+    def open_file(self):
+        self.file = open(self.path, "ab")
+        try:
+            started = datetime.fromtimestamp(os.path.getmtime(self.path)).date() if self.file.tell() else datetime.now().date()
+        except OSError:
+            started = datetime.now().date()
+        self.opened_on = started
+
+    def rotate(self):
+        """Rename the current file with a timestamp suffix and prune old backups."""
+        self.file.close()
+        if os.path.getsize(self.path):
+            suffix = datetime.now().strftime("%Y-%m-%d_%H%M%S_%f")
+            os.replace(self.path, f"{self.path}.{suffix}")
+            backups = sorted(glob.glob(glob.escape(self.path) + ".*"))
+            for old_backup in backups[:-self.backup_count] if self.backup_count else backups:
+                try:
+                    os.remove(old_backup)
+                except OSError:
+                    pass
+        self.file = open(self.path, "ab")
+        self.opened_on = datetime.now().date()
 
-    def log_message(self, format, *args):
-        """Override log_message to send logs to the GUI."""
-        message = f"[{self.log_date_time_string()}] {format % args}\n"
-        if hasattr(self.server, 'nexus_app') and self.server.nexus_app:
-            self.server.nexus_app.log_to_gui(message)
-        # Also log to a file
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(message)
+
+log_writer = LogWriter()
 
 # ==============================================================================
-# MAIN APPLICATION CLASS (GUI)
+# SERVER METRICS
 # ==============================================================================
-class NexusShareApp(ctk.CTk):
+REQUEST_PHASES = ("parse", "disk_write", "response")
+
+
+class Histogram:
+    """Prometheus-style histogram. Not locked itself; ServerMetrics guards it."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class RequestTimer:
+    """
+    Phase timestamps of one request. 'parse' runs from the request line to the
+    first response byte minus the time spent writing uploads to disk, which is
+    added up separately in disk_write; 'response' is the rest.
+    """
+    __slots__ = ("start", "response_start", "status", "disk_write")
+
     def __init__(self):
-        super().__init__()
-
-        # Server variables
-        self.server = None
-        self.server_thread = None
-        self.is_running = False
-
-        # Load configuration
-        self.config = self.load_config()
-
-        # --- Window Setup ---
-        self.title(f"{APP_NAME} v{APP_VERSION}")
-        self.geometry("1100x700")
-        self.minsize(900, 600)
-        
-        # Set icon if it exists
-        if os.path.exists(ICON_FILE):
-            try:
-                self.iconphoto(True, ImageTk.PhotoImage(Image.open(ICON_FILE)))
-            except Exception as e:
-                print(f"Could not load icon: {e}")
-
-        # --- Configure Grid Layout ---
-        self.grid_columnconfigure(1, weight=1)
-        self.grid_rowconfigure(0, weight=1)
-
-        # --- Create Sidebar ---
-        self.create_sidebar()
-
-        # --- Create Main Content Area with Tabs ---
-        self.create_main_content()
-
-        # --- Initial Setup ---
-        self.update_ip_address()
-        self.refresh_file_manager()
-        self.update_statistics()
-        self.log_message("NexusShare initialized. Ready to start.")
-        self.log_message(f"Developer: {DEVELOPER} from {LOCATION}")
-
-    def create_sidebar(self):
-        """Creates the left sidebar with controls."""
-        self.sidebar_frame = ctk.CTkFrame(self, width=280, corner_radius=0)
-        self.sidebar_frame.grid(row=0, column=0, sticky="nsew")
-        self.sidebar_frame.grid_rowconfigure(10, weight=1) # Make the log area expand
-
-        # --- Title ---
-        self.logo_label = ctk.CTkLabel(self.sidebar_frame, text=APP_NAME, font=ctk.CTkFont(size=24, weight="bold"))
-        self.logo_label.grid(row=0, column=0, padx=20, pady=(20, 10))
-
-        self.version_label = ctk.CTkLabel(self.sidebar_frame, text=f"v{APP_VERSION}", font=ctk.CTkFont(size=12))
-        self.version_label.grid(row=1, column=0, padx=20, pady=(0, 20))
-
-        # --- Server Controls ---
-        self.start_button = ctk.CTkButton(self.sidebar_frame, text="▶ Start Server", command=self.start_server, height=40, font=ctk.CTkFont(size=14, weight="bold"))
-        self.start_button.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
-
-        self.stop_button = ctk.CTkButton(self.sidebar_frame, text="⏸ Stop Server", command=self.stop_server, height=40, font=ctk.CTkFont(size=14, weight="bold"), state="disabled")
-        self.stop_button.grid(row=3, column=0, padx=20, pady=10, sticky="ew")
-
-        self.restart_button = ctk.CTkButton(self.sidebar_frame, text="↻ Restart", command=self.restart_server, height=40, font=ctk.CTkFont(size=14, weight="bold"), state="disabled")
-        self.restart_button.grid(row=4, column=0, padx=20, pady=10, sticky="ew")
-        
-        # --- Configuration ---
-        self.separator = ctk.CTkSeparator(self.sidebar_frame)
-        self.separator.grid(row=5, column=0, padx=20, pady=20, sticky="ew")
-
-        self.host_label = ctk.CTkLabel(self.sidebar_frame, text="Host/IP Address:", anchor="w")
-        self.host_label.grid(row=6, column=0, padx=20, pady=(10, 0))
-        self.host_entry = ctk.CTkEntry(self.sidebar_frame, placeholder_text="0.0.0.0")
-        self.host_entry.grid(row=7, column=0, padx=20, pady=(0, 10), sticky="ew")
-        self.host_entry.insert(0, self.config.get("host", "0.0.0.0"))
-
-        self.port_label = ctk.CTkLabel(self.sidebar_frame, text="Port:", anchor="w")
-        self.port_label.grid(row=8, column=0, padx=20, pady=(10, 0))
-        self.port_entry = ctk.CTkEntry(self.sidebar_frame, placeholder_text="8080")
-        self.port_entry.grid(row=9, column=0, padx=20, pady=(0, 10), sticky="ew")
-        self.port_entry.insert(0, str(self.config.get("port", 8080)))
-
-        # --- Server Status ---
-        self.status_frame = ctk.CTkFrame(self.sidebar_frame)
-        self.status_frame.grid(row=10, column=0, padx=20, pady=10, sticky="nsew")
-        self.status_frame.grid_columnconfigure(0, weight=1)
-        self.status_frame.grid_rowconfigure(2, weight=1)
-
-        ctk.CTkLabel(self.status_frame, text="Server Status", font=ctk.CTkFont(size=14, weight="bold")).grid(row=0, column=0, padx=10, pady=(10,5))
-        self.status_label = ctk.CTkLabel(self.status_frame, text="● Stopped", font=ctk.CTkFont(size=12), text_color="#d93025")
-        self.status_label.grid(row=1, column=0, padx=10, pady=5)
-        
-        self.url_label = ctk.CTkTextbox(self.status_frame, height=60, font=ctk.CTkFont(size=11))
-        self.url_label.grid(row=2, column=0, padx=10, pady=(5, 10), sticky="nsew")
-        self.url_label.insert("0.0", "URL will appear here...")
-        self.url_label.configure(state="disabled")
-
-    def create_main_content(self):
-        """Creates the main content area with tabs."""
-        self.main_tabview = ctk.CTkTabview(self)
-        self.main_tabview.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
-
-        # --- File Manager Tab ---
-        self.file_manager_tab = self.main_tabview.add("📁 File Manager")
-        self.file_manager_tab.grid_columnconfigure(0, weight=1)
-        self.file_manager_tab.grid_rowconfigure(1, weight=1)
-        
-        fm_controls_frame = ctk.CTkFrame(self.file_manager_tab)
-        fm_controls_frame.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
-        fm_controls_frame.grid_columnconfigure(1, weight=1)
-
-        ctk.CTkButton(fm_controls_frame, text="🔄 Refresh", command=self.refresh_file_manager).grid(row=0, column=0, padx=5, pady=5)
-        self.search_entry = ctk.CTkEntry(fm_controls_frame, placeholder_text="Search files...")
-        self.search_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-        self.search_entry.bind("<KeyRelease>", self.filter_files)
-        ctk.CTkButton(fm_controls_frame, text="🗑️ Delete Selected", command=self.delete_selected_file).grid(row=0, column=2, padx=5, pady=5)
-        ctk.CTkButton(fm_controls_frame, text="📂 Open Folder", command=self.open_upload_folder).grid(row=0, column=3, padx=5, pady=5)
-
-        self.file_listbox = ctk.CTkTextbox(self.file_manager_tab, font=ctk.CTkFont(family="Consolas", size=12))
-        self.file_listbox.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
-        
-        # --- Server Log Tab ---
-        self.log_tab = self.main_tabview.add("📜 Server Log")
-        self.log_tab.grid_columnconfigure(0, weight=1)
-        self.log_tab.grid_rowconfigure(0, weight=1)
-        
-        self.log_textbox = ctk.CTkTextbox(self.log_tab, font=ctk.CTkFont(family="Consolas", size=11))
-        self.log_textbox.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
-        
-        # --- Statistics Tab ---
-        self.stats_tab = self.main_tabview.add("📊 Statistics")
-        self.stats_tab.grid_columnconfigure(0, weight=1)
-        
-        stats_frame = ctk.CTkFrame(self.stats_tab)
-        stats_frame.grid(row=0, column=0, padx=20, pady=20, sticky="ew")
-        stats_frame.grid_columnconfigure(1, weight=1)
-
-        self.stats_labels = {}
-        stats_info = [
-            ("Total Files:", "total_files"),
-            ("Total Size:", "total_size"),
-            ("Largest File:", "largest_file"),
-            ("File Types:", "file_types")
-        ]
-        for i, (label_text, key) in enumerate(stats_info):
-            ctk.CTkLabel(stats_frame, text=label_text, font=ctk.CTkFont(size=14, weight="bold")).grid(row=i, column=0, padx=10, pady=10, sticky="w")
-            self.stats_labels[key] = ctk.CTkLabel(stats_frame, text="Calculating...", font=ctk.CTkFont(size=14))
-            self.stats_labels[key].grid(row=i, column=1, padx=10, pady=10, sticky="w")
-
-        # --- Settings Tab ---
-        self.settings_tab = self.main_tabview.add("⚙️ Settings")
-        self.settings_tab.grid_columnconfigure(0, weight=1)
-        
-        settings_frame = ctk.CTkFrame(self.settings_tab)
-        settings_frame.grid(row=0, column=0, padx=20, pady=20, sticky="ew")
-        settings_frame.grid_columnconfigure(0, weight=1)
-        
-        ctk.CTkLabel(settings_frame, text="Appearance", font=ctk.CTkFont(size=18, weight="bold")).grid(row=0, column=0, padx=10, pady=(10, 20))
-        
-        self.appearance_mode_label = ctk.CTkLabel(settings_frame, text="Theme Mode:", anchor="w")
-        self.appearance_mode_label.grid(row=1, column=0, padx=10, pady=0)
-        self.appearance_mode_optionemenu = ctk.CTkOptionMenu(settings_frame, values=["Light", "Dark", "System"], command=self.change_appearance_mode_event)
-        self.appearance_mode_optionemenu.grid(row=2, column=0, padx=10, pady=(0, 20), sticky="ew")
-        
-        ctk.CTkButton(settings_frame, text="Clear All Uploads", command=self.clear_uploads, fg_color="red", hover_color="#aa0000").grid(row=3, column=0, padx=10, pady=20, sticky="ew")
-
-        # --- QR Code Tab ---
-        self.qr_tab = self.main_tabview.add("📱 QR Code")
-        self.qr_tab.grid_columnconfigure(0, weight=1)
-        self.qr_tab.grid_rowconfigure(0, weight=1)
-        
-        self.qr_frame = ctk.CTkFrame(self.qr_tab)
-        self.qr_frame.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
-        self.qr_frame.grid_columnconfigure(0, weight=1)
-        self.qr_frame.grid_rowconfigure(1, weight=1)
-
-        ctk.CTkLabel(self.qr_frame, text="Scan to connect from mobile", font=ctk.CTkFont(size=16, weight="bold")).grid(row=0, column=0, pady=10)
-        self.qr_image_label = ctk.CTkLabel(self.qr_frame, text="QR Code will appear here when server starts.")
-        self.qr_image_label.grid(row=1, column=0, pady=10)
-
-        # --- About Tab ---
-        self.about_tab = self.main_tabview.add("ℹ️ About")
-        self.about_tab.grid_columnconfigure(0, weight=1)
-        
-        about_frame = ctk.CTkFrame(self.about_tab)
-        about_frame.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
-        about_frame.grid_columnconfigure(0, weight=1)
-
-        ctk.CTkLabel(about_frame, text=APP_NAME, font=ctk.CTkFont(size=28, weight="bold")).grid(row=0, column=0, pady=(20, 5))
-        ctk.CTkLabel(about_frame, text=f"Version {APP_VERSION}", font=ctk.CTkFont(size=14)).grid(row=1, column=0, pady=5)
-        ctk.CTkLabel(about_frame, text="A modern, powerful, and professional file sharing solution.", font=ctk.CTkFont(size=12), justify="center").grid(row=2, column=0, padx=20, pady=5)
-        
-        separator = ctk.CTkSeparator(about_frame)
-        separator.grid(row=3, column=0, padx=40, pady=20, sticky="ew")
-
-        ctk.CTkLabel(about_frame, text=f"Developed with ❤️ by", font=ctk.CTkFont(size=12)).grid(row=4, column=0, pady=5)
-        ctk.CTkLabel(about_frame, text=DEVELOPER, font=ctk.CTkFont(size=16, weight="bold")).grid(row=5, column=0, pady=5)
-        ctk.CTkLabel(about_frame, text=LOCATION, font=ctk.CTkFont(size=12)).grid(row=6, column=0, pady=5)
-        
-        ctk.CTkLabel(about_frame, text="© 2024 All Rights Reserved.", font=ctk.CTkFont(size=10)).grid(row=7, column=0, pady=(20, 10))
-
-    # --- SERVER LOGIC ---
-    def start_server(self):
-        if self.is_running:
-            self.log_message("Server is already running.")
-            return
+        self.start = time.perf_counter()
+        self.response_start = None
+        self.status = None
+        self.disk_write = 0.0
 
-        try:
-            host = self.host_entry.get()
-            port = int(self.port_entry.get())
-            
-            # Save config
-            self.config["host"] = host
-            self.config["port"] = port
-            self.save_config()
+    def mark_response(self, status):
+        if self.response_start is None:
+            self.response_start = time.perf_counter()
+            self.status = int(status)
 
-            self.server = HTTPServer((host, port), NexusShareHandler)
-            self.server.nexus_app = self # Link handler to this app instance for logging
 
-            self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
-            self.server_thread.start()
-            self.is_running = True
-            
-            self.update_ui_state(running=True)
-            self.log_message(f"Server started successfully on http://{host}:{port}")
-            self.update_ip_address()
-            self.generate_qr_code()
-            webbrowser.open(f"http://{host}:{port}")
+def route_label(method, path):
+    """Collapse a request onto a small, fixed set of route names for metric labels."""
+    path = urlparse(path or '').path
+    if path == '/':
+        return "upload" if method == 'POST' else "page"
+    if path.startswith('/api/uploads'):
+        return "upload_api"
+    if path == '/api/zip':
+        return "zip"
+    if path == '/api/search':
+        return "search"
+    if path == '/api/manifest':
+        return "manifest"
+    if path == '/api/files':
+        return "files"
+    if path == '/metrics':
+        return "metrics"
+    if path.startswith('/thumb/'):
+        return "thumb"
+    if method in ('GET', 'HEAD'):
+        return "download"
+    return "other"
 
-        except Exception as e:
-            self.log_message(f"Failed to start server: {e}")
-            self.update_ui_state(running=False)
 
-    def stop_server(self):
-        if not self.is_running:
-            return
+class ServerMetrics:
+    """
+    Process-wide counters and histograms for both server engines, rendered in
+    the Prometheus text format at /metrics and summarised for the GUI.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}  # (route, status) -> count
+        self.phases = {phase: Histogram(METRICS_LATENCY_BUCKETS) for phase in REQUEST_PHASES}
+        self.upload_sizes = Histogram(METRICS_SIZE_BUCKETS)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active_connections = 0
+        self.recent_latencies = deque(maxlen=METRICS_LATENCY_WINDOW)
+        self.sync = {}  # peer -> [files received, bytes received, last pass report]
 
-        try:
-            self.server.shutdown()
-            self.server.server_close()
-            self.server_thread.join(timeout=5)
-            self.is_running = False
-            self.update_ui_state(running=False)
-            self.log_message("Server stopped.")
-        except Exception as e:
-            self.log_message(f"Error stopping server: {e}")
-
-    def restart_server(self):
-        self.log_message("Restarting server...")
-        self.stop_server()
-        time.sleep(1) # Give it a moment to shut down
-        self.start_server()
-
-    # --- UI UPDATE METHODS ---
-    def update_ui_state(self, running: bool):
-        state_normal = "normal" if not running else "disabled"
-        state_disabled = "disabled" if not running else "normal"
-        
-        self.start_button.configure(state=state_normal)
-        self.stop_button.configure(state=state_disabled)
-        self.restart_button.configure(state=state_disabled)
-        self.host_entry.configure(state=state_normal)
-        self.port_entry.configure(state=state_normal)
-
-        if running:
-            self.status_label.configure(text="● Running", text_color="#1e8e3e")
-            host = self.host_entry.get()
-            port = self.port_entry.get()
-            url_text = f"Local: http://127.0.0.1:{port}\nNetwork: http://{self.get_local_ip()}:{port}"
-            self.url_label.configure(state="normal")
-            self.url_label.delete("0.0", "end")
-            self.url_label.insert("0.0", url_text)
-            self.url_label.configure(state="disabled")
-        else:
-            self.status_label.configure(text="● Stopped", text_color="#d93025")
-            self.url_label.configure(state="normal")
-            self.url_label.delete("0.0", "end")
-            self.url_label.insert("0.0", "URL will appear here...")
-            self.url_label.configure(state="disabled")
-            self.qr_image_label.configure(image=ctk.CTkImage(Image.new('RGB', (200, 200), color='white')), text="QR Code will appear here when server starts.")
+    def add_bytes_in(self, count):
+        with self.lock:
+            self.bytes_in += count
 
-    def log_to_gui(self, message):
-        """Thread-safe method to append log messages to the GUI."""
-        self.after(0, self.log_message, message)
+    def add_bytes_out(self, count):
+        with self.lock:
+            self.bytes_out += count
 
-    def log_message(self, message):
-        """Appends a message to the log textbox."""
-        self.log_textbox.configure(state="normal")
-        self.log_textbox.insert("end", message)
-        self.log_textbox.see("end")
-        self.log_textbox.configure(state="disabled")
-
-    # --- FILE MANAGER METHODS ---
-    def refresh_file_manager(self):
-        self.file_listbox.configure(state="normal")
-        self.file_listbox.delete("0.0", "end")
-        self.file_listbox.insert("0.0", f"{'File Name':<40} {'Size':<15} {'Modified Date':<20}\n")
-        self.file_listbox.insert("end", "-" * 80 + "\n")
-
-        try:
-            files = sorted(os.listdir(UPLOAD_DIR), key=lambda x: os.path.getmtime(os.path.join(UPLOAD_DIR, x)), reverse=True)
-            for f in files:
-                path = os.path.join(UPLOAD_DIR, f)
-                if os.path.isfile(path):
-                    size = self.format_file_size(os.path.getsize(path))
-                    mtime = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
-                    self.file_listbox.insert("end", f"{f:<40} {size:<15} {mtime:<20}\n")
-        except FileNotFoundError:
-            self.file_listbox.insert("end", "Uploads directory not found.")
-        finally:
-            self.file_listbox.configure(state="disabled")
-        self.update_statistics()
-
-    def filter_files(self, event=None):
-        search_term = self.search_entry.get().lower()
-        self.refresh_file_manager() # Refresh first to get the full list
-        # A more advanced filter would be to not refresh but to hide lines,
-        # but for a textbox, this is a simple approach.
-        # For now, this is a placeholder for a more complex implementation.
-        # The actual filtering logic would require a different widget like a Treeview.
-        self.log_message(f"Filtering for: {search_term}")
-
-
-    def delete_selected_file(self):
-        # This is a simplified delete. A real implementation would need to parse the selected line.
-        # For a textbox, getting the exact file is tricky. Let's assume the user types the name.
-        filename = ctk.CTkInputDialog(text="Enter the exact filename to delete:", title="Delete File").get_input()
-        if filename:
-            path = os.path.join(UPLOAD_DIR, filename)
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-                    self.log_message(f"Deleted file: {filename}")
-                    self.refresh_file_manager()
-                else:
-                    self.log_message(f"File not found: {filename}")
-            except Exception as e:
-                self.log_message(f"Error deleting file {filename}: {e}")
-
-    def open_upload_folder(self):
-        if platform.system() == "Windows":
-            os.startfile(UPLOAD_DIR)
-        elif platform.system() == "Darwin": # macOS
-            subprocess.Popen(["open", UPLOAD_DIR])
-        else: # Linux
-            subprocess.Popen(["xdg-open", UPLOAD_DIR])
-
-    def clear_uploads(self):
-        if ctk.CTkInputDialog(text="Type 'DELETE' to confirm", title="Confirm Deletion").get_input() == "DELETE":
-            try:
-                shutil.rmtree(UPLOAD_DIR)
-                os.makedirs(UPLOAD_DIR)
-                self.log_message("All uploads cleared.")
-                self.refresh_file_manager()
-            except Exception as e:
-                self.log_message(f"Error clearing uploads: {e}")
-
-    # --- STATISTICS & UTILITIES ---
-    def update_statistics(self):
-        try:
-            files = [f for f in os.listdir(UPLOAD_DIR) if os.path.isfile(os.path.join(UPLOAD_DIR, f))]
-            total_files = len(files)
-            total_size = sum(os.path.getsize(os.path.join(UPLOAD_DIR, f)) for f in files)
-            
-            largest_file = "N/A"
-            max_size = 0
-            if files:
-                for f in files:
-                    size = os.path.getsize(os.path.join(UPLOAD_DIR, f))
-                    if size > max_size:
-                        max_size = size
-                        largest_file = f"{f} ({self.format_file_size(size)})"
-            
-            file_types = {}
-            for f in files:
-                ext = os.path.splitext(f)[1].lower()
-                file_types[ext] = file_types.get(ext, 0) + 1
-            file_types_str = ", ".join([f"{ext} ({count})" for ext, count in file_types.items()])
-
-            self.stats_labels["total_files"].configure(text=str(total_files))
-            self.stats_labels["total_size"].configure(text=self.format_file_size(total_size))
-            self.stats_labels["largest_file"].configure(text=largest_file)
-            self.stats_labels["file_types"].configure(text=file_types_str if file_types_str else "N/A")
+    def connection_opened(self):
+        with self.lock:
+            self.active_connections += 1
 
-        except Exception as e:
-            self.log_message(f"Error updating statistics: {e}")
-
-    def format_file_size(self, size_bytes):
-        if size_bytes == 0: return "0 Bytes"
-        k = 1024
-        i = int(math.log(size_bytes, k))
-        return f"{size_bytes / k**i:.2f} {['Bytes', 'KB', 'MB', 'GB', 'TB'][i]}"
-    
-    def get_local_ip(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except Exception:
-            return "127.0.0.1"
-
-    def update_ip_address(self):
-        self.local_ip = self.get_local_ip()
-
-    def generate_qr_code(self):
-        if self.is_running:
-            host = self.host_entry.get()
-            port = self.port_entry.get()
-            # Use local IP for QR code as it's more useful for other devices on the network
-            url = f"http://{self.local_ip}:{port}"
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(url)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            ctk_img = ctk.CTkImage(img, size=(250, 250))
-            self.qr_image_label.configure(image=ctk_img, text="")
+    def connection_closed(self):
+        with self.lock:
+            self.active_connections -= 1
 
-    # --- SETTINGS & CONFIG ---
-    def change_appearance_mode_event(self, new_appearance_mode: str):
-        ctk.set_appearance_mode(new_appearance_mode.lower())
-        self.config["theme"] = new_appearance_mode.lower()
-        self.save_config()
+    def observe_upload(self, size):
+        with self.lock:
+            self.upload_sizes.observe(size)
 
-    def load_config(self):
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"host": "0.0.0.0", "port": 8080, "theme": "system"}
+    def finish_request(self, route, timer):
+        end = time.perf_counter()
+        response_start = timer.response_start or end
+        with self.lock:
+            key = (route, timer.status or 0)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.phases["parse"].observe(max(0.0, response_start - timer.start - timer.disk_write))
+            if timer.disk_write:
+                self.phases["disk_write"].observe(timer.disk_write)
+            self.phases["response"].observe(end - response_start)
+            self.recent_latencies.append(end - timer.start)
+
+    def record_sync(self, report):
+        with self.lock:
+            totals = self.sync.setdefault(report["peer"], [0, 0, None])
+            totals[0] += report["transferred"] + report["linked"]
+            totals[1] += report["bytes"]
+            totals[2] = report
+
+    def snapshot(self):
+        """Totals and recent latency percentiles (in seconds) for the GUI."""
+        with self.lock:
+            latencies = sorted(self.recent_latencies)
+            snapshot = {"requests": sum(self.requests.values()), "bytes_in": self.bytes_in,
+                        "bytes_out": self.bytes_out, "active_connections": self.active_connections,
+                        "uploads": self.upload_sizes.count}
+        snapshot["hot_cache"] = hot_files.stats()
+        for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+            snapshot[name] = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        return snapshot
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        index_stats = upload_index.stats()
+        hot_cache = hot_files.stats()
+        with self.lock:
+            lines = ["# HELP nexus_requests_total Requests handled, by route and response status.",
+                     "# TYPE nexus_requests_total counter"]
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f'nexus_requests_total{{route="{route}",status="{status}"}} {count}')
+            lines += ["# HELP nexus_request_phase_seconds Time spent per request in each phase.",
+                      "# TYPE nexus_request_phase_seconds histogram"]
+            for phase, histogram in self.phases.items():
+                lines += histogram.render("nexus_request_phase_seconds", f'phase="{phase}"')
+            lines += ["# HELP nexus_upload_size_bytes Size of each uploaded file.",
+                      "# TYPE nexus_upload_size_bytes histogram"]
+            lines += self.upload_sizes.render("nexus_upload_size_bytes")
+            lines += ["# HELP nexus_received_bytes_total Bytes read from clients.",
+                      "# TYPE nexus_received_bytes_total counter",
+                      f"nexus_received_bytes_total {self.bytes_in}",
+                      "# HELP nexus_sent_bytes_total Bytes sent to clients.",
+                      "# TYPE nexus_sent_bytes_total counter",
+                      f"nexus_sent_bytes_total {self.bytes_out}",
+                      "# HELP nexus_active_connections Client connections currently open.",
+                      "# TYPE nexus_active_connections gauge",
+                      f"nexus_active_connections {self.active_connections}"]
+            if self.sync:
+                lines += ["# HELP nexus_sync_files_total Files brought in from a peer by sync.",
+                          "# TYPE nexus_sync_files_total counter"]
+                lines += [f'nexus_sync_files_total{{peer="{peer}"}} {files}' for peer, (files, _, _) in self.sync.items()]
+                lines += ["# HELP nexus_sync_received_bytes_total Bytes downloaded from a peer by sync.",
+                          "# TYPE nexus_sync_received_bytes_total counter"]
+                lines += [f'nexus_sync_received_bytes_total{{peer="{peer}"}} {received}'
+                          for peer, (_, received, _) in self.sync.items()]
+                lines += ["# HELP nexus_sync_throughput_bytes_per_second Transfer rate of the last sync pass.",
+                          "# TYPE nexus_sync_throughput_bytes_per_second gauge"]
+                lines += [f'nexus_sync_throughput_bytes_per_second{{peer="{peer}"}} {report["throughput"]:.1f}'
+                          for peer, (_, _, report) in self.sync.items()]
+                lines += ["# HELP nexus_sync_lag_seconds Longest delay, in the last sync pass, between a file "
+                          "being stored on the peer and here.",
+                          "# TYPE nexus_sync_lag_seconds gauge"]
+                lines += [f'nexus_sync_lag_seconds{{peer="{peer}"}} {report["lag_max"]:.3f}'
+                          for peer, (_, _, report) in self.sync.items()]
+                lines += ["# HELP nexus_sync_last_pass_time_seconds Unix time the last sync pass finished.",
+                          "# TYPE nexus_sync_last_pass_time_seconds gauge"]
+                lines += [f'nexus_sync_last_pass_time_seconds{{peer="{peer}"}} {report["finished"]:.3f}'
+                          for peer, (_, _, report) in self.sync.items()]
+        lines += ["# HELP nexus_stored_files Files in the uploads directory.",
+                  "# TYPE nexus_stored_files gauge",
+                  f"nexus_stored_files {index_stats['total_files']}",
+                  "# HELP nexus_stored_bytes Total size of the files in the uploads directory.",
+                  "# TYPE nexus_stored_bytes gauge",
+                  f"nexus_stored_bytes {index_stats['total_size']}",
+                  "# HELP nexus_hot_cache_requests_total Downloads of cacheable files, by whether memory had them.",
+                  "# TYPE nexus_hot_cache_requests_total counter",
+                  f'nexus_hot_cache_requests_total{{result="hit"}} {hot_cache["hits"]}',
+                  f'nexus_hot_cache_requests_total{{result="miss"}} {hot_cache["misses"]}',
+                  "# HELP nexus_hot_cache_bytes Memory used by cached file contents.",
+                  "# TYPE nexus_hot_cache_bytes gauge",
+                  f"nexus_hot_cache_bytes {hot_cache['bytes']}",
+                  "# HELP nexus_start_time_seconds Unix time the server process started.",
+                  "# TYPE nexus_start_time_seconds gauge",
+                  f"nexus_start_time_seconds {self.started:.3f}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = ServerMetrics()
+
+
+class MeteredReader:
+    """
+    Wraps a client connection's input stream: every byte read is counted in
+    metrics.bytes_in and paced by the upload bandwidth limits.
+    """
+    def __init__(self, stream, client):
+        self.stream = stream
+        self.client = client
+        self.consumed = 0  # Bytes read so far on this connection
+        self.body_start = 0  # Value of consumed where the current request's body begins
+
+    def account(self, data):
+        self.consumed += len(data)
+        metrics.add_bytes_in(len(data))
+        return bandwidth.delay("upload", self.client, len(data))
+
+    def unread_body(self, content_length):
+        """Bytes of the current request's body not read yet."""
+        return content_length - (self.consumed - self.body_start)
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        delay = self.account(data)
+        if delay:
+            time.sleep(delay)
+        return data
 
-    def save_config(self):
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(self.config, f, indent=4)
+    def readline(self, *args):
+        data = self.stream.readline(*args)
+        delay = self.account(data)
+        if delay:
+            time.sleep(delay)
+        return data
 
-    def on_closing(self):
-        if self.is_running:
-            self.stop_server()
-        self.destroy()
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class AsyncMeteredReader(MeteredReader):
+    """MeteredReader for an asyncio StreamReader."""
+    async def read(self, *args):
+        data = await self.stream.read(*args)
+        delay = self.account(data)
+        if delay:
+            await asyncio.sleep(delay)
+        return data
+
+    async def readline(self):
+        data = await self.stream.readline()
+        delay = self.account(data)
+        if delay:
+            await asyncio.sleep(delay)
+        return data
+
+    async def readexactly(self, n):
+        data = await self.stream.readexactly(n)
+        delay = self.account(data)
+        if delay:
+            await asyncio.sleep(delay)
+        return data
+
+
+class MeteredWriter:
+    """
+    Wraps a client connection's output stream: every byte written is counted
+    in metrics.bytes_out and paced by the download bandwidth limits.
+    """
+    def __init__(self, stream, client):
+        self.stream = stream
+        self.client = client
+
+    def account(self, data):
+        metrics.add_bytes_out(len(data))
+        return bandwidth.delay("download", self.client, len(data))
+
+    def write(self, data):
+        result = self.stream.write(data)
+        delay = self.account(data)
+        if delay:
+            time.sleep(delay)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class AsyncMeteredWriter(MeteredWriter):
+    """MeteredWriter for an asyncio StreamWriter; the pacing happens in drain()."""
+    def __init__(self, stream, client):
+        super().__init__(stream, client)
+        self.pending_delay = 0.0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.pending_delay += self.account(data)
+
+    async def drain(self):
+        await self.stream.drain()
+        if self.pending_delay:
+            delay, self.pending_delay = self.pending_delay, 0.0
+            await asyncio.sleep(delay)
 
 # ==============================================================================
-# MAIN EXECUTION
+# API ERRORS
 # ==============================================================================
-if __name__ == "__main__":
-    import math # Required for format_file_size
+class ApiError(Exception):
+    """
+    Raised for API requests that cannot be served: over-limit or invalid
+    uploads, bad listing, search or preflight parameters. Carries the HTTP
+    status to answer with; the message is sent back as the error text.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# ==============================================================================
+# ADMISSION CONTROL & BANDWIDTH LIMITS
+# ==============================================================================
+class AdmissionControl:
+    """
+    Checks applied to uploads before their body is read: maximum request and
+    file size (413) and free space left on UPLOAD_DIR (507). A limit of 0
+    disables the check. Failures raise ApiError.
+    """
+    def __init__(self):
+        self.max_request_size = 0
+        self.max_file_size = 0
+        self.disk_free_margin = DEFAULT_DISK_FREE_MARGIN_MB * 1024 ** 2
+
+    def configure(self, max_request_size, max_file_size, disk_free_margin):
+        self.max_request_size = max(0, max_request_size)
+        self.max_file_size = max(0, max_file_size)
+        self.disk_free_margin = max(0, disk_free_margin)
+
+    def check_request(self, length):
+        """Check a request body of `length` bytes that is about to be stored."""
+        if self.max_request_size and length > self.max_request_size:
+            raise ApiError(413, f"Request too large: the limit is {self.max_request_size // 1024 ** 2} MB.")
+        self.check_disk_space(length)
+
+    def check_file(self, size):
+        """Check the (announced or received so far) size of a single uploaded file."""
+        if self.max_file_size and size > self.max_file_size:
+            raise ApiError(413, f"File too large: the limit is {self.max_file_size // 1024 ** 2} MB.")
+
+    def check_disk_space(self, incoming):
+        try:
+            free = shutil.disk_usage(UPLOAD_DIR).free
+        except OSError:
+            return
+        if free < incoming + self.disk_free_margin:
+            raise ApiError(507, "Not enough free disk space on the server.")
+
+
+class TokenBucket:
+    """
+    Refills at `rate` bytes/s up to BANDWIDTH_BURST_SECONDS worth of tokens.
+    consume() may overdraw the bucket; the caller then waits off the debt,
+    which keeps the long-run rate exact whatever the piece sizes.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate * BANDWIDTH_BURST_SECONDS, CHUNK_SIZE)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def consume(self, amount):
+        """Take `amount` tokens and return the seconds to wait before continuing."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class BandwidthLimiter:
+    """
+    Upload and download rate limits in bytes/s, for all clients together and
+    for each client IP (0 = unlimited). Used by MeteredReader/MeteredWriter
+    and the sendfile paths of both engines.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_rates = {"upload": 0, "download": 0}
+        self.client_rates = {"upload": 0, "download": 0}
+        self.buckets = {}  # (direction, client IP or None for the total) -> TokenBucket
+
+    def configure(self, upload, download, client_upload, client_download):
+        with self.lock:
+            self.total_rates = {"upload": max(0, upload), "download": max(0, download)}
+            self.client_rates = {"upload": max(0, client_upload), "download": max(0, client_download)}
+            self.buckets.clear()
+
+    def limited(self, direction):
+        return bool(self.total_rates[direction] or self.client_rates[direction])
+
+    def delay(self, direction, client, amount):
+        """Account `amount` bytes and return how long the transfer must pause."""
+        if not amount or not self.limited(direction):
+            return 0.0
+        with self.lock:
+            delay = 0.0
+            for key, rate in (((direction, None), self.total_rates[direction]),
+                              ((direction, client), self.client_rates[direction])):
+                if rate:
+                    bucket = self.buckets.get(key)
+                    if bucket is None:
+                        bucket = self.buckets[key] = TokenBucket(rate)
+                    delay = max(delay, bucket.consume(amount))
+            if len(self.buckets) > 4096:
+                # Forget idle clients; a full bucket is the same as a new one
+                now = time.monotonic()
+                for key in [k for k, b in self.buckets.items()
+                            if b.tokens + (now - b.updated) * b.rate >= b.capacity]:
+                    del self.buckets[key]
+        return delay
+
+
+class ConnectionLimits:
+    """Keep-alive and timeout settings for client connections."""
+    def __init__(self):
+        self.idle_timeout = THREADED_KEEPALIVE_TIMEOUT
+        self.read_timeout = CLIENT_READ_TIMEOUT
+        self.max_requests = MAX_KEEPALIVE_REQUESTS
+
+    def configure(self, idle_timeout, read_timeout, max_requests):
+        self.idle_timeout = max(0.0, idle_timeout)
+        self.read_timeout = max(1.0, read_timeout)
+        self.max_requests = max(1, max_requests)
+
+
+admission = AdmissionControl()
+bandwidth = BandwidthLimiter()
+connection_limits = ConnectionLimits()
+
+
+def apply_limits(config):
+    """
+    Apply the limits from the config dict: admission control, bandwidth and
+    connection limits (sizes in MB, rates in KB/s, 0 = unlimited), the
+    upload fsync mode and the download memory cache.
+    """
+    mb, kb = 1024 ** 2, 1024
+    admission.configure(int(config.get("max_request_mb", 0)) * mb, int(config.get("max_file_mb", 0)) * mb,
+                        int(config.get("disk_free_margin_mb", DEFAULT_DISK_FREE_MARGIN_MB)) * mb)
+    bandwidth.configure(int(config.get("upload_limit_kbs", 0)) * kb, int(config.get("download_limit_kbs", 0)) * kb,
+                        int(config.get("client_upload_limit_kbs", 0)) * kb,
+                        int(config.get("client_download_limit_kbs", 0)) * kb)
+    connection_limits.configure(float(config.get("keepalive_timeout", THREADED_KEEPALIVE_TIMEOUT)),
+                                float(config.get("read_timeout", CLIENT_READ_TIMEOUT)),
+                                int(config.get("max_keepalive_requests", MAX_KEEPALIVE_REQUESTS)))
+    disk_writer.configure(config.get("fsync_mode", FSYNC_MODES[0]))
+    hot_files.configure(int(config.get("hot_cache_mb", HOT_CACHE_MAX_MB)) * mb,
+                        int(config.get("hot_cache_max_file_kb", HOT_CACHE_MAX_FILE_KB)) * kb)
+
+# ==============================================================================
+# UPLOADS METADATA INDEX
+# ==============================================================================
+FileEntry = namedtuple("FileEntry", ["name", "size", "mtime", "ext"])
+
+# Orderings of /api/files: every key ends with the name, so no two files compare equal
+LISTING_SORT_KEYS = {
+    "name": lambda entry: (entry.name.lower(), entry.name),
+    "mtime": lambda entry: (entry.mtime, entry.name),
+    "size": lambda entry: (entry.size, entry.name),
+}
+
+
+class FilenameSearchIndex:
+    """
+    Trigram index over file names for substring search.
+
+    Every lowercased name gets a numeric id, and each three-character slice of
+    it maps to a compact array of the ids containing that slice. A query term
+    is answered from the rarest of its trigrams, and the candidates are
+    confirmed with a plain substring test, so stale ids never produce wrong
+    results. Removed names leave their ids behind in the postings until enough
+    of them pile up to be worth a rebuild. Terms shorter than three characters
+    fall back to a scan of all names. Not thread-safe: UploadIndex guards it
+    with its own lock.
+    """
+    def __init__(self, names=()):
+        self.rebuild(names)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rebuild(self, names):
+        self.names = []  # id -> name, or None once removed
+        self.lowered = []  # id -> lowercased name, or "" once removed
+        self.ids = {}  # name -> id
+        self.postings = {}  # trigram -> array of ids
+        self.dead = 0
+        for name in names:
+            self.add(name)
+
+    @staticmethod
+    def trigrams(text):
+        return set(map(''.join, zip(text, text[1:], text[2:])))
+
+    def add(self, name):
+        if name in self.ids:
+            return
+        name_id = len(self.names)
+        lowered = name.lower()
+        self.names.append(name)
+        self.lowered.append(lowered)
+        self.ids[name] = name_id
+        for trigram in self.trigrams(lowered):
+            postings = self.postings.get(trigram)
+            if postings is None:
+                postings = self.postings[trigram] = array('L')
+            postings.append(name_id)
+
+    def remove(self, name):
+        name_id = self.ids.pop(name, None)
+        if name_id is None:
+            return
+        self.names[name_id] = None
+        self.lowered[name_id] = ""
+        self.dead += 1
+        if self.dead >= SEARCH_COMPACT_MIN_DEAD and self.dead * 2 > len(self.names):
+            self.rebuild(list(self.ids))
+
+    def find(self, query):
+        """Return the terms of `query` and the ids of the live names containing all of them."""
+        terms = query.lower().split()
+        best = None
+        for term in terms:
+            for trigram in self.trigrams(term):
+                postings = self.postings.get(trigram)
+                if postings is None:
+                    return terms, []
+                if best is None or len(postings) < len(best):
+                    best = postings
+        ids = best if best is not None else range(len(self.names))
+        lowered = self.lowered
+        for term in terms:
+            ids = list(compress(ids, map(contains, map(lowered.__getitem__, ids), repeat(term))))
+        return terms, ids
+
+    def search(self, query, limit):
+        """
+        Return (total matches, best `limit` names). Names where the terms
+        appear earliest rank first, so exact and prefix matches lead, then
+        shorter names.
+        """
+        terms, ids = self.find(query)
+        if not terms:
+            return 0, []
+        texts = list(map(self.lowered.__getitem__, ids))
+        positions = map(sum, zip(*[map(str.find, texts, repeat(term)) for term in terms]))
+        best = heapq.nsmallest(limit, zip(positions, map(len, texts), texts, ids))
+        return len(ids), [self.names[item[3]] for item in best]
+
+    def match(self, query):
+        """Return the set of names matching `query`, unranked."""
+        terms, ids = self.find(query)
+        return set(map(self.names.__getitem__, ids)) if terms else set(self.ids)
+
+
+class UploadIndex:
+    """
+    In-memory index of the regular files in UPLOAD_DIR.
+
+    It is built once with os.scandir and then kept current in place by the
+    upload and delete code paths. A background reconciler picks up changes
+    made outside the server (files copied in or removed by hand) by watching
+    the directory's mtime, with an occasional full rescan as a safety net.
+    Every change bumps `generation`, so readers can tell cheaply whether
+    anything moved since they last looked. The filename search index is built
+    by the reconciler when it starts (or by the first search) and is kept
+    current alongside the entries from then on.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.search_index = None
+        self.search_build_lock = threading.Lock()
+        self.sorted_views = {}  # sort key -> (generation, sorted entries, their keys, file count per extension)
+        self.instance = uuid.uuid4().hex[:8]  # Tells this process's generations apart from an earlier run's
+        self.directory = None
+        self.dir_mtime_ns = None
+        self.generation = 0
+        self.total_size = 0
+        self.reconcile_requested = threading.Event()
+        self.reconciler = None
+
+    def __contains__(self, name):
+        with self.lock:
+            self.ensure_loaded()
+            return name in self.entries
+
+    def __len__(self):
+        with self.lock:
+            self.ensure_loaded()
+            return len(self.entries)
+
+    # --- BUILDING & RECONCILING ---
+    def ensure_loaded(self):
+        if self.directory != os.path.abspath(UPLOAD_DIR):
+            self.rescan()
+
+    def scan_directory(self, directory):
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for dir_entry in it:
+                    try:
+                        if dir_entry.is_file():
+                            st = dir_entry.stat()
+                            entries[dir_entry.name] = self.make_entry(dir_entry.name, st)
+                    except OSError:
+                        continue  # Removed while scanning
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def rescan(self):
+        """Scan UPLOAD_DIR and apply the differences to the index."""
+        directory = os.path.abspath(UPLOAD_DIR)
+        dir_mtime_ns = self.stat_directory(directory)
+        entries = self.scan_directory(directory)
+        with self.lock:
+            if directory != self.directory or entries != self.entries:
+                if self.search_index is not None:
+                    for name in self.entries.keys() - entries.keys():
+                        self.search_index.remove(name)
+                    for name in entries.keys() - self.entries.keys():
+                        self.search_index.add(name)
+                self.entries = entries
+                self.total_size = sum(entry.size for entry in entries.values())
+                self.generation += 1
+            self.directory = directory
+            self.dir_mtime_ns = dir_mtime_ns
+
+    def reconcile(self, full=False):
+        """Rescan only if the directory changed since the last look (or when forced)."""
+        directory = os.path.abspath(UPLOAD_DIR)
+        if full or directory != self.directory or self.stat_directory(directory) != self.dir_mtime_ns:
+            self.rescan()
+
+    def request_reconcile(self):
+        """Ask the background reconciler for a full rescan as soon as possible."""
+        self.reconcile_requested.set()
+
+    def start_reconciler(self):
+        if self.reconciler and self.reconciler.is_alive():
+            return
+        self.reconciler = threading.Thread(target=self.reconcile_loop, name="nexus-index", daemon=True)
+        self.reconciler.start()
+
+    def reconcile_loop(self):
+        self.ensure_search_index()
+        passes = 0
+        while True:
+            forced = self.reconcile_requested.wait(INDEX_RECONCILE_INTERVAL)
+            self.reconcile_requested.clear()
+            passes += 1
+            try:
+                self.reconcile(full=forced or passes % INDEX_FULL_RESCAN_EVERY == 0)
+            except OSError:
+                pass
+
+    @staticmethod
+    def stat_directory(directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def make_entry(name, st):
+        return FileEntry(name, st.st_size, st.st_mtime, os.path.splitext(name)[1].lower())
+
+    # --- IN-PLACE UPDATES ---
+    def add(self, name):
+        """Record a file that was just written to UPLOAD_DIR."""
+        try:
+            st = os.stat(os.path.join(UPLOAD_DIR, name))
+        except OSError:
+            return
+        with self.lock:
+            self.ensure_loaded()
+            old = self.entries.get(name)
+            entry = self.make_entry(name, st)
+            self.entries[name] = entry
+            self.total_size += entry.size - (old.size if old else 0)
+            if self.search_index is not None and not old:
+                self.search_index.add(name)
+            self.generation += 1
+            # Our own change moved the directory mtime; don't treat it as an outside change
+            self.dir_mtime_ns = self.stat_directory(self.directory)
+
+    def remove(self, name):
+        """Forget a file that was just deleted from UPLOAD_DIR."""
+        with self.lock:
+            self.ensure_loaded()
+            old = self.entries.pop(name, None)
+            if old:
+                self.total_size -= old.size
+                self.generation += 1
+                if self.search_index is not None:
+                    self.search_index.remove(name)
+            self.dir_mtime_ns = self.stat_directory(self.directory)
+
+    # --- READERS ---
+    def snapshot(self):
+        """Return (generation, list of FileEntry) for the current contents."""
+        with self.lock:
+            self.ensure_loaded()
+            return self.generation, list(self.entries.values())
+
+    # --- FILENAME SEARCH ---
+    def ensure_search_index(self):
+        """Build the search index if needed, outside the main lock so uploads aren't held up meanwhile."""
+        with self.search_build_lock:
+            with self.lock:
+                self.ensure_loaded()
+                if self.search_index is not None:
+                    return
+                names = list(self.entries)
+            search_index = FilenameSearchIndex(names)
+            with self.lock:
+                # Catch up with the files added and removed while building
+                for name in search_index.ids.keys() - self.entries.keys():
+                    search_index.remove(name)
+                for name in self.entries.keys() - search_index.ids.keys():
+                    search_index.add(name)
+                self.search_index = search_index
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT):
+        """Return (total matches, FileEntry list of the best `limit` matches) for a filename query."""
+        self.ensure_search_index()
+        with self.lock:
+            total, names = self.search_index.search(query, limit)
+            return total, [self.entries[name] for name in names]
+
+    def match(self, query):
+        """Return the set of file names matching a filename query."""
+        self.ensure_search_index()
+        with self.lock:
+            return self.search_index.match(query)
+
+    def sorted_view(self, sort):
+        """
+        Return (generation, entries ordered by LISTING_SORT_KEYS[sort], their
+        keys, file count per extension). Views are sorted outside the lock and
+        reused until the generation moves on.
+        """
+        with self.lock:
+            self.ensure_loaded()
+            view = self.sorted_views.get(sort)
+            if view and view[0] == self.generation:
+                return view
+            generation, entries = self.generation, list(self.entries.values())
+        key = LISTING_SORT_KEYS[sort]
+        entries.sort(key=key)
+        ext_counts = {}
+        for entry in entries:
+            ext_counts[entry.ext] = ext_counts.get(entry.ext, 0) + 1
+        view = (generation, entries, list(map(key, entries)), ext_counts)
+        with self.lock:
+            if generation == self.generation:
+                self.sorted_views[sort] = view
+        return view
+
+    def stats(self):
+        """Aggregate figures for the Statistics tab."""
+        with self.lock:
+            self.ensure_loaded()
+            entries = list(self.entries.values())
+            total_size = self.total_size
+        largest = max(entries, key=lambda entry: entry.size, default=None)
+        file_types = {}
+        for entry in entries:
+            file_types[entry.ext] = file_types.get(entry.ext, 0) + 1
+        return {"total_files": len(entries), "total_size": total_size, "largest": largest, "file_types": file_types}
+
+
+upload_index = UploadIndex()
+
+
+def encode_listing_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_listing_cursor(cursor, sort):
+    """Return the sort key a cursor points after, or raise ApiError."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if isinstance(value, list) and len(value) == 3 and value[0] == sort and isinstance(value[2], str):
+            # The key is bisected against the index's own keys, so it must have the same type
+            key = value[1]
+            if sort == "name":
+                valid = isinstance(key, str)
+            else:
+                valid = isinstance(key, (int, float)) and not isinstance(key, bool)
+            if valid:
+                return tuple(value[1:])
+    except (ValueError, TypeError, IndexError):
+        pass
+    raise ApiError(400, "Invalid cursor.")
+
+
+def plan_listing_response(get_header, query_string):
+    """
+    File listing: GET /api/files?sort=name|mtime|size&order=asc|desc&ext=pdf,jpg&limit=<n>&cursor=<c>.
+    Pages are cut by sort key rather than offset, so a cursor stays valid
+    while files come and go. The ETag follows the upload index generation,
+    so an unchanged listing is answered with 304. Returns (status, headers,
+    body); invalid parameters raise ApiError.
+    """
+    params = parse_qs(query_string)
+    sort = params.get('sort', ['name'])[0]
+    if sort not in LISTING_SORT_KEYS:
+        raise ApiError(400, f"sort must be one of: {', '.join(LISTING_SORT_KEYS)}.")
+    order = params.get('order', ['asc' if sort == 'name' else 'desc'])[0]
+    if order not in ('asc', 'desc'):
+        raise ApiError(400, "order must be asc or desc.")
+    extensions = {'.' + ext.strip().lower().lstrip('.') for value in params.get('ext', [])
+                  for ext in value.split(',') if ext.strip()}
+    try:
+        limit = max(1, min(int(params.get('limit', [LISTING_DEFAULT_LIMIT])[0]), LISTING_MAX_LIMIT))
+    except ValueError:
+        raise ApiError(400, "Invalid limit.")
+    cursor = params.get('cursor', [''])[0]
+    after = decode_listing_cursor(cursor, sort) if cursor else None
+
+    generation, entries, keys, ext_counts = upload_index.sorted_view(sort)
+    headers = {"ETag": f'"files-{upload_index.instance}-{generation}"', "Cache-Control": "no-cache"}
+    if_none_match = get_header('If-None-Match')
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(',')]:
+        return HTTPStatus.NOT_MODIFIED, headers, b''
+
+    descending = order == 'desc'
+    if after is None:
+        i = len(entries) - 1 if descending else 0
+    else:
+        i = bisect.bisect_left(keys, after) - 1 if descending else bisect.bisect_right(keys, after)
+    step = -1 if descending else 1
+    page, next_cursor, last = [], None, None
+    while 0 <= i < len(entries):
+        if not extensions or entries[i].ext in extensions:
+            if len(page) == limit:
+                next_cursor = encode_listing_cursor(sort, keys[last])
+                break
+            page.append(entries[i])
+            last = i
+        i += step
+    total = sum(ext_counts.get(ext, 0) for ext in extensions) if extensions else len(entries)
+    body = json.dumps({"status": "success", "generation": generation, "total": total, "next_cursor": next_cursor,
+                       "files": [{"name": entry.name, "size": entry.size, "mtime": entry.mtime} for entry in page]})
+    body = body.encode('utf-8')
+    headers.update({"Content-Type": "application/json", "Content-Length": str(len(body))})
+    return HTTPStatus.OK, headers, body
+
+
+def search_uploads(query_string):
+    """
+    Filename search: GET /api/search?q=<terms>&limit=<n>. Every whitespace
+    separated term must appear in the name (case-insensitively). Names where
+    the terms appear earliest rank first, then shorter names.
+    """
+    params = parse_qs(query_string)
+    query = params.get('q', [''])[0].strip()
+    if not query or len(query) > SEARCH_MAX_QUERY_LENGTH:
+        raise ApiError(400, f"Expected a q parameter of 1 to {SEARCH_MAX_QUERY_LENGTH} characters.")
+    try:
+        limit = max(1, min(int(params.get('limit', [SEARCH_DEFAULT_LIMIT])[0]), SEARCH_MAX_LIMIT))
+    except ValueError:
+        raise ApiError(400, "Invalid limit.")
+    started = time.perf_counter()
+    total, entries = upload_index.search(query, limit)
+    return {"status": "success", "query": query, "total": total,
+            "took_ms": round((time.perf_counter() - started) * 1000, 3),
+            "results": [{"name": entry.name, "size": entry.size, "mtime": entry.mtime} for entry in entries]}
+
+# ==============================================================================
+# UPLOAD DISK WRITER
+# ==============================================================================
+def preallocate(f, size):
+    """
+    Reserve `size` bytes for an open file up front, with posix_fallocate where
+    available, so the file is laid out contiguously and a full disk shows up
+    before the data has been sent. Other platforms just extend the file.
+    """
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    f.truncate(size)
+
+
+def fsync_path(path, directory=False):
+    """fsync a file, or a directory to make renames inside it durable, by path."""
+    if directory and os.name == 'nt':
+        return  # Directories cannot be opened for fsync on Windows
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StagedFile:
+    """
+    A file being written through the DiskWriter. write() queues data for the
+    file's writer thread and only blocks while that queue is full; errors from
+    the writer thread surface on the next write() or on close(). New uploads
+    are also hashed with `hasher` on the writer thread.
+    """
+    def __init__(self, path, f, lane, hasher=None):
+        self.path = path
+        self.f = f
+        self.lane = lane
+        self.hasher = hasher
+        self.size = 0
+        self.error = None
+        self.fsync = False
+        self.closed = threading.Event()
+
+    def write(self, data):
+        if self.error:
+            raise self.error
+        self.lane.put((self, bytes(data)))
+        self.size += len(data)
+
+    def close(self, fsync=False):
+        """Wait until every queued write has reached the file, then close it. Raises the first write error."""
+        if not self.closed.is_set():
+            self.fsync = fsync
+            self.lane.put((self, None))
+            self.closed.wait()
+        if self.error:
+            raise self.error
+
+    def abort(self):
+        """Close and delete the file, ignoring write errors."""
+        try:
+            self.close()
+        except OSError:
+            pass
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class DiskWriter:
+    """
+    Dedicated I/O stage for upload data. Request threads hand their data to a
+    few writer threads through bounded queues, so receiving the next piece
+    from the network overlaps with writing the previous one to disk. Each file
+    sticks to one writer thread, which keeps its writes in order.
+
+    New uploads are written to a temporary file in the internal directory and
+    published into UPLOAD_DIR with a single link or rename once complete, so
+    nobody sees a partial file. When that data is forced to disk is set by
+    the fsync mode:
+      none   leave it to the operating system (fastest)
+      file   fsync every file and UPLOAD_DIR before the upload is answered
+      batch  fsync published files together every FSYNC_BATCH_INTERVAL seconds
+    """
+    def __init__(self, threads=DISK_WRITER_THREADS):
+        self.lock = threading.Lock()
+        self.lanes = []
+        self.next_lane = 0
+        self.threads = threads
+        self.fsync_mode = FSYNC_MODES[0]
+        self.unsynced = []  # Published paths waiting for the batched fsync
+        self.flusher = None
+        self.cleaned = None
+
+    def configure(self, fsync_mode):
+        self.fsync_mode = fsync_mode if fsync_mode in FSYNC_MODES else FSYNC_MODES[0]
+
+    def get_lane(self):
+        with self.lock:
+            if not self.lanes:
+                for i in range(self.threads):
+                    lane = queue.Queue(DISK_WRITER_QUEUE_DEPTH)
+                    threading.Thread(target=self.writer_loop, args=(lane,), name=f"nexus-disk-{i}", daemon=True).start()
+                    self.lanes.append(lane)
+            self.next_lane = (self.next_lane + 1) % len(self.lanes)
+            return self.lanes[self.next_lane]
+
+    @staticmethod
+    def writer_loop(lane):
+        while True:
+            staged, data = lane.get()
+            if data is not None:
+                if staged.error is None:
+                    try:
+                        if staged.hasher:
+                            staged.hasher.update(data)
+                        staged.f.write(data)
+                    except OSError as e:
+                        staged.error = e
+                continue
+            try:
+                staged.f.flush()
+                if staged.fsync and staged.error is None:
+                    os.fsync(staged.f.fileno())
+            except OSError as e:
+                staged.error = staged.error or e
+            finally:
+                try:
+                    staged.f.close()
+                except OSError:
+                    pass
+                staged.closed.set()
+
+    def incoming_dir(self):
+        """Directory of uploads in progress; leftovers of a crash are removed on first use."""
+        directory = os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME, "incoming")
+        os.makedirs(directory, exist_ok=True)
+        if self.cleaned != directory:
+            self.cleaned = directory
+            cutoff = time.time() - UPLOAD_SESSION_EXPIRY
+            for entry in os.scandir(directory):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+        return directory
+
+    def create(self, size=None):
+        """Start a new upload in a temporary file, preallocated when its size is known."""
+        path = os.path.join(self.incoming_dir(), f"{uuid.uuid4().hex}.part")
+        f = open(path, 'xb')
+        try:
+            if size:
+                preallocate(f, size)
+        except OSError:
+            f.close()
+            os.remove(path)
+            raise
+        return StagedFile(path, f, self.get_lane(), hashlib.sha256())
+
+    def open(self, path, offset=0):
+        """Write into an existing file from `offset` on, e.g. one chunk of a resumable upload."""
+        f = open(path, 'r+b')
+        f.seek(offset)
+        return StagedFile(path, f, self.get_lane())
+
+    def publish(self, staged, filename):
+        """
+        Finish an upload, given as a StagedFile (closed here) or as the path of
+        a complete file: apply the fsync mode and move it into UPLOAD_DIR,
+        unless the same content is stored already (see ContentIndex.store).
+        Returns (saved name, None / "exists" / "linked").
+        """
+        per_file = self.fsync_mode == "file"
+        if isinstance(staged, StagedFile):
+            staged.close(fsync=per_file)
+            path, digest = staged.path, staged.hasher.hexdigest()
+        else:
+            # Chunks arrive in any order, so the file is hashed once it is complete
+            path, digest = staged, hash_file(staged)
+            if per_file:
+                fsync_path(path)
+        final_name, dedup = content_index.store(path, filename, digest)
+        if per_file:
+            fsync_path(UPLOAD_DIR, directory=True)
+        elif self.fsync_mode == "batch" and not dedup:
+            self.schedule_fsync(os.path.join(UPLOAD_DIR, final_name))
+        return final_name, dedup
+
+    def schedule_fsync(self, path):
+        with self.lock:
+            self.unsynced.append(path)
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.flush_loop, name="nexus-fsync", daemon=True)
+                self.flusher.start()
+
+    def flush_loop(self):
+        while True:
+            time.sleep(FSYNC_BATCH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """fsync everything published since the last batch, then the directories holding it."""
+        with self.lock:
+            paths, self.unsynced = self.unsynced, []
+        directories = set()
+        for path in paths:
+            try:
+                fsync_path(path)
+                directories.add(os.path.dirname(path))
+            except OSError:
+                pass  # Deleted or moved since it was published
+        for directory in directories:
+            try:
+                fsync_path(directory, directory=True)
+            except OSError:
+                pass
+
+
+disk_writer = DiskWriter()
+atexit.register(disk_writer.flush)
+
+# ==============================================================================
+# CONTENT DEDUPLICATION
+# ==============================================================================
+def hash_file(path):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DEDUP_HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """
+    Persistent SHA-256 index of the files in UPLOAD_DIR, used to store
+    repeated uploads only once.
+
+    Entries are appended to .nexus/hashes.log as they are learnt, and the log
+    is compacted when it is loaded. An entry is only trusted while its file
+    still has the recorded size and mtime, so files changed or removed behind
+    the server's back are never matched. Hard links share both, so every name
+    linked to the same content stays valid.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directory = None
+        self.by_name = {}  # name -> (sha256, size, mtime_ns)
+        self.by_hash = {}  # sha256 -> set of names
+        self.log_lines = 0
+
+    def log_path(self):
+        return os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME, "hashes.log")
+
+    def load(self):
+        """(Re)load the index when UPLOAD_DIR changed. Call with lock held."""
+        directory = os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME)
+        if directory == self.directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.by_name, self.by_hash, self.log_lines = {}, {}, 0
+        try:
+            with open(self.log_path(), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.remember(record['name'], record['sha256'], record['size'], record['mtime_ns'])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self.log_lines += 1
+        except OSError:
+            pass
+        self.directory = directory
+        if self.log_lines > 2 * len(self.by_name) + 100:
+            self.compact()
+
+    def remember(self, name, digest, size, mtime_ns):
+        old = self.by_name.get(name)
+        if old:
+            self.by_hash.get(old[0], set()).discard(name)
+        self.by_name[name] = (digest, size, mtime_ns)
+        self.by_hash.setdefault(digest, set()).add(name)
+
+    def forget(self, name):
+        old = self.by_name.pop(name, None)
+        if old:
+            names = self.by_hash.get(old[0], set())
+            names.discard(name)
+            if not names:
+                self.by_hash.pop(old[0], None)
+
+    def compact(self):
+        """Rewrite the log with one line per current entry. Call with lock held."""
+        path = self.log_path()
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                for name, (digest, size, mtime_ns) in self.by_name.items():
+                    f.write(json.dumps({"name": name, "sha256": digest, "size": size, "mtime_ns": mtime_ns}) + "\n")
+            os.replace(path + ".tmp", path)
+            self.log_lines = len(self.by_name)
+        except OSError:
+            pass
+
+    def add(self, name, digest):
+        """Record the content hash of a file in UPLOAD_DIR."""
+        try:
+            st = os.stat(os.path.join(UPLOAD_DIR, name))
+        except OSError:
+            return
+        line = json.dumps({"name": name, "sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}) + "\n"
+        with self.lock:
+            self.load()
+            self.remember(name, digest, st.st_size, st.st_mtime_ns)
+            try:
+                with open(self.log_path(), "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.log_lines += 1
+            except OSError:
+                pass
+
+    def matches(self, digest, size, name=None):
+        """
+        Names of files that hold content `digest` of `size` bytes. A file named
+        `name` that predates the index and has the right size is hashed on the
+        spot, so uploads made before deduplication existed are found too.
+        """
+        with self.lock:
+            self.load()
+            known = name in self.by_name
+            candidates = list(self.by_hash.get(digest, ()))
+        if name and not known:
+            try:
+                if os.path.getsize(os.path.join(UPLOAD_DIR, name)) == size:
+                    self.add(name, hash_file(os.path.join(UPLOAD_DIR, name)))
+                    with self.lock:
+                        candidates = list(self.by_hash.get(digest, ()))
+            except OSError:
+                pass
+        found = []
+        for candidate in candidates:
+            try:
+                st = os.stat(os.path.join(UPLOAD_DIR, candidate))
+            except OSError:
+                st = None
+            with self.lock:
+                entry = self.by_name.get(candidate)
+                if entry is None:
+                    continue
+                if st is None or (st.st_size, st.st_mtime_ns) != entry[1:]:
+                    self.forget(candidate)  # Changed or removed since it was indexed
+                elif entry[1] == size:
+                    found.append(candidate)
+        return found
+
+    def digest(self, name):
+        """SHA-256 of file `name` in UPLOAD_DIR, from the index while it is current, else hashed and recorded."""
+        path = os.path.join(UPLOAD_DIR, name)
+        st = os.stat(path)
+        with self.lock:
+            self.load()
+            entry = self.by_name.get(name)
+        if entry and entry[1:] == (st.st_size, st.st_mtime_ns):
+            return entry[0]
+        digest = hash_file(path)
+        self.add(name, digest)
+        return digest
+
+    def claim(self, name, digest, size):
+        """
+        Make content `digest` available as `name` without receiving it again.
+        Returns (name it is stored under, "exists") if a file of that name
+        already holds it, (new name, "linked") after hard-linking another copy
+        of it under `name`, or (None, None) if the content has to be uploaded.
+        """
+        found = self.matches(digest, size, name)
+        if name in found:
+            return name, "exists"
+        for existing in found:
+            linked = publish_file(os.path.join(UPLOAD_DIR, existing), name, keep_source=True)
+            if linked:
+                self.add(linked, digest)
+                return linked, "linked"
+        return None, None
+
+    def store(self, path, filename, digest):
+        """
+        Publish a finished upload at `path` as `filename`, unless the content
+        is already stored (see claim), in which case the upload is dropped.
+        Returns (saved name, None / "exists" / "linked").
+        """
+        name, dedup = self.claim(filename, digest, os.path.getsize(path))
+        if dedup:
+            os.remove(path)
+            return name, dedup
+        name = publish_file(path, filename)
+        self.add(name, digest)
+        return name, None
+
+
+content_index = ContentIndex()
+
+
+def dedup_note(dedup):
+    """Suffix for log lines about uploads that were deduplicated."""
+    return {"exists": " (identical file already stored)", "linked": " (content already stored, hard-linked)"}.get(dedup, "")
+
+
+def preflight_uploads(request):
+    """
+    Upload preflight: the client lists files it hashed locally as {name, size,
+    sha256}, and learns for each whether the server already has the content.
+    Matches are made available under the requested name right away (status
+    "exists" or "linked"), so only files with status "upload" need sending.
+    """
+    files = request.get('files')
+    if not isinstance(files, list) or len(files) > PREFLIGHT_MAX_FILES:
+        raise ApiError(400, f"Expected a list of at most {PREFLIGHT_MAX_FILES} files.")
+    results = []
+    for item in files:
+        if not isinstance(item, dict):
+            raise ApiError(400, "Invalid file entry.")
+        name = os.path.basename(str(item.get('name') or ''))
+        digest = str(item.get('sha256') or '').lower()
+        size = item.get('size')
+        if not name or name == INTERNAL_DIR_NAME or not re.fullmatch(r'[0-9a-f]{64}', digest) \
+                or not isinstance(size, int) or size < 0:
+            raise ApiError(400, "Every file needs a name, a size and a SHA-256 hex digest.")
+        filename, dedup = content_index.claim(name, digest, size)
+        if dedup == "linked":
+            upload_index.add(filename)
+            thumbnails.schedule(filename)
+        results.append({"name": name, "sha256": digest, "status": dedup or "upload", "filename": filename})
+    return {"status": "success", "files": results}
+
+# ==============================================================================
+# STREAMING MULTIPART PARSER
+# ==============================================================================
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser.
+
+    Body bytes are pushed in with feed() in chunks of any size. Part data is
+    handed to the callbacks as soon as it is known not to contain the boundary,
+    so memory use stays bounded by the chunk size regardless of the upload size.
+    """
+    _PREAMBLE, _AFTER_BOUNDARY, _HEADERS, _BODY, _DONE = range(5)
+
+    def __init__(self, boundary, on_part_begin, on_part_data, on_part_end):
+        self.delimiter = b'\r\n--' + boundary
+        self.on_part_begin = on_part_begin
+        self.on_part_data = on_part_data
+        self.on_part_end = on_part_end
+        # The leading CRLF lets the first boundary match the same delimiter as the others
+        self.buffer = bytearray(b'\r\n')
+        self.state = self._PREAMBLE
+
+    def feed(self, data):
+        """Consume the next chunk of the request body."""
+        self.buffer += data
+        while True:
+            if self.state == self._PREAMBLE:
+                index = self.buffer.find(self.delimiter)
+                if index == -1:
+                    del self.buffer[:-len(self.delimiter)]
+                    return
+                del self.buffer[:index + len(self.delimiter)]
+                self.state = self._AFTER_BOUNDARY
+
+            elif self.state == self._AFTER_BOUNDARY:
+                if self.buffer.startswith(b'--'):
+                    self.buffer.clear()
+                    self.state = self._DONE
+                    return
+                index = self.buffer.find(b'\r\n')
+                if index == -1:
+                    if len(self.buffer) > MAX_PART_HEADER_SIZE:
+                        raise ValueError("Malformed multipart boundary line")
+                    return
+                del self.buffer[:index + 2]
+                self.state = self._HEADERS
+
+            elif self.state == self._HEADERS:
+                if self.buffer.startswith(b'\r\n'):
+                    index = 0
+                else:
+                    index = self.buffer.find(b'\r\n\r\n')
+                    if index == -1:
+                        if len(self.buffer) > MAX_PART_HEADER_SIZE:
+                            raise ValueError("Multipart part headers are too large")
+                        return
+                    index += 2
+                headers = self.parse_part_headers(bytes(self.buffer[:index]))
+                del self.buffer[:index + 2]
+                self.state = self._BODY
+                self.on_part_begin(headers)
+
+            elif self.state == self._BODY:
+                index = self.buffer.find(self.delimiter)
+                if index == -1:
+                    # Hold back a tail that could be the start of a split delimiter
+                    safe_length = len(self.buffer) - len(self.delimiter) + 1
+                    if safe_length > 0:
+                        self.on_part_data(bytes(self.buffer[:safe_length]))
+                        del self.buffer[:safe_length]
+                    return
+                if index:
+                    self.on_part_data(bytes(self.buffer[:index]))
+                del self.buffer[:index + len(self.delimiter)]
+                self.state = self._AFTER_BOUNDARY
+                self.on_part_end()
+
+            else:
+                # Anything after the closing boundary is epilogue and is ignored
+                self.buffer.clear()
+                return
+
+    def close(self):
+        """Verify that the closing boundary was seen."""
+        if self.state != self._DONE:
+            raise ValueError("Incomplete multipart body")
+
+    @staticmethod
+    def parse_part_headers(raw_headers):
+        """Parse a part's header block into a dict with lower-cased names."""
+        headers = {}
+        for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return headers
+
+
+def publish_file(path, filename, keep_source=False):
+    """
+    Move a finished file into UPLOAD_DIR as `filename`, appending a counter on
+    duplicate names. The file appears complete in a single step and an
+    existing file is never replaced. Returns the chosen name. With
+    keep_source the file is hard-linked instead of moved, and None is
+    returned if it cannot be linked.
+    """
+    counter = 1
+    base_name, ext = os.path.splitext(filename)
+    candidate = filename
+    while True:
+        # Names already in the index are skipped without touching the disk;
+        # the exclusive link still guards against files the index hasn't seen yet
+        if candidate not in upload_index:
+            target = os.path.join(UPLOAD_DIR, candidate)
+            try:
+                os.link(path, target)  # Unlike a rename, fails if the name is taken
+                if not keep_source:
+                    os.remove(path)
+                return candidate
+            except FileExistsError:
+                pass
+            except OSError:
+                if keep_source:
+                    return None
+                # No hard links on this filesystem: reserve the name, then rename over it
+                try:
+                    open(target, 'xb').close()
+                    os.replace(path, target)
+                    return candidate
+                except FileExistsError:
+                    pass
+        candidate = f"{base_name}_{counter}{ext}"
+        counter += 1
+
+
+def get_multipart_boundary(content_type):
+    """Extract the boundary parameter from a multipart/form-data Content-Type header."""
+    return content_type.split('boundary=')[1].split(';')[0].strip('"').encode()
+
+
+class MultipartFileSaver:
+    """
+    Receives parts from a MultipartParser and streams every file part
+    through the DiskWriter into its own file, published in UPLOAD_DIR once
+    the part is complete.
+
+    A file that is refused or cannot be written is dropped on its own; the
+    rest of its part is skipped and the other files of the request are still
+    saved. `results` records the outcome of every file part, in order.
+    """
+    def __init__(self, timer=None):
+        self.timer = timer
+        self.saved = []
+        self.results = []
+        self.current_file = None
+        self.current_size = 0
+        self.current_original = None
+        self.current_error = None
+
+    def begin_part(self, headers):
+        disposition = headers.get('content-disposition', '')
+        params = dict(re.findall(r'(\w+)="([^"]*)"', disposition))
+        # Sanitize filename to prevent path traversal
+        safe_filename = os.path.basename(params.get('filename', ''))
+        if not safe_filename:
+            return  # Plain form field or empty file input: skip its data
+        self.current_original = safe_filename
+        self.current_error = None
+        self.current_size = 0
+        try:
+            self.current_file = disk_writer.create()
+        except OSError as e:
+            self.current_error = self.write_error(e)
+
+    def write(self, data):
+        if self.current_file:
+            try:
+                admission.check_file(self.current_size + len(data))
+                started = time.perf_counter()
+                self.current_file.write(data)  # Only blocks while the disk stage is behind
+            except ApiError as e:
+                self.fail(e.status, str(e))
+                return
+            except OSError as e:
+                self.fail(*self.write_error(e))
+                return
+            if self.timer:
+                self.timer.disk_write += time.perf_counter() - started
+            self.current_size += len(data)
+
+    def end_part(self):
+        if self.current_file:
+            started = time.perf_counter()
+            try:
+                name, dedup = disk_writer.publish(self.current_file, self.current_original)
+            except OSError as e:
+                self.fail(*self.write_error(e))
+            else:
+                if self.timer:
+                    self.timer.disk_write += time.perf_counter() - started
+                self.saved.append({'filename': name, 'size': self.current_size})
+                self.results.append({'name': self.current_original, 'filename': name,
+                                     'size': self.current_size, 'status': "success", 'dedup': dedup})
+                upload_index.add(name)
+                metrics.observe_upload(self.current_size)
+                thumbnails.schedule(name)
+                self.current_file = None
+        if self.current_error:
+            code, message = self.current_error
+            self.results.append({'name': self.current_original, 'status': "error", 'code': code, 'message': message})
+        self.current_original = None
+        self.current_error = None
+
+    @staticmethod
+    def write_error(e):
+        return (507 if e.errno == errno.ENOSPC else 500), f"Could not write the file: {e.strerror or e}"
+
+    def fail(self, code, message):
+        """Give up on the current file only; the rest of its part is ignored."""
+        self.abort()
+        self.current_error = (code, message)
+
+    def abort(self):
+        """Drop the file that was being written when the upload failed."""
+        if self.current_file:
+            self.current_file.abort()
+            self.current_file = None
+
+    def log_results(self, log_message):
+        for result in self.results:
+            if result['status'] == "success":
+                log_message(f"File uploaded: {result['filename']}{dedup_note(result['dedup'])}")
+            else:
+                log_message(f"Upload of {result['name']} failed: {result['message']}")
+
+    def response(self):
+        """
+        Return (status, JSON body) describing the request's per-file results.
+        The status is 200 when at least one file was saved, otherwise that of
+        the first failure, so single-file uploads map onto plain HTTP errors.
+        """
+        failed = [result for result in self.results if result['status'] != "success"]
+        if not self.results:
+            return 200, {"status": "error", "message": "No files received.", "files": [], "results": []}
+        if not self.saved:
+            status, message = failed[0]['code'], f"Upload failed: {failed[0]['message']}"
+        elif failed:
+            status, message = 200, f"Uploaded {len(self.saved)} file(s), {len(failed)} failed."
+        else:
+            status, message = 200, f"Successfully uploaded {len(self.saved)} file(s)."
+        return status, {"status": "success" if not failed else ("partial" if self.saved else "error"),
+                        "message": message, "files": [file_data['filename'] for file_data in self.saved],
+                        "results": self.results}
+
+# ==============================================================================
+# RESUMABLE CHUNKED UPLOADS
+# ==============================================================================
+class ChunkedUploadManager:
+    """
+    Tracks resumable chunked uploads.
+
+    Every session owns a '.part' file sized to the final upload plus a small
+    JSON record of the chunks received so far, both kept in the internal
+    directory of UPLOAD_DIR. Chunks can arrive in any order and in parallel,
+    and a session survives a server restart, so clients can always resume
+    from what the server already has.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes_done = threading.Condition(self.lock)
+        self.sessions = {}
+        self.completing = set()  # Upload ids being published by complete()
+        self.writing = {}  # Upload id -> chunk writes in progress
+        self.loaded_from = None
+
+    def session_dir(self):
+        return os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME, "partial")
+
+    def part_path(self, upload_id):
+        return os.path.join(self.session_dir(), f"{upload_id}.part")
+
+    def load_sessions(self):
+        """Load the sessions persisted on disk (once per upload directory) and drop expired ones."""
+        directory = self.session_dir()
+        os.makedirs(directory, exist_ok=True)
+        if self.loaded_from == directory:
+            return
+        self.sessions = {}
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.json'):
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        session = json.load(f)
+                    session['received'] = set(session['received'])
+                    self.sessions[session['upload_id']] = session
+                except (OSError, ValueError, KeyError):
+                    continue
+        self.loaded_from = directory
+        self.expire_sessions()
+
+    def expire_sessions(self):
+        cutoff = time.time() - UPLOAD_SESSION_EXPIRY
+        for upload_id, session in list(self.sessions.items()):
+            if session['updated'] < cutoff and upload_id not in self.completing and upload_id not in self.writing:
+                self.discard(upload_id)
+
+    def discard(self, upload_id):
+        self.sessions.pop(upload_id, None)
+        for path in (self.part_path(upload_id), os.path.join(self.session_dir(), f"{upload_id}.json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def save_session(self, session):
+        path = os.path.join(self.session_dir(), f"{session['upload_id']}.json")
+        record = dict(session, received=sorted(session['received']))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def describe(session):
+        """Public view of a session, as returned by the API."""
+        return {
+            "upload_id": session['upload_id'],
+            "name": session['name'],
+            "size": session['size'],
+            "chunk_size": session['chunk_size'],
+            "total_chunks": session['total_chunks'],
+            "received": sorted(session['received']),
+        }
+
+    def create(self, name, size, chunk_size=None, key=None):
+        """Start a session, or return the unfinished one with the same client key."""
+        safe_filename = os.path.basename(str(name or ''))
+        if not safe_filename:
+            raise ApiError(400, "A file name is required.")
+        try:
+            size = int(size)
+            chunk_size = int(chunk_size or DEFAULT_UPLOAD_CHUNK_SIZE)
+        except (TypeError, ValueError):
+            raise ApiError(400, "Invalid size or chunk_size.")
+        if size < 0:
+            raise ApiError(400, "Invalid size.")
+        chunk_size = min(max(chunk_size, MIN_UPLOAD_CHUNK_SIZE), MAX_UPLOAD_CHUNK_SIZE)
+
+        with self.lock:
+            self.load_sessions()
+            if key:
+                for session in self.sessions.values():
+                    if session.get('key') == key and session['size'] == size:
+                        return session
+
+            admission.check_file(size)
+            admission.check_disk_space(size)
+            self.expire_sessions()
+            upload_id = uuid.uuid4().hex
+            with open(self.part_path(upload_id), 'wb') as f:
+                try:
+                    preallocate(f, size)
+                except OSError as e:
+                    f.close()
+                    os.remove(self.part_path(upload_id))
+                    raise ApiError(507 if e.errno == errno.ENOSPC else 500,
+                                   f"Could not allocate the file: {e.strerror or e}")
+            session = {
+                "upload_id": upload_id,
+                "name": safe_filename,
+                "size": size,
+                "chunk_size": chunk_size,
+                "total_chunks": (size + chunk_size - 1) // chunk_size,
+                "received": set(),
+                "key": key,
+                "updated": time.time(),
+            }
+            self.sessions[upload_id] = session
+            self.save_session(session)
+            return session
+
+    def get(self, upload_id):
+        with self.lock:
+            self.load_sessions()
+            session = self.sessions.get(upload_id)
+        if session is None:
+            raise ApiError(404, "Unknown upload session.")
+        return session
+
+    def write_chunk(self, upload_id, index, length, read, timer=None):
+        """
+        Store chunk number `index`, pulling `length` bytes from the `read(n)` callable
+        in CHUNK_SIZE pieces. Chunks already received are overwritten. Time spent
+        writing is added to timer.disk_write when a RequestTimer is given.
+        """
+        session = self.get(upload_id)
+        if not 0 <= index < session['total_chunks']:
+            raise ApiError(400, "Chunk index out of range.")
+        offset = index * session['chunk_size']
+        expected = min(session['chunk_size'], session['size'] - offset)
+        if length != expected:
+            raise ApiError(400, f"Chunk {index} must be {expected} bytes.")
+        with self.lock:
+            if upload_id in self.completing:
+                raise ApiError(409, "Upload is already being completed.")
+            if upload_id not in self.sessions:
+                raise ApiError(404, "Unknown upload session.")
+            self.writing[upload_id] = self.writing.get(upload_id, 0) + 1
+
+        try:
+            staged = disk_writer.open(self.part_path(upload_id), offset)
+            try:
+                remaining = length
+                while remaining > 0:
+                    data = read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        raise ConnectionError("Client disconnected during chunk upload")
+                    started = time.perf_counter()
+                    staged.write(data)
+                    if timer:
+                        timer.disk_write += time.perf_counter() - started
+                    remaining -= len(data)
+            finally:
+                # The chunk only counts as received once all of it is in the file
+                started = time.perf_counter()
+                staged.close()
+                if timer:
+                    timer.disk_write += time.perf_counter() - started
+
+            with self.lock:
+                session['received'].add(index)
+                session['updated'] = time.time()
+                self.save_session(session)
+            return session
+        finally:
+            with self.lock:
+                self.writing[upload_id] -= 1
+                if not self.writing[upload_id]:
+                    del self.writing[upload_id]
+                    self.writes_done.notify_all()
+
+    def complete(self, upload_id):
+        """
+        Move a fully received upload into UPLOAD_DIR. Returns (final name, dedup)
+        like DiskWriter.publish. Chunk writes still in progress are waited for,
+        and the session is kept until the file is published, so a client can
+        retry a completion that failed.
+        """
+        session = self.get(upload_id)
+        with self.lock:
+            if upload_id not in self.sessions:
+                raise ApiError(404, "Unknown upload session.")
+            if upload_id in self.completing:
+                raise ApiError(409, "Upload is already being completed.")
+            self.completing.add(upload_id)  # Refuses new chunk writes
+            while self.writing.get(upload_id):
+                self.writes_done.wait()
+            missing = session['total_chunks'] - len(session['received'])
+            if missing:
+                self.completing.discard(upload_id)
+                raise ApiError(409, f"Upload is missing {missing} chunk(s).")
+
+        try:
+            final_name, dedup = disk_writer.publish(self.part_path(upload_id), session['name'])
+        except BaseException:
+            with self.lock:
+                self.completing.discard(upload_id)
+            raise
+        with self.lock:
+            self.completing.discard(upload_id)
+            self.sessions.pop(upload_id, None)
+        upload_index.add(final_name)
+        metrics.observe_upload(session['size'])
+        thumbnails.schedule(final_name)
+        self.discard(upload_id)
+        return final_name, dedup
+
+
+chunked_uploads = ChunkedUploadManager()
+
+
+def parse_upload_api_path(path):
+    """Split '/api/uploads/<id>/...' (or '/api/uploads/preflight') into its segments after the prefix, or return None."""
+    if path != '/api/uploads' and not path.startswith('/api/uploads/'):
+        return None
+    segments = [segment for segment in path[len('/api/uploads'):].split('/') if segment]
+    if segments and segments != ['preflight'] and not re.fullmatch(r'[0-9a-f]{32}', segments[0]):
+        raise ApiError(404, "Unknown upload session.")
+    return segments
+
+
+def is_internal_path(file_path):
+    """True for filesystem paths (as returned by translate_path) inside the internal state directory of UPLOAD_DIR."""
+    internal = os.path.abspath(os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME))
+    return os.path.commonpath([internal, os.path.abspath(file_path)]) == internal
+
+# ==============================================================================
+# FILE DOWNLOADS (CONDITIONAL AND RANGE REQUESTS)
+# ==============================================================================
+def make_etag(fs):
+    """Strong validator derived from a file's mtime and size."""
+    return f'"{fs.st_mtime_ns:x}-{fs.st_size:x}"'
+
+
+def is_not_modified(get_header, etag, fs):
+    """Evaluate If-None-Match (or, failing that, If-Modified-Since) against a file."""
+    if_none_match = get_header('If-None-Match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if get_header('If-Modified-Since'):
+        try:
+            return int(fs.st_mtime) <= parsedate_to_datetime(get_header('If-Modified-Since')).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+def parse_range_header(value, size):
+    """
+    Parse a 'bytes=' Range header into a list of inclusive (start, end) pairs.
+    Returns None when the header should be ignored (malformed or too many
+    ranges) and an empty list when no range can be satisfied.
+    """
+    unit, sep, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not sep:
+        return None
+    specs = [item.strip() for item in spec.split(',') if item.strip()]
+    if not specs or len(specs) > MAX_RANGES_PER_REQUEST:
+        return None
+
+    ranges = []
+    for item in specs:
+        first, dash, last = item.partition('-')
+        if not dash or not (first.isdigit() or last.isdigit()) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        if start < size:
+            ranges.append((start, end))
+    return ranges
+
+
+def plan_file_response(get_header, fs, content_type):
+    """
+    Work out the response for downloading a file, honouring If-None-Match,
+    If-Modified-Since, Range and If-Range.
+
+    Returns (status, headers, parts) where parts is a list of
+    (preamble_bytes, offset, count) tuples to send in order.
+    """
+    size = fs.st_size
+    etag = make_etag(fs)
+    last_modified = formatdate(fs.st_mtime, usegmt=True)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"}
+    if is_compressible(content_type, size):
+        headers["Vary"] = "Accept-Encoding"
+
+    if is_not_modified(get_header, etag, fs):
+        return HTTPStatus.NOT_MODIFIED, headers, []
+
+    ranges = None
+    range_header = get_header('Range')
+    if range_header:
+        if_range = get_header('If-Range')
+        # A stale If-Range validator means the client gets the whole, current file
+        if not if_range or if_range.strip() in (etag, last_modified):
+            ranges = parse_range_header(range_header, size)
+
+    if ranges is None:
+        headers.update({"Content-Type": content_type, "Content-Length": str(size)})
+        return HTTPStatus.OK, headers, [(b'', 0, size)]
+
+    if not ranges:
+        headers.update({"Content-Range": f"bytes */{size}", "Content-Length": "0"})
+        return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers, []
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers.update({"Content-Type": content_type, "Content-Range": f"bytes {start}-{end}/{size}",
+                        "Content-Length": str(end - start + 1)})
+        return HTTPStatus.PARTIAL_CONTENT, headers, [(b'', start, end - start + 1)]
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    for i, (start, end) in enumerate(ranges):
+        separator = "\r\n" if i else ""
+        preamble = (f"{separator}--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode('latin-1')
+        parts.append((preamble, start, end - start + 1))
+    parts.append((f"\r\n--{boundary}--\r\n".encode('latin-1'), 0, 0))
+    headers.update({"Content-Type": f"multipart/byteranges; boundary={boundary}",
+                    "Content-Length": str(sum(len(preamble) + count for preamble, _, count in parts))})
+    return HTTPStatus.PARTIAL_CONTENT, headers, parts
+
+
+class HotFile:
+    """A small file's contents and the stat it was read with, plus the headers of a full 200 response."""
+    __slots__ = ("data", "fs", "content_type", "headers")
+
+    def __init__(self, data, fs, content_type):
+        self.data = data
+        self.fs = fs
+        self.content_type = content_type
+        self.headers = plan_file_response(lambda name: None, fs, content_type)[1]
+
+    def plan(self, get_header):
+        """Like plan_file_response, but returns (status, headers, list of body chunks) from memory."""
+        if not (get_header('Range') or get_header('If-None-Match') or get_header('If-Modified-Since')):
+            return HTTPStatus.OK, dict(self.headers), [self.data]
+        status, headers, parts = plan_file_response(get_header, self.fs, self.content_type)
+        view = memoryview(self.data)
+        chunks = []
+        for preamble, offset, count in parts:
+            if preamble:
+                chunks.append(preamble)
+            if count:
+                chunks.append(view[offset:offset + count])
+        return status, headers, chunks
+
+    @staticmethod
+    def pieces(chunks):
+        """Split body chunks into CHUNK_SIZE slices, so the download limits can pace them."""
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for start in range(0, len(view), CHUNK_SIZE):
+                yield view[start:start + CHUNK_SIZE]
+
+
+class HotFileCache:
+    """
+    Byte-capped LRU cache of the contents of small files in UPLOAD_DIR, so a
+    file many clients fetch at once is read from disk once and then served
+    from memory. An entry is only used while a stat of the file still shows
+    the size, mtime and inode it was read with; anything else drops it.
+    """
+    def __init__(self, max_bytes=HOT_CACHE_MAX_MB * 1024 ** 2, max_file_size=HOT_CACHE_MAX_FILE_KB * 1024):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.entries = OrderedDict()  # path -> HotFile, least recently used first
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes, max_file_size):
+        with self.lock:
+            self.max_bytes = max(0, max_bytes)
+            self.max_file_size = max(0, max_file_size)
+            for path in [path for path, entry in self.entries.items() if len(entry.data) > self.max_file_size]:
+                self.drop(path)
+            self.evict()
+
+    def cacheable(self, size):
+        return 0 < size <= min(self.max_file_size, self.max_bytes)
+
+    def drop(self, path):
+        """Remove an entry. Call with lock held."""
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.total_size -= len(entry.data)
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits. Call with lock held."""
+        while self.total_size > self.max_bytes and self.entries:
+            self.drop(next(iter(self.entries)))
+
+    def get(self, path, get_header):
+        """
+        Return the current HotFile for path, or None if it isn't cached or the
+        client should get a compressed variant instead.
+        """
+        if not self.entries:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if not st or (entry.fs.st_size, entry.fs.st_mtime_ns, entry.fs.st_ino) != \
+                    (st.st_size, st.st_mtime_ns, st.st_ino):
+                self.drop(path)  # Changed or removed since it was read
+                return None
+        if choose_download_encoding(get_header, entry.fs, entry.content_type):
+            return None
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+            self.hits += 1
+        return entry
+
+    def load(self, path, f, fs, content_type):
+        """
+        Read the open file f (stat fs) into the cache if it is small enough,
+        after a get() found nothing. Returns the HotFile or None.
+        """
+        if not self.cacheable(fs.st_size):
+            return None
+        with self.lock:
+            self.misses += 1
+        f.seek(0)
+        data = f.read(fs.st_size + 1)
+        after = os.fstat(f.fileno())
+        if len(data) != fs.st_size or (after.st_size, after.st_mtime_ns) != (fs.st_size, fs.st_mtime_ns):
+            return None  # Being written to: serve it from disk this time
+        entry = HotFile(data, fs, content_type)
+        with self.lock:
+            self.drop(path)
+            self.entries[path] = entry
+            self.total_size += len(data)
+            self.evict()
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(self.entries), "bytes": self.total_size}
+
+
+hot_files = HotFileCache()
+
+# ==============================================================================
+# COMPRESSED DOWNLOADS
+# ==============================================================================
+class DiskLRUCache:
+    """
+    Size-capped cache of derived files in UPLOAD_DIR/.nexus/<name>. Entries are
+    addressed by a string key and evicted least recently used first; recency
+    is kept in the files' mtimes, so it survives restarts. Entries are written
+    to a temporary file and renamed into place, so readers never see a partial
+    entry.
+    """
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.directory = None
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """(Re)build the entry list if UPLOAD_DIR changed or the directory vanished. Call with lock held."""
+        directory = os.path.join(UPLOAD_DIR, INTERNAL_DIR_NAME, self.name)
+        if directory == self.directory and os.path.isdir(directory):
+            return directory
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(directory):
+            try:
+                if entry.name.endswith('.tmp'):
+                    os.remove(entry.path)  # Left behind by an interrupted write
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, entry.name, st.st_size))
+        found.sort()
+        self.entries = OrderedDict((name, size) for _, name, size in found)
+        self.total_size = sum(self.entries.values())
+        self.directory = directory
+        return directory
+
+    @staticmethod
+    def entry_name(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def open(self, key):
+        """Return the cached entry for key opened for reading, or None."""
+        name = self.entry_name(key)
+        with self.lock:
+            directory = self.load()
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(directory, name)
+        try:
+            f = open(path, 'rb')
+            os.utime(path)
+            return f
+        except OSError:
+            with self.lock:
+                self.total_size -= self.entries.pop(name, 0)
+            return None
+
+    def contains(self, key):
+        with self.lock:
+            self.load()
+            return self.entry_name(key) in self.entries
+
+    def create_temp(self):
+        """Open a new temporary file in the cache directory. Returns (path, fileobj)."""
+        with self.lock:
+            directory = self.load()
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.tmp")
+        return path, open(path, 'wb')
+
+    def commit(self, key, temp_path):
+        """Move a finished temporary file into the cache under key, evicting old entries."""
+        name = self.entry_name(key)
+        try:
+            size = os.path.getsize(temp_path)
+            if size > self.max_bytes:
+                os.remove(temp_path)
+                return
+            with self.lock:
+                directory = self.load()
+                os.replace(temp_path, os.path.join(directory, name))
+                self.total_size += size - self.entries.pop(name, 0)
+                self.entries[name] = size
+                while self.total_size > self.max_bytes and len(self.entries) > 1:
+                    old_name, old_size = self.entries.popitem(last=False)
+                    self.total_size -= old_size
+                    try:
+                        os.remove(os.path.join(directory, old_name))
+                    except OSError:
+                        pass
+        except OSError:
+            self.discard(temp_path)
+
+    @staticmethod
+    def discard(temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "size": self.total_size, "hits": self.hits, "misses": self.misses}
+
+
+compressed_cache = DiskLRUCache("compressed", COMPRESS_CACHE_MAX_BYTES)
+
+
+def is_compressible(content_type, size):
+    """Whether a download of this type and size is worth compressing."""
+    if size < COMPRESS_MIN_SIZE:
+        return False
+    content_type = content_type.split(';')[0].strip().lower()
+    return any(content_type.startswith(t) if t.endswith('/') else
+               (content_type.endswith(t) if t.startswith('+') else content_type == t)
+               for t in COMPRESSIBLE_TYPES)
+
+
+def choose_download_encoding(get_header, fs, content_type):
+    """
+    Pick the content-coding for a whole-file download: zstd or gzip, whichever
+    the client prefers, or None to send the file as-is. Range requests always
+    get the identity encoding so resumed downloads keep working.
+    """
+    if get_header('Range') or not is_compressible(content_type, fs.st_size):
+        return None
+    accepted = parse_accept_encoding(get_header('Accept-Encoding'))
+    wildcard = accepted.get('*', 0)
+    candidates = [coding for coding in ("zstd", "gzip") if accepted.get(coding, wildcard) > 0]
+    if zstandard is None and "zstd" in candidates:
+        candidates.remove("zstd")
+    if not candidates:
+        return None
+    # Highest q-value wins; ties go to zstd, which is cheaper and smaller
+    return max(candidates, key=lambda coding: (accepted.get(coding, wildcard), coding == "zstd"))
+
+
+def plan_compressed_response(get_header, fs, content_type, coding):
+    """
+    Headers for a download sent with a content-coding. The ETag is the file's,
+    tagged with the coding. Returns (status, headers); Content-Length is left
+    to the caller, which knows it only when the variant is already cached.
+    """
+    etag = f'{make_etag(fs)[:-1]}-{coding}"'
+    headers = {"ETag": etag, "Last-Modified": formatdate(fs.st_mtime, usegmt=True), "Vary": "Accept-Encoding"}
+    if is_not_modified(get_header, etag, fs):
+        return HTTPStatus.NOT_MODIFIED, headers
+    headers.update({"Content-Type": content_type, "Content-Encoding": coding})
+    return HTTPStatus.OK, headers
+
+
+def compressed_variant_key(path, fs, coding):
+    return f"{os.path.abspath(path)}|{fs.st_mtime_ns}|{fs.st_size}|{coding}"
+
+
+def make_compressor(coding):
+    """Return a streaming compressor with compress()/flush() for a content-coding."""
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESS_LEVEL_ZSTD).compressobj()
+    return zlib.compressobj(COMPRESS_LEVEL_GZIP, zlib.DEFLATED, 31)  # wbits=31: gzip container
+
+
+def iter_compressed(f, coding, cache_key):
+    """
+    Yield the encoded content of f piece by piece. The same bytes are teed into
+    the compressed-variant cache, and the entry is kept only if the whole file
+    was encoded; an abandoned download discards it.
+    """
+    compressor = make_compressor(coding)
+    temp_path = out = None
+    if os.fstat(f.fileno()).st_size <= compressed_cache.max_bytes:
+        try:
+            temp_path, out = compressed_cache.create_temp()
+        except OSError:
+            temp_path = out = None
+    completed = False
+    try:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            chunk = compressor.compress(data) if data else compressor.flush()
+            if chunk:
+                if out:
+                    out.write(chunk)
+                yield chunk
+            if not data:
+                break
+        completed = True
+    finally:
+        if out:
+            out.close()
+            if completed:
+                compressed_cache.commit(cache_key, temp_path)
+            else:
+                compressed_cache.discard(temp_path)
+
+# ==============================================================================
+# ZIP ARCHIVE DOWNLOADS
+# ==============================================================================
+class StreamSink:
+    """Write-only file object that collects what zipfile writes until it is taken."""
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.pieces)
+        self.pieces.clear()
+        return data
+
+
+def resolve_zip_selection(names):
+    """
+    Map requested file names onto FileEntry objects in UPLOAD_DIR; no names
+    means every file. Returns None if any requested file does not exist.
+    """
+    _, entries = upload_index.snapshot()
+    if not names:
+        return sorted(entries, key=lambda entry: entry.name.lower())
+    by_name = {entry.name: entry for entry in entries}
+    names = list(dict.fromkeys(names))
+    if any(name not in by_name for name in names):
+        return None
+    return [by_name[name] for name in names]
+
+
+def zip_archive_name():
+    return f"{APP_NAME}-{datetime.now():%Y%m%d-%H%M%S}.zip"
+
+
+def iter_zip_stream(entries):
+    """
+    Yield a ZIP archive of the given files piece by piece. zipfile writes to a
+    non-seekable sink, so sizes and CRCs go into data descriptors and nothing
+    touches the disk; memory use is bounded by CHUNK_SIZE. Zip64 records are
+    used for entries and archives past 4 GiB, and formats that are already
+    compressed are stored rather than deflated.
+    """
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for entry in entries:
+            try:
+                f = open(os.path.join(UPLOAD_DIR, entry.name), 'rb')
+            except OSError:
+                continue  # Deleted since the selection was made
+            with f:
+                fs = os.fstat(f.fileno())
+                info = zipfile.ZipInfo(entry.name, time.localtime(max(fs.st_mtime, 315532800))[:6])  # ZIP dates start in 1980
+                info.file_size = fs.st_size  # Lets zipfile decide on Zip64 up front
+                info.external_attr = (fs.st_mode & 0xFFFF) << 16
+                stored = os.path.splitext(entry.name)[1].lower() in ZIP_STORED_EXTENSIONS
+                info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                remaining = fs.st_size
+                with archive.open(info, 'w') as member:
+                    while remaining > 0:
+                        data = f.read(min(CHUNK_SIZE, remaining))
+                        if not data:
+                            break
+                        remaining -= len(data)
+                        member.write(data)
+                        chunk = sink.take()
+                        if chunk:
+                            yield chunk
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    yield sink.take()
+
+# ==============================================================================
+# THUMBNAILS
+# ==============================================================================
+def render_thumbnail(source_path, dest_path, width, fmt):
+    """
+    Scale an image down to `width` pixels wide and save it to dest_path in
+    `fmt` ("webp" or "jpeg"). Runs in a process of the thumbnail pool, which
+    is the only place Pillow gets imported.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # JPEG decoders can scale by 1/2..1/8 while reading, far cheaper than resizing
+        image.draft('RGB', (width, width))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width * 8), Image.LANCZOS)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        if fmt == "webp" and has_alpha:
+            image = image.convert('RGBA')
+        elif has_alpha:
+            # JPEG has no alpha channel: flatten onto white
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(dest_path, THUMB_FORMATS[fmt][0], quality=THUMB_QUALITY)
+
+
+def thumbnail_source(url_path):
+    """Map /thumb/<name> onto an image file in UPLOAD_DIR, or None."""
+    name = unquote(url_path[len('/thumb/'):])
+    if not name or name != os.path.basename(name) or name in ('.', '..') or name == INTERNAL_DIR_NAME:
+        return None
+    if os.path.splitext(name)[1].lower() not in THUMB_SOURCE_EXTENSIONS:
+        return None
+    path = os.path.join(UPLOAD_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def choose_thumbnail_request(query, accept):
+    """Return (width, format) for a thumbnail request: ?w= snapped up to THUMB_WIDTHS, WebP when accepted."""
+    try:
+        requested = int(parse_qs(query).get('w', [THUMB_DEFAULT_WIDTH])[0])
+    except ValueError:
+        requested = THUMB_DEFAULT_WIDTH
+    width = next((w for w in THUMB_WIDTHS if w >= requested), THUMB_WIDTHS[-1])
+    return width, ("webp" if 'image/webp' in (accept or '') else "jpeg")
+
+
+def thumbnail_key(path, fs, width, fmt):
+    return f"{os.path.abspath(path)}|{fs.st_mtime_ns}|{fs.st_size}|{width}|{fmt}"
+
+
+def plan_thumbnail_response(get_header, key, fs, fmt):
+    """Headers for a thumbnail. The ETag follows the cache key, so it changes with the source file."""
+    etag = f'"t-{DiskLRUCache.entry_name(key)[:20]}"'
+    headers = {"ETag": etag, "Last-Modified": formatdate(fs.st_mtime, usegmt=True),
+               "Cache-Control": "no-cache", "Vary": "Accept"}
+    if is_not_modified(get_header, etag, fs):
+        return HTTPStatus.NOT_MODIFIED, headers
+    headers["Content-Type"] = THUMB_FORMATS[fmt][1]
+    return HTTPStatus.OK, headers
+
+
+class ThumbnailService:
+    """
+    Renders thumbnails in a pool of worker processes, so decoding large photos
+    neither blocks the server threads nor holds the GIL, and keeps the results
+    in a DiskLRUCache. Concurrent requests for the same thumbnail share one
+    render. Freshly uploaded images are queued for pre-generation, which only
+    uses pool processes that on-demand requests leave idle.
+    """
+    def __init__(self, max_workers=THUMB_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.cache = DiskLRUCache("thumbs", THUMB_CACHE_MAX_BYTES)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = {}  # cache key -> Future completed once the thumbnail is cached
+        self.backlog = deque()  # uploaded files waiting to be pre-generated
+        self.pregenerating = 0
+        self.available = None
+
+    def is_available(self):
+        """Whether Pillow is installed; checked without importing it into the server process."""
+        if self.available is None:
+            self.available = importlib.util.find_spec("PIL") is not None
+        return self.available
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # Spawned rather than forked: the server process runs many threads
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def generate(self, path, key, width, fmt):
+        """Return a Future that completes once the thumbnail for key is in the cache."""
+        with self.lock:
+            future = self.pending.get(key)
+            if future:
+                return future
+            future = self.pending[key] = concurrent.futures.Future()
+        try:
+            temp_path, f = self.cache.create_temp()
+            f.close()
+            job = self.get_executor().submit(render_thumbnail, path, temp_path, width, fmt)
+        except Exception as e:
+            self.finish(key, future, error=e)
+            return future
+        job.add_done_callback(lambda job: self.finish(key, future, temp_path, job))
+        return future
+
+    def finish(self, key, future, temp_path=None, job=None, error=None):
+        if job is not None:
+            error = concurrent.futures.CancelledError() if job.cancelled() else job.exception()
+            if error is None:
+                self.cache.commit(key, temp_path)
+            else:
+                self.cache.discard(temp_path)
+                if isinstance(error, BrokenProcessPool):
+                    with self.lock:
+                        self.executor = None  # A worker died; start a fresh pool next time
+        with self.lock:
+            self.pending.pop(key, None)
+        if error is None:
+            future.set_result(key)
+        else:
+            future.set_exception(error)
+        self.pump()
+
+    def open(self, path, key, width, fmt):
+        """Return the cached thumbnail for key opened for reading, rendering it first if needed. Blocks."""
+        f = self.cache.open(key)
+        if f is None:
+            self.generate(path, key, width, fmt).result()
+            f = self.cache.open(key)
+        return f
+
+    def schedule(self, name):
+        """Queue a newly uploaded file for pre-generation of its default thumbnail."""
+        if os.path.splitext(name)[1].lower() in THUMB_SOURCE_EXTENSIONS and self.is_available():
+            with self.lock:
+                self.backlog.append(name)
+            self.pump()
+
+    def pump(self):
+        """Feed the backlog into the pool while it has processes to spare."""
+        while True:
+            with self.lock:
+                if not self.backlog or max(self.pregenerating, len(self.pending)) >= self.max_workers:
+                    return
+                name = self.backlog.popleft()
+                self.pregenerating += 1
+            path = os.path.join(UPLOAD_DIR, name)
+            try:
+                fs = os.stat(path)
+            except OSError:
+                self.pregenerated()
+                continue
+            width, fmt = THUMB_DEFAULT_WIDTH, THUMB_PREGENERATE_FORMAT
+            key = thumbnail_key(path, fs, width, fmt)
+            if self.cache.contains(key):
+                self.pregenerated()
+                continue
+            self.generate(path, key, width, fmt).add_done_callback(lambda future: self.pregenerated(True))
+
+    def pregenerated(self, pump=False):
+        with self.lock:
+            self.pregenerating -= 1
+        if pump:
+            self.pump()
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            self.backlog.clear()
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+thumbnails = ThumbnailService()
+atexit.register(thumbnails.shutdown)
+
+# ==============================================================================
+# PEER SYNC
+# ==============================================================================
+def build_manifest():
+    """
+    Describe every file in UPLOAD_DIR for peers pulling from this instance:
+    name, size, mtime, SHA-256 and the ETag to resume downloads against.
+    Hashes come from the content index; files it doesn't know yet are hashed
+    once and remembered.
+    """
+    generation, entries = upload_index.snapshot()
+    files = []
+    for entry in sorted(entries, key=lambda entry: entry.name):
+        try:
+            digest = content_index.digest(entry.name)
+            fs = os.stat(os.path.join(UPLOAD_DIR, entry.name))
+        except OSError:
+            continue  # Removed meanwhile
+        files.append({"name": entry.name, "size": fs.st_size, "mtime": fs.st_mtime, "sha256": digest,
+                      "etag": make_etag(fs)})
+    return {"status": "success", "generation": generation, "time": time.time(), "files": files}
+
+
+class PeerSync:
+    """
+    Pulls new and changed files from another NexusShare instance into
+    UPLOAD_DIR, one way: the peer's copy of a name wins, and files only
+    present here are left alone.
+
+    Each pass fetches the peer's /api/manifest and compares it with the local
+    files by size and SHA-256. Content already stored here under another name
+    is hard-linked instead of transferred. The rest is downloaded, several
+    files at a time, into the internal incoming directory; an interrupted
+    download is resumed with a Range request (guarded by If-Range), and only
+    a file whose hash matches the manifest replaces the local copy.
+    """
+    def __init__(self, peer_url, parallel=SYNC_PARALLEL, nexus_app=None):
+        parsed = urlparse(peer_url if '://' in peer_url else f"http://{peer_url}")
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise ValueError(f"Invalid peer URL: {peer_url}")
+        self.peer = f"{parsed.scheme}://{parsed.netloc}{parsed.path.rstrip('/')}"
+        self.scheme, self.host, self.port = parsed.scheme, parsed.hostname, parsed.port
+        self.base_path = parsed.path.rstrip('/')
+        self.parallel = max(1, parallel)
+        self.nexus_app = nexus_app
+        self.lock = threading.Lock()
+        self.received = 0  # Bytes downloaded from the peer so far
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_report = None
+
+    # --- HTTP ---
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=CLIENT_READ_TIMEOUT)
+
+    def fetch_manifest(self):
+        connection = self.connect()
+        try:
+            connection.request('GET', f"{self.base_path}/api/manifest", headers={"Accept-Encoding": "identity"})
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise OSError(f"manifest request failed with HTTP {response.status}")
+        manifest = json.loads(body)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get('files'), list):
+            raise ValueError("malformed manifest")
+        return manifest
+
+    # --- PLANNING ---
+    @staticmethod
+    def parse_item(item):
+        """Validate one manifest entry, or return None to skip it."""
+        if not isinstance(item, dict):
+            return None
+        name, digest, size = item.get('name'), str(item.get('sha256') or ''), item.get('size')
+        if not isinstance(name, str) or name != os.path.basename(name) or name in ('', '.', '..', INTERNAL_DIR_NAME) \
+                or not re.fullmatch(r'[0-9a-f]{64}', digest) or not isinstance(size, int) or size < 0:
+            return None
+        try:
+            mtime = float(item.get('mtime'))
+        except (TypeError, ValueError):
+            mtime = time.time()
+        return {"name": name, "size": size, "mtime": mtime, "sha256": digest, "etag": str(item.get('etag') or '')}
+
+    @staticmethod
+    def is_current(item):
+        """Whether the local file of that name already holds the peer's content."""
+        try:
+            return os.path.getsize(os.path.join(UPLOAD_DIR, item['name'])) == item['size'] \
+                and content_index.digest(item['name']) == item['sha256']
+        except OSError:
+            return False
+
+    @staticmethod
+    def link_existing(item):
+        """Store a missing file by hard-linking identical local content. Returns whether it worked."""
+        if os.path.lexists(os.path.join(UPLOAD_DIR, item['name'])):
+            return False  # A changed file: claiming would store the content under a new name
+        name, dedup = content_index.claim(item['name'], item['sha256'], item['size'])
+        if dedup != "linked":
+            return False
+        upload_index.add(name)
+        thumbnails.schedule(name)
+        return True
+
+    # --- TRANSFERS ---
+    def part_path(self, item):
+        key = hashlib.sha1(f"{self.peer}\0{item['name']}\0{item['sha256']}".encode('utf-8')).hexdigest()
+        return os.path.join(disk_writer.incoming_dir(), f"sync-{key}.part")
+
+    def download(self, item, part):
+        """
+        Fetch whatever `part` is still missing of `item` and return the SHA-256
+        of the complete file. A resumed download rehashes the part it has.
+        """
+        try:
+            offset = os.path.getsize(part)
+        except OSError:
+            offset = 0
+        if offset > item['size']:
+            offset = 0
+        hasher = hashlib.sha256()
+        if offset:
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(min(SYNC_BLOCK_SIZE, offset - f.tell())), b''):
+                    hasher.update(block)
+        if offset == item['size']:
+            return hasher.hexdigest()
+        admission.check_disk_space(item['size'] - offset)
+
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if item['etag']:
+                headers["If-Range"] = item['etag']
+        connection = self.connect()
+        try:
+            connection.request('GET', f"{self.base_path}/{quote(item['name'])}", headers=headers)
+            response = connection.getresponse()
+            if response.status == 200:
+                offset, hasher = 0, hashlib.sha256()  # Full body: the peer's file changed or ignored the range
+            elif response.status != 206 or not (response.getheader('Content-Range') or '').startswith(f"bytes {offset}-"):
+                raise OSError(f"download failed with HTTP {response.status}")
+            with open(part, 'r+b' if offset else 'wb') as f:
+                f.seek(offset)
+                f.truncate()
+                for block in iter(lambda: response.read(SYNC_BLOCK_SIZE), b''):
+                    f.write(block)
+                    hasher.update(block)
+                    with self.lock:
+                        self.received += len(block)
+                if disk_writer.fsync_mode == "file":
+                    f.flush()
+                    os.fsync(f.fileno())
+                size = f.tell()
+        finally:
+            connection.close()
+        if size != item['size']:
+            raise OSError(f"transfer interrupted at {size} of {item['size']} bytes")
+        return hasher.hexdigest()
+
+    def install(self, item, part):
+        """Move a verified download over the local file of the same name."""
+        os.utime(part, (item['mtime'], item['mtime']))
+        target = os.path.join(UPLOAD_DIR, item['name'])
+        os.replace(part, target)
+        if disk_writer.fsync_mode == "file":
+            fsync_path(UPLOAD_DIR, directory=True)
+        elif disk_writer.fsync_mode == "batch":
+            disk_writer.schedule_fsync(target)
+        content_index.add(item['name'], item['sha256'])
+        upload_index.add(item['name'])
+        thumbnails.schedule(item['name'])
+
+    def transfer(self, item):
+        """Download one file, resuming after interruptions, and install it."""
+        part = self.part_path(item)
+        for attempt in range(SYNC_RETRIES + 1):
+            if self.stop_event.is_set():
+                raise OSError("sync stopped")
+            try:
+                digest = self.download(item, part)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == SYNC_RETRIES:
+                    raise
+                self.log_message(f"Sync of {item['name']} interrupted ({e}), resuming")
+                time.sleep(SYNC_RETRY_DELAY * 2 ** attempt)
+        if digest != item['sha256']:
+            os.remove(part)
+            raise ValueError("content does not match the peer's manifest")
+        self.install(item, part)
+
+    # --- PASSES ---
+    def run_once(self):
+        """
+        One sync pass. Returns a report with the files transferred, linked and
+        failed, the bytes and throughput of the transfers, and the lag: how
+        long after the peer stored a file it became available here.
+        """
+        started = time.time()
+        with self.lock:
+            received_before = self.received
+        manifest = self.fetch_manifest()
+        fetched = time.time()
+        # Lags are measured on the peer's clock up to the manifest, on ours after it
+        try:
+            peer_time = float(manifest.get('time') or fetched)
+        except (TypeError, ValueError):
+            peer_time = fetched
+        items = [item for item in map(self.parse_item, manifest['files']) if item]
+        pending, deferred, digests = [], [], set()
+        for item in items:
+            if self.is_current(item):
+                continue
+            if item['sha256'] in digests:
+                deferred.append(item)  # Same content as a file in this pass: linked once that one is here
+            else:
+                digests.add(item['sha256'])
+                pending.append(item)
+
+        report = {"peer": self.peer, "files": len(items), "transferred": 0, "linked": 0, "failed": 0}
+        lags = []
+
+        def done(item, linked):
+            report["linked" if linked else "transferred"] += 1
+            lags.append(max(0.0, peer_time - item['mtime']) + time.time() - fetched)
+
+        transfers = []
+        for item in pending:
+            if self.link_existing(item):
+                done(item, True)
+            else:
+                transfers.append(item)
+        with concurrent.futures.ThreadPoolExecutor(self.parallel, thread_name_prefix="nexus-sync") as pool:
+            futures = {pool.submit(self.transfer, item): item for item in transfers}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    future.result()
+                except (OSError, ValueError, http.client.HTTPException, ApiError) as e:
+                    report["failed"] += 1
+                    self.log_message(f"Sync of {item['name']} from {self.peer} failed: {e}")
+                else:
+                    done(item, False)
+                    self.log_message(f"File synced: {item['name']} ({item['size']} bytes)")
+        for item in deferred:
+            if self.is_current(item) or self.link_existing(item):
+                done(item, True)
+            else:
+                try:
+                    self.transfer(item)
+                except (OSError, ValueError, http.client.HTTPException, ApiError) as e:
+                    report["failed"] += 1
+                    self.log_message(f"Sync of {item['name']} from {self.peer} failed: {e}")
+                else:
+                    done(item, False)
+
+        elapsed = max(time.time() - started, 1e-6)
+        with self.lock:
+            report["bytes"] = self.received - received_before
+        report.update(seconds=round(elapsed, 3), throughput=report["bytes"] / elapsed,
+                      lag_max=max(lags, default=0.0), lag_avg=sum(lags) / len(lags) if lags else 0.0,
+                      finished=time.time())
+        self.last_report = report
+        metrics.record_sync(report)
+        self.log_message(
+            f"Sync from {self.peer}: {report['transferred']} transferred, {report['linked']} linked, "
+            f"{report['failed']} failed of {report['files']} file(s); {report['bytes'] / 1024 ** 2:.1f} MB in "
+            f"{elapsed:.1f}s ({report['throughput'] / 1024 ** 2:.1f} MB/s); "
+            f"lag max {report['lag_max']:.1f}s, avg {report['lag_avg']:.1f}s")
+        return report
+
+    def run(self, interval=SYNC_INTERVAL):
+        """Sync every `interval` seconds until stopped."""
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                self.log_message(f"Sync from {self.peer} failed: {e}")
+            if self.stop_event.wait(interval):
+                break
+
+    def start(self, interval=SYNC_INTERVAL):
+        self.thread = threading.Thread(target=self.run, args=(interval,), name="nexus-peer-sync", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def log_message(self, message):
+        """Send a log line to the GUI (or console) and the log file, like the request handlers do."""
+        message = f"[{time.strftime('%d/%b/%Y %H:%M:%S')}] {message}\n"
+        if self.nexus_app:
+            self.nexus_app.log_to_gui(message)
+        log_writer.write(message)
+
+# ==============================================================================
+# CUSTOM HTTP REQUEST HANDLER
+# ==============================================================================
+class NexusShareHandler(SimpleHTTPRequestHandler):
+    """
+    Custom HTTP request handler to serve the upload page and process file uploads.
+    """
+    def __init__(self, *args, **kwargs):
+        # Ensure the upload directory exists
+        if not os.path.exists(UPLOAD_DIR):
+            os.makedirs(UPLOAD_DIR)
+        super().__init__(*args, directory=UPLOAD_DIR, **kwargs)
+
+    # Persistent connections: every response is framed by Content-Length or
+    # chunked encoding, and anything that leaves a body unread closes instead
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't let the body wait for an ACK
+    request_timer = None
+    requests_served = 0
+
+    # --- CONNECTION HANDLING & METRICS ---
+    def setup(self):
+        self.timeout = connection_limits.read_timeout  # Applied to the socket by StreamRequestHandler
+        super().setup()
+        self.rfile = MeteredReader(self.rfile, self.client_address[0])
+        self.wfile = MeteredWriter(self.wfile, self.client_address[0])
+        metrics.connection_opened()
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            metrics.connection_closed()
+
+    def parse_request(self):
+        # Called once the request line has arrived, so idle keep-alive time is not counted
+        self.request_timer = RequestTimer()
+        result = super().parse_request()
+        self.rfile.body_start = self.rfile.consumed
+        return result
+
+    def handle_one_request(self):
+        if self.requests_served and not self.wait_for_next_request():
+            self.close_connection = True
+            return
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_timer:
+                metrics.finish_request(route_label(self.command, self.path), self.request_timer)
+                self.request_timer = None
+                self.requests_served += 1
+
+    def wait_for_next_request(self):
+        """Wait up to the keep-alive timeout for another request on this connection."""
+        try:
+            self.connection.settimeout(connection_limits.idle_timeout)
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            try:
+                self.connection.settimeout(self.timeout)
+            except OSError:
+                pass
+
+    def send_response(self, code, message=None):
+        if self.request_timer:
+            self.request_timer.mark_response(code)
+        super().send_response(code, message)
+        if self.close_connection or self.requests_served + 1 >= connection_limits.max_requests or self.workers_busy():
+            self.send_header("Connection", "close")
+
+    def workers_busy(self):
+        """True when other connections are queued for a worker, so this one should not be kept."""
+        request_queue = getattr(self.server, 'request_queue', None)
+        return bool(request_queue and request_queue.qsize())
+
+    def discard_request_body(self):
+        """
+        Read and drop what is left of a refused request's body, within
+        REFUSED_BODY_DISCARD_LIMIT and REFUSED_BODY_LINGER, so the client gets
+        to read the error response instead of a connection reset.
+        """
+        try:
+            remaining = self.rfile.unread_body(int(self.headers.get('Content-Length', 0)))
+        except (TypeError, ValueError):
+            return
+        if not 0 < remaining <= REFUSED_BODY_DISCARD_LIMIT:
+            return
+        deadline = time.monotonic() + REFUSED_BODY_LINGER
+        try:
+            self.connection.settimeout(REFUSED_BODY_LINGER)
+            while remaining > 0 and time.monotonic() < deadline:
+                data = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+        except OSError:
+            pass
+
+    def handle_expect_100(self):
+        """Refuse an oversized upload before the client sends its body."""
+        if self.command in ('POST', 'PUT'):
+            try:
+                admission.check_request(int(self.headers.get('Content-Length', 0)))
+            except ApiError as e:
+                self.close_connection = True
+                self.send_json_response({"status": "error", "message": str(e)}, status=e.status)
+                return False
+            except ValueError:
+                pass
+        return super().handle_expect_100()
+
+    def sendfile(self, f, offset=0, count=None):
+        """socket.sendfile, counted in the sent-bytes metric and paced by the download limits."""
+        if not bandwidth.limited("download"):
+            metrics.add_bytes_out(self.connection.sendfile(f, offset, count))
+            return
+        if count is None:
+            count = os.fstat(f.fileno()).st_size - offset
+        while count > 0:
+            sent = self.connection.sendfile(f, offset, min(CHUNK_SIZE, count))
+            if not sent:
+                break
+            offset += sent
+            count -= sent
+            metrics.add_bytes_out(sent)
+            delay = bandwidth.delay("download", self.client_address[0], sent)
+            if delay:
+                time.sleep(delay)
+
+    def do_GET(self):
+        """Handle GET requests."""
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/':
+            self.send_upload_page()
+        elif parsed_path.path.startswith('/api/uploads'):
+            self.handle_upload_api('GET', parsed_path.path)
+        elif parsed_path.path == '/api/zip':
+            self.send_zip_archive(parse_qs(parsed_path.query).get('file', []))
+        elif parsed_path.path == '/api/search':
+            self.send_search_results(parsed_path.query)
+        elif parsed_path.path == '/api/manifest':
+            self.send_json_response(build_manifest())
+        elif parsed_path.path == '/api/files':
+            self.send_file_listing(parsed_path.query)
+        elif parsed_path.path == '/metrics':
+            self.send_metrics()
+        elif parsed_path.path.startswith('/thumb/'):
+            self.send_thumbnail(parsed_path)
+        elif is_internal_path(self.translate_path(self.path)):
+            self.send_error(404, "File not found")
+        elif not self.send_file():
+            # Directories and redirects are handled by SimpleHTTPRequestHandler
+            super().do_GET()
+
+    def do_HEAD(self):
+        """Handle HEAD requests, keeping the internal directory hidden."""
+        path = urlparse(self.path).path
+        if path == '/':
+            self.send_upload_page(head_only=True)
+        elif is_internal_path(self.translate_path(self.path)):
+            self.send_error(404, "File not found")
+        elif not self.send_file(head_only=True):
+            super().do_HEAD()
+
+    def list_directory(self, path):
+        """SimpleHTTPRequestHandler.list_directory, leaving out the internal directory."""
+        try:
+            names = sorted(os.listdir(path), key=str.lower)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "No permission to list directory")
+            return None
+        if os.path.abspath(path) == os.path.abspath(UPLOAD_DIR) and INTERNAL_DIR_NAME in names:
+            names.remove(INTERNAL_DIR_NAME)
+        try:
+            display_path = unquote(self.path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            display_path = unquote(self.path)
+        title = f"Directory listing for {html.escape(display_path, quote=False)}"
+        encoding = sys.getfilesystemencoding()
+        lines = ['<!DOCTYPE HTML>', '<html lang="en">', '<head>', f'<meta charset="{encoding}">',
+                 f'<title>{title}</title>\n</head>', f'<body>\n<h1>{title}</h1>', '<hr>\n<ul>']
+        for name in names:
+            full_name = os.path.join(path, name)
+            display_name = link_name = name + "/" if os.path.isdir(full_name) else name
+            if os.path.islink(full_name):
+                display_name = name + "@"
+            lines.append(f'<li><a href="{quote(link_name, errors="surrogatepass")}">'
+                         f'{html.escape(display_name, quote=False)}</a></li>')
+        lines.append('</ul>\n<hr>\n</body>\n</html>\n')
+        encoded = '\n'.join(lines).encode(encoding, 'surrogateescape')
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", f"text/html; charset={encoding}")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        return BytesIO(encoded)
+
+    def send_upload_page(self, head_only=False):
+        """Serve the pre-encoded upload page."""
+        status, headers, body = UPLOAD_PAGE.plan_response(self.headers.get)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only and body:
+            self.wfile.write(body)
+        if status == HTTPStatus.OK:
+            self.log_message("Served upload page.")
+
+    def send_file(self, head_only=False):
+        """
+        Serve a regular file from UPLOAD_DIR with Range/If-Range support, sending
+        the body with socket.sendfile (zero-copy os.sendfile where available).
+        Returns False if the path is not a regular file.
+        """
+        path = self.translate_path(self.path)
+        hot = hot_files.get(path, self.headers.get) if not path.endswith('/') else None
+        if hot:
+            self.send_hot_file(hot, head_only)
+            return True
+        if not os.path.isfile(path) or path.endswith('/'):
+            return False
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return True
+
+        with f:
+            fs = os.fstat(f.fileno())
+            content_type = self.guess_type(path)
+            coding = choose_download_encoding(self.headers.get, fs, content_type)
+            if coding:
+                self.send_compressed_file(f, path, fs, content_type, coding, head_only)
+                return True
+            hot = hot_files.load(path, f, fs, content_type)
+            if hot:
+                self.send_hot_file(hot, head_only)
+                return True
+
+            status, headers, parts = plan_file_response(self.headers.get, fs, content_type)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if head_only:
+                return True
+            for preamble, offset, count in parts:
+                if preamble:
+                    self.wfile.write(preamble)
+                if count:
+                    self.sendfile(f, offset, count)
+        return True
+
+    def send_hot_file(self, hot, head_only=False):
+        """Serve a file from the memory cache (see HotFileCache)."""
+        status, headers, chunks = hot.plan(self.headers.get)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only:
+            if bandwidth.limited("download"):
+                chunks = HotFile.pieces(chunks)
+            for chunk in chunks:
+                self.wfile.write(chunk)
+
+    def send_metrics(self):
+        """Serve the metrics in the Prometheus text format."""
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_streamed(self, status, headers, chunks):
+        """
+        Send a body of unknown length produced by the `chunks` iterator, using
+        chunked transfer encoding for HTTP/1.1 clients and closing the
+        connection after it otherwise. Returns False if it was cut short.
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        if not chunked:
+            self.close_connection = True
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+            return True
+        except Exception as e:
+            # Headers are out, so the only way to signal the failure is to drop the connection
+            self.close_connection = True
+            self.log_message(f"Streamed response interrupted: {e}")
+            return False
+        finally:
+            chunks.close()
+
+    def send_zip_archive(self, names):
+        """Stream a ZIP of the named files (or of all files)."""
+        entries = resolve_zip_selection(names)
+        if entries is None:
+            self.send_error(404, "File not found")
+            return
+        headers = {"Content-Type": "application/zip",
+                   "Content-Disposition": f'attachment; filename="{zip_archive_name()}"',
+                   "Cache-Control": "no-store"}
+        if self.send_streamed(200, headers, iter_zip_stream(entries)):
+            self.log_message(f"Served ZIP archive of {len(entries)} file(s).")
+
+    def send_compressed_file(self, f, path, fs, content_type, coding, head_only=False):
+        """
+        Send a file with a content-coding: from the compressed-variant cache if
+        present, otherwise encoded on the fly and streamed.
+        """
+        status, headers = plan_compressed_response(self.headers.get, fs, content_type, coding)
+        key = compressed_variant_key(path, fs, coding)
+        cached = compressed_cache.open(key) if status == HTTPStatus.OK else None
+        if status == HTTPStatus.OK and not cached and not head_only:
+            self.send_streamed(status, headers, iter_compressed(f, coding, key))
+            return
+        if cached:
+            headers["Content-Length"] = str(os.fstat(cached.fileno()).st_size)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if cached:
+            with cached:
+                if not head_only:
+                    self.sendfile(cached)
+
+    def send_thumbnail(self, parsed_path):
+        """Serve /thumb/<name>?w=<width>, rendering and caching the thumbnail on first use."""
+        path = thumbnail_source(parsed_path.path)
+        if not path:
+            self.send_error(404, "No thumbnail for this file")
+            return
+        if not thumbnails.is_available():
+            self.send_error(501, "Thumbnails need Pillow, which is not installed")
+            return
+        width, fmt = choose_thumbnail_request(parsed_path.query, self.headers.get('Accept'))
+        try:
+            fs = os.stat(path)
+        except OSError:
+            self.send_error(404, "No thumbnail for this file")
+            return
+        key = thumbnail_key(path, fs, width, fmt)
+        status, headers = plan_thumbnail_response(self.headers.get, key, fs, fmt)
+        cached = None
+        if status == HTTPStatus.OK:
+            try:
+                cached = thumbnails.open(path, key, width, fmt)
+            except Exception as e:
+                self.log_message(f"Thumbnail of {os.path.basename(path)} failed: {e}")
+                self.send_error(500, "Could not generate a thumbnail for this file")
+                return
+            if not cached:
+                self.send_error(503, "Thumbnail was evicted from the cache, please retry")
+                return
+            headers["Content-Length"] = str(os.fstat(cached.fileno()).st_size)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if cached:
+            with cached:
+                self.sendfile(cached)
+
+    def do_PUT(self):
+        """Handle PUT requests carrying chunks of a resumable upload."""
+        self.handle_upload_api('PUT', urlparse(self.path).path)
+
+    def do_POST(self):
+        """Handle POST requests for file uploads."""
+        parsed_path = urlparse(self.path)
+        if parsed_path.path.startswith('/api/uploads'):
+            self.handle_upload_api('POST', parsed_path.path)
+            return
+
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            self.send_error(400, "Bad Request: Content-Type must be multipart/form-data")
+            return
+
+        try:
+            admission.check_request(int(self.headers.get('Content-Length', 0)))
+            # Parse multipart form data, streaming each file to disk as it arrives
+            saver = self.parse_multipart()
+            saver.log_results(self.log_message)
+            status, response = saver.response()
+            self.send_json_response(response, status=status)
+
+        except ApiError as e:
+            # Refused before reading the body, which is left unread
+            self.close_connection = True
+            self.log_message(f"Upload refused: {e}")
+            self.send_json_response({"status": "error", "message": str(e)}, status=e.status)
+            self.discard_request_body()
+        except ConnectionError as e:
+            self.close_connection = True
+            self.log_message(f"Upload interrupted: {e}")
+        except Exception as e:
+            self.close_connection = True  # The rest of the body may still be unread
+            self.log_message(f"Error during upload: {e}")
+            self.send_json_response({"status": "error", "message": f"Server error: {e}"})
+
+    def parse_multipart(self):
+        """
+        Parse multipart/form-data incrementally, writing file parts straight
+        into UPLOAD_DIR in CHUNK_SIZE pieces. Returns the MultipartFileSaver
+        holding the per-file results.
+        """
+        content_length = int(self.headers.get('Content-Length', 0))
+        boundary = get_multipart_boundary(self.headers.get('Content-Type'))
+
+        saver = MultipartFileSaver(self.request_timer)
+        parser = MultipartParser(boundary, saver.begin_part, saver.write, saver.end_part)
+        remaining = content_length
+        try:
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ConnectionError("Client disconnected during upload")
+                remaining -= len(chunk)
+                parser.feed(chunk)
+            parser.close()
+        except Exception:
+            saver.abort()
+            raise
+
+        return saver
+
+    def handle_upload_api(self, method, path):
+        """
+        Resumable chunked upload API:
+          POST /api/uploads                    create a session {name, size, chunk_size?, key?}
+          GET  /api/uploads/<id>               list the chunks already received
+          PUT  /api/uploads/<id>/<index>       store one chunk
+          POST /api/uploads/<id>/complete      move the finished file into UPLOAD_DIR
+          POST /api/uploads/preflight          skip files whose content is already stored {files: [{name, size, sha256}]}
+        """
+        try:
+            segments = parse_upload_api_path(path)
+            if segments is None:
+                raise ApiError(404, "Not found.")
+
+            if method == 'POST' and not segments:
+                request = self.read_json_body()
+                session = chunked_uploads.create(request.get('name'), request.get('size'),
+                                                 request.get('chunk_size'), request.get('key'))
+                self.send_json_response(ChunkedUploadManager.describe(session))
+
+            elif method == 'GET' and len(segments) == 1:
+                self.send_json_response(ChunkedUploadManager.describe(chunked_uploads.get(segments[0])))
+
+            elif method == 'PUT' and len(segments) == 2 and segments[1].isdigit():
+                length = int(self.headers.get('Content-Length', 0))
+                admission.check_request(length)
+                session = chunked_uploads.write_chunk(segments[0], int(segments[1]), length, self.rfile.read,
+                                                     self.request_timer)
+                self.send_json_response({"status": "success", "received": len(session['received']),
+                                         "total_chunks": session['total_chunks']})
+
+            elif method == 'POST' and segments == ['preflight']:
+                response = preflight_uploads(self.read_json_body())
+                for result in response['files']:
+                    if result['status'] == "linked":
+                        self.log_message(f"File uploaded: {result['filename']}{dedup_note('linked')}")
+                self.send_json_response(response)
+
+            elif method == 'POST' and segments[1:] == ['complete']:
+                filename, dedup = chunked_uploads.complete(segments[0])
+                self.log_message(f"File uploaded: {filename}{dedup_note(dedup)}")
+                self.send_json_response({"status": "success", "message": "Successfully uploaded 1 file(s).",
+                                         "files": [filename], "dedup": dedup})
+            else:
+                raise ApiError(404, "Not found.")
+
+        except ApiError as e:
+            # The request body was not consumed, so the connection cannot be reused
+            self.close_connection = True
+            self.send_json_response({"status": "error", "message": str(e)}, status=e.status)
+            self.discard_request_body()
+        except ConnectionError as e:
+            self.close_connection = True
+            self.log_message(f"Chunk upload interrupted: {e}")
+        except Exception as e:
+            self.close_connection = True
+            self.log_message(f"Error during chunked upload: {e}")
+            self.send_json_response({"status": "error", "message": f"Server error: {e}"}, status=500)
+
+    def send_file_listing(self, query_string):
+        try:
+            status, headers, body = plan_listing_response(self.headers.get, query_string)
+        except ApiError as e:
+            self.send_json_response({"status": "error", "message": str(e)}, status=e.status)
+            return
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def send_search_results(self, query_string):
+        try:
+            self.send_json_response(search_uploads(query_string))
+        except ApiError as e:
+            self.send_json_response({"status": "error", "message": str(e)}, status=e.status)
+
+    def read_json_body(self):
+        """Read and decode a small JSON request body."""
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_JSON_BODY_SIZE:
+            raise ApiError(413, "Request body too large.")
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise ApiError(400, "Invalid JSON body.")
+
+    def send_json_response(self, data, status=200):
+        """Send a JSON response."""
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Override log_message to send logs to the GUI."""
+        message = f"[{self.log_date_time_string()}] {format % args}\n"
+        if hasattr(self.server, 'nexus_app') and self.server.nexus_app:
+            self.server.nexus_app.log_to_gui(message)
+        # Also log to a file, through the background writer
+        log_writer.write(message)
+
+# ==============================================================================
+# THREADED SERVER WITH A BOUNDED WORKER POOL
+# ==============================================================================
+class NexusShareServer(HTTPServer):
+    """
+    HTTPServer that serves connections concurrently on a fixed pool of worker
+    threads. Connections beyond max_workers wait in a queue of max_queue
+    entries; once that is full they are rejected with 503 Service Unavailable.
+    """
+    def __init__(self, server_address, handler_class, max_workers=DEFAULT_MAX_WORKERS, max_queue=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = self.max_workers * 4 if max_queue is None else max(1, int(max_queue))
+        self.request_queue = queue.Queue()
+        # One slot per worker plus one per queued connection
+        self.slots = threading.Semaphore(self.max_workers + self.max_queue)
+        self.workers = []
+        super().__init__(server_address, handler_class)
+
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self.worker_loop, name=f"nexus-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def process_request(self, request, client_address):
+        """Queue the connection for the next free worker instead of serving it inline."""
+        if not self.slots.acquire(blocking=False):
+            self.reject_request(request)
+            self.shutdown_request(request)
+            return
+        self.request_queue.put((request, client_address))
+
+    def worker_loop(self):
+        while True:
+            item = self.request_queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.slots.release()
+
+    def reject_request(self, request):
+        body = b"Server is busy, please retry shortly.\n"
+        try:
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\n"
+                b"Content-Type: text/plain\r\n"
+                b"Retry-After: 1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+
+    def server_close(self):
+        """Close the listening socket, drop queued connections and stop the workers."""
+        super().server_close()
+        while True:
+            try:
+                item = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+                self.slots.release()
+        for _ in self.workers:
+            self.request_queue.put(None)
+        self.workers = []
+
+# ==============================================================================
+# ASYNCIO SERVER ENGINE
+# ==============================================================================
+class AsyncNexusServer:
+    """
+    Alternative server engine built on asyncio streams. It serves the same
+    routes as NexusShareHandler (the upload page, multipart POST to '/' and
+    file downloads from UPLOAD_DIR) with HTTP/1.1 keep-alive, so thousands of
+    idle clients cost a coroutine each instead of a thread.
+
+    It exposes serve_forever()/shutdown()/server_close() like HTTPServer so
+    the application can drive either engine the same way.
+    """
+    def __init__(self, server_address):
+        self.nexus_app = None
+        self.loop = asyncio.new_event_loop()
+        self.stopped = threading.Event()
+        # Bind right away so address errors surface to the caller, like HTTPServer
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle_connection, server_address[0], server_address[1], limit=MAX_PART_HEADER_SIZE)
+        )
+        self.server_address = self.server.sockets[0].getsockname()[:2]
+
+    # --- LIFECYCLE ---
+    def serve_forever(self):
+        """Run the event loop in the calling thread until shutdown() is called."""
+        asyncio.set_event_loop(self.loop)
+        self.stopped.clear()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.stopped.set()
+
+    def shutdown(self):
+        """Stop the event loop and wait for serve_forever() to return."""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.stopped.wait(timeout=5)
+
+    def server_close(self):
+        """Close the listening socket and every open connection."""
+        if self.loop.is_closed():
+            return
+        self.server.close()
+        tasks = [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    # --- CONNECTION HANDLING ---
+    current_request = contextvars.ContextVar("current_request", default=None)  # RequestTimer of this connection's task
+    request_version = contextvars.ContextVar("request_version", default="HTTP/1.0")  # HTTP version of that request
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else None
+        reader, writer = AsyncMeteredReader(reader, client), AsyncMeteredWriter(writer, client)
+        metrics.connection_opened()
+        try:
+            keep_alive = True
+            served = 0
+            while keep_alive:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break  # Idle keep-alive connection
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Request line longer than the StreamReader limit
+                    timer = RequestTimer()
+                    self.current_request.set(timer)
+                    await self.send_error(writer, HTTPStatus.REQUEST_URI_TOO_LONG, keep_alive=False)
+                    metrics.finish_request("other", timer)
+                    break
+                if not request_line.strip():
+                    break
+                timer = RequestTimer()
+                self.current_request.set(timer)
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    headers = await asyncio.wait_for(self.read_headers(reader), connection_limits.read_timeout)
+                except ValueError:
+                    await self.send_error(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+                    metrics.finish_request("other", timer)
+                    break
+
+                self.request_version.set(version)
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+                served += 1
+                if served >= connection_limits.max_requests:
+                    keep_alive = False
+                reader.body_start = reader.consumed
+                try:
+                    keep_alive = await self.dispatch(method, target, headers, reader, writer, keep_alive)
+                finally:
+                    metrics.finish_request(route_label(method, target), timer)
+                    self.current_request.set(None)
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Cancelled by server_close(); end the connection quietly
+        finally:
+            metrics.connection_closed()
+            writer.close()
+
+    async def read_headers(self, reader):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            if len(headers) >= 100:
+                raise ValueError("Too many headers")
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                raise ValueError("Malformed header line")
+            headers[name.strip().lower()] = value.strip()
+
+    async def dispatch(self, method, target, headers, reader, writer, keep_alive):
+        """Route one request. Returns whether the connection can be reused."""
+        path = urlparse(target).path
+        if method in ('POST', 'PUT') and headers.get('expect', '').lower() == '100-continue':
+            try:
+                admission.check_request(int(headers.get('content-length', 0)))
+            except ApiError as e:
+                await self.send_json_response(writer, {"status": "error", "message": str(e)}, False,
+                                              status=HTTPStatus(e.status))
+                return False
+            except ValueError:
+                pass
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        if method == 'GET' and path.startswith('/api/uploads'):
+            return await self.handle_upload_api(method, path, headers, reader, writer, keep_alive)
+        if method == 'GET' and path == '/metrics':
+            await self.send_response(writer, HTTPStatus.OK, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+                                     "Cache-Control": "no-store"}, metrics.render().encode('utf-8'), keep_alive)
+            return keep_alive
+        if method == 'GET' and path == '/api/zip':
+            return await self.send_zip_archive(parse_qs(urlparse(target).query).get('file', []), writer, keep_alive)
+        if method == 'GET' and path == '/api/search':
+            return await self.send_search_results(urlparse(target).query, writer, keep_alive)
+        if method == 'GET' and path == '/api/files':
+            return await self.send_file_listing(urlparse(target).query, headers, writer, keep_alive)
+        if method == 'GET' and path == '/api/manifest':
+            # Files new to the content index are hashed while building it
+            await self.send_json_response(writer, await self.loop.run_in_executor(None, build_manifest), keep_alive)
+            return keep_alive
+        if method == 'GET' and path.startswith('/thumb/'):
+            return await self.send_thumbnail(path, urlparse(target).query, headers, writer, keep_alive)
+        if method in ('GET', 'HEAD'):
+            if path == '/':
+                status, page_headers, body = UPLOAD_PAGE.plan_response(lambda name: headers.get(name.lower()))
+                content_length = int(page_headers.pop("Content-Length", 0))
+                await self.send_response(writer, status, page_headers, body if method == 'GET' else b'',
+                                         keep_alive, content_length=content_length)
+                if status == HTTPStatus.OK:
+                    self.log_message(f'"{method} {path}" 200 - Served upload page.')
+                return keep_alive
+            return await self.send_file(method, path, headers, writer, keep_alive)
+        if method == 'POST' and path == '/':
+            return await self.handle_upload(headers, reader, writer, keep_alive)
+        if method in ('POST', 'PUT') and path.startswith('/api/uploads'):
+            return await self.handle_upload_api(method, path, headers, reader, writer, keep_alive)
+        # The request body (if any) is left unread, so the connection cannot be reused
+        status = HTTPStatus.NOT_FOUND if method == 'POST' else HTTPStatus.NOT_IMPLEMENTED
+        await self.send_error(writer, status, keep_alive=False)
+        return False
+
+    async def discard_request_body(self, headers, reader):
+        """See NexusShareHandler.discard_request_body."""
+        try:
+            remaining = reader.unread_body(int(headers.get('content-length', 0)))
+        except ValueError:
+            return
+        if not 0 < remaining <= REFUSED_BODY_DISCARD_LIMIT:
+            return
+        deadline = self.loop.time() + REFUSED_BODY_LINGER
+        try:
+            while remaining > 0 and self.loop.time() < deadline:
+                data = await asyncio.wait_for(reader.read(min(CHUNK_SIZE, remaining)), deadline - self.loop.time())
+                if not data:
+                    break
+                remaining -= len(data)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    # --- ROUTES ---
+    async def handle_upload(self, headers, reader, writer, keep_alive):
+        content_type = headers.get('content-type', '')
+        if not content_type.startswith('multipart/form-data'):
+            await self.send_error(writer, HTTPStatus.BAD_REQUEST, keep_alive=False,
+                                  message="Bad Request: Content-Type must be multipart/form-data")
+            return False
+
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        saver = MultipartFileSaver(self.current_request.get())
+        remaining = int(headers.get('content-length', 0))
+        try:
+            admission.check_request(remaining)
+            parser = MultipartParser(get_multipart_boundary(content_type), saver.begin_part, saver.write, saver.end_part)
+            while remaining > 0:
+                chunk = await reader.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ConnectionError("Client disconnected during upload")
+                remaining -= len(chunk)
+                # Parsing and disk writes run off the event loop
+                await self.loop.run_in_executor(None, parser.feed, chunk)
+            parser.close()
+        except ConnectionError:
+            saver.abort()
+            raise
+        except ApiError as e:
+            saver.abort()
+            self.log_message(f"Upload refused: {e}")
+            await self.send_json_response(writer, {"status": "error", "message": str(e)}, False,
+                                          status=HTTPStatus(e.status))
+            await self.discard_request_body(headers, reader)
+            return False
+        except Exception as e:
+            saver.abort()
+            self.log_message(f"Error during upload: {e}")
+            await self.send_json_response(writer, {"status": "error", "message": f"Server error: {e}"}, keep_alive and remaining == 0)
+            return keep_alive and remaining == 0
+
+        saver.log_results(self.log_message)
+        status, response = saver.response()
+        await self.send_json_response(writer, response, keep_alive, status=HTTPStatus(status))
+        return keep_alive
+
+    async def handle_upload_api(self, method, path, headers, reader, writer, keep_alive):
+        """Resumable chunked upload API, see NexusShareHandler.handle_upload_api."""
+        length = int(headers.get('content-length', 0))
+        try:
+            segments = parse_upload_api_path(path)
+            if segments is None:
+                raise ApiError(404, "Not found.")
+
+            if method == 'POST' and not segments:
+                request = await self.read_json_body(length, reader)
+                session = await self.loop.run_in_executor(
+                    None, chunked_uploads.create, request.get('name'), request.get('size'),
+                    request.get('chunk_size'), request.get('key'))
+                result = ChunkedUploadManager.describe(session)
+
+            elif method == 'GET' and len(segments) == 1:
+                result = ChunkedUploadManager.describe(chunked_uploads.get(segments[0]))
+
+            elif method == 'PUT' and len(segments) == 2 and segments[1].isdigit():
+                if length > MAX_UPLOAD_CHUNK_SIZE:
+                    raise ApiError(413, "Chunk too large.")
+                admission.check_request(length)
+                data = await reader.readexactly(length)
+                session = await self.loop.run_in_executor(
+                    None, chunked_uploads.write_chunk, segments[0], int(segments[1]), length, BytesIO(data).read,
+                    self.current_request.get())
+                result = {"status": "success", "received": len(session['received']),
+                          "total_chunks": session['total_chunks']}
+
+            elif method == 'POST' and segments == ['preflight']:
+                request = await self.read_json_body(length, reader)
+                result = await self.loop.run_in_executor(None, preflight_uploads, request)
+                for entry in result['files']:
+                    if entry['status'] == "linked":
+                        self.log_message(f"File uploaded: {entry['filename']}{dedup_note('linked')}")
+
+            elif method == 'POST' and segments[1:] == ['complete']:
+                filename, dedup = await self.loop.run_in_executor(None, chunked_uploads.complete, segments[0])
+                self.log_message(f"File uploaded: {filename}{dedup_note(dedup)}")
+                result = {"status": "success", "message": "Successfully uploaded 1 file(s).", "files": [filename],
+                          "dedup": dedup}
+            else:
+                raise ApiError(404, "Not found.")
+
+        except ApiError as e:
+            # The request body may not have been consumed, so the connection cannot be reused
+            await self.send_json_response(writer, {"status": "error", "message": str(e)}, False,
+                                          status=HTTPStatus(e.status))
+            await self.discard_request_body(headers, reader)
+            return False
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            self.log_message(f"Error during chunked upload: {e}")
+            await self.send_json_response(writer, {"status": "error", "message": f"Server error: {e}"}, False,
+                                          status=HTTPStatus.INTERNAL_SERVER_ERROR)
+            return False
+
+        await self.send_json_response(writer, result, keep_alive)
+        return keep_alive
+
+    async def read_json_body(self, length, reader):
+        """Read and decode a small JSON request body."""
+        if length > MAX_JSON_BODY_SIZE:
+            raise ApiError(413, "Request body too large.")
+        try:
+            return json.loads(await reader.readexactly(length) or b'{}')
+        except ValueError:
+            raise ApiError(400, "Invalid JSON body.")
+
+    async def send_file(self, method, path, headers, writer, keep_alive):
+        file_path = self.translate_path(path)
+        get_header = lambda name: headers.get(name.lower())
+        hot = hot_files.get(file_path, get_header) if file_path else None
+        if hot:
+            return await self.send_hot_file(method, path, hot, get_header, writer, keep_alive)
+        if not file_path or not os.path.isfile(file_path):
+            await self.send_error(writer, HTTPStatus.NOT_FOUND, keep_alive)
+            return keep_alive
+
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            await self.send_error(writer, HTTPStatus.NOT_FOUND, keep_alive)
+            return keep_alive
+        with f:
+            fs = os.fstat(f.fileno())
+            content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+            coding = choose_download_encoding(get_header, fs, content_type)
+            if coding:
+                return await self.send_compressed_file(method, path, file_path, f, fs, content_type, coding,
+                                                       get_header, writer, keep_alive)
+            hot = await self.loop.run_in_executor(None, hot_files.load, file_path, f, fs, content_type)
+            if hot:
+                return await self.send_hot_file(method, path, hot, get_header, writer, keep_alive)
+
+            status, response_headers, parts = plan_file_response(get_header, fs, content_type)
+            content_length = int(response_headers.pop("Content-Length", 0))
+            await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=content_length)
+            if method == 'GET':
+                for preamble, offset, count in parts:
+                    if preamble:
+                        writer.write(preamble)
+                        await writer.drain()
+                    if count:
+                        await self.sendfile(writer, f, offset, count)
+        self.log_message(f'"{method} {path}" {status.value} {content_length}')
+        return keep_alive
+
+    async def send_hot_file(self, method, path, hot, get_header, writer, keep_alive):
+        """Serve a file from the memory cache; unless downloads are paced, headers and body go out in one write."""
+        status, response_headers, chunks = hot.plan(get_header)
+        content_length = int(response_headers.pop("Content-Length", 0))
+        if method == 'GET' and bandwidth.limited("download"):
+            # Written piece by piece so drain() can pace the body
+            await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=content_length)
+            for piece in HotFile.pieces(chunks):
+                writer.write(piece)
+                await writer.drain()
+        else:
+            body = b''.join(chunks) if method == 'GET' else b''
+            await self.send_response(writer, status, response_headers, body, keep_alive, content_length=content_length)
+        self.log_message(f'"{method} {path}" {status.value} {content_length}')
+        return keep_alive
+
+    async def send_zip_archive(self, names, writer, keep_alive):
+        entries = resolve_zip_selection(names)
+        if entries is None:
+            await self.send_error(writer, HTTPStatus.NOT_FOUND, keep_alive)
+            return keep_alive
+        keep_alive = await self.send_streamed(writer, HTTPStatus.OK, {"Content-Type": "application/zip",
+                                              "Content-Disposition": f'attachment; filename="{zip_archive_name()}"',
+                                              "Cache-Control": "no-store"}, iter_zip_stream(entries), keep_alive)
+        self.log_message(f'"GET /api/zip" 200 - ZIP archive of {len(entries)} file(s)')
+        return keep_alive
+
+    async def send_compressed_file(self, method, path, file_path, f, fs, content_type, coding,
+                                   get_header, writer, keep_alive):
+        """Counterpart of NexusShareHandler.send_compressed_file; encoding runs in the executor."""
+        status, response_headers = plan_compressed_response(get_header, fs, content_type, coding)
+        key = compressed_variant_key(file_path, fs, coding)
+        cached = compressed_cache.open(key) if status == HTTPStatus.OK else None
+        if cached:
+            with cached:
+                size = os.fstat(cached.fileno()).st_size
+                await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=size)
+                if method == 'GET':
+                    await self.sendfile(writer, cached, 0, size)
+        elif status != HTTPStatus.OK or method == 'HEAD':
+            await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=0)
+        else:
+            # Length unknown until encoded
+            keep_alive = await self.send_streamed(writer, status, response_headers,
+                                                  iter_compressed(f, coding, key), keep_alive)
+        self.log_message(f'"{method} {path}" {status.value} - {coding}')
+        return keep_alive
+
+    async def send_thumbnail(self, path, query, headers, writer, keep_alive):
+        """Counterpart of NexusShareHandler.send_thumbnail; the render is awaited, not waited on."""
+        source = thumbnail_source(path)
+        if not source:
+            await self.send_error(writer, HTTPStatus.NOT_FOUND, keep_alive, message="No thumbnail for this file")
+            return keep_alive
+        if not thumbnails.is_available():
+            await self.send_error(writer, HTTPStatus.NOT_IMPLEMENTED, keep_alive,
+                                  message="Thumbnails need Pillow, which is not installed")
+            return keep_alive
+        width, fmt = choose_thumbnail_request(query, headers.get('accept'))
+        try:
+            fs = os.stat(source)
+        except OSError:
+            await self.send_error(writer, HTTPStatus.NOT_FOUND, keep_alive, message="No thumbnail for this file")
+            return keep_alive
+        key = thumbnail_key(source, fs, width, fmt)
+        status, response_headers = plan_thumbnail_response(lambda name: headers.get(name.lower()), key, fs, fmt)
+        if status != HTTPStatus.OK:
+            await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=0)
+            return keep_alive
+
+        cached = thumbnails.cache.open(key)
+        if cached is None:
+            try:
+                await asyncio.wrap_future(thumbnails.generate(source, key, width, fmt))
+            except Exception as e:
+                self.log_message(f"Thumbnail of {os.path.basename(source)} failed: {e}")
+                await self.send_error(writer, HTTPStatus.INTERNAL_SERVER_ERROR, keep_alive,
+                                      message="Could not generate a thumbnail for this file")
+                return keep_alive
+            cached = thumbnails.cache.open(key)
+            if cached is None:
+                await self.send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, keep_alive,
+                                      message="Thumbnail was evicted from the cache, please retry")
+                return keep_alive
+        with cached:
+            size = os.fstat(cached.fileno()).st_size
+            await self.send_response(writer, status, response_headers, b'', keep_alive, content_length=size)
+            await self.sendfile(writer, cached, 0, size)
+        self.log_message(f'"GET {path}" {status.value} {size}')
+        return keep_alive
+
+    def translate_path(self, path):
+        """Map a URL path onto a file inside UPLOAD_DIR, refusing anything outside it."""
+        root = os.path.abspath(UPLOAD_DIR)
+        parts = [part for part in unquote(path).split('/') if part and part not in ('.', '..')]
+        if parts and parts[0] == INTERNAL_DIR_NAME:
+            return None
+        file_path = os.path.abspath(os.path.join(root, *parts))
+        if os.path.commonpath([root, file_path]) != root:
+            return None
+        return file_path
+
+    # --- RESPONSES ---
+    async def send_response(self, writer, status, headers, body, keep_alive, content_length=None,
+                            close_delimited=False, chunked=False):
+        timer = self.current_request.get()
+        if timer:
+            timer.mark_response(status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                 f"Server: {APP_NAME}/{APP_VERSION}",
+                 f"Date: {formatdate(usegmt=True)}"]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        elif not close_delimited:
+            lines.append(f"Content-Length: {len(body) if content_length is None else content_length}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def send_streamed(self, writer, status, headers, chunks, keep_alive):
+        """
+        Counterpart of NexusShareHandler.send_streamed: the body produced by the
+        blocking `chunks` iterator (advanced in the executor) uses chunked transfer
+        encoding for HTTP/1.1 clients and is delimited by closing the connection
+        otherwise. Returns whether the connection can be reused.
+        """
+        chunked = self.request_version.get() == 'HTTP/1.1'
+        keep_alive = keep_alive and chunked
+        await self.send_response(writer, status, headers, b'', keep_alive, close_delimited=not chunked, chunked=chunked)
+        try:
+            while True:
+                chunk = await self.loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            await self.loop.run_in_executor(None, chunks.close)
+        return keep_alive
+
+    async def sendfile(self, writer, f, offset, count):
+        """loop.sendfile, counted in the sent-bytes metric and paced by the download limits."""
+        if not bandwidth.limited("download"):
+            metrics.add_bytes_out(await self.loop.sendfile(writer.transport, f, offset, count))
+            return
+        while count > 0:
+            sent = await self.loop.sendfile(writer.transport, f, offset, min(CHUNK_SIZE, count))
+            if not sent:
+                break
+            offset += sent
+            count -= sent
+            metrics.add_bytes_out(sent)
+            delay = bandwidth.delay("download", writer.client, sent)
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def send_file_listing(self, query_string, headers, writer, keep_alive):
+        get_header = lambda name: headers.get(name.lower())
+        try:
+            # A changed directory is re-sorted first, which takes a while for large ones
+            status, response_headers, body = await self.loop.run_in_executor(
+                None, plan_listing_response, get_header, query_string)
+        except ApiError as e:
+            await self.send_json_response(writer, {"status": "error", "message": str(e)}, keep_alive,
+                                          status=HTTPStatus(e.status))
+            return keep_alive
+        content_length = int(response_headers.pop("Content-Length", 0))
+        await self.send_response(writer, status, response_headers, body, keep_alive, content_length=content_length)
+        return keep_alive
+
+    async def send_search_results(self, query_string, writer, keep_alive):
+        try:
+            # The first search builds the index, which takes a while on large directories
+            result = await self.loop.run_in_executor(None, search_uploads, query_string)
+        except ApiError as e:
+            await self.send_json_response(writer, {"status": "error", "message": str(e)}, keep_alive,
+                                          status=HTTPStatus(e.status))
+            return keep_alive
+        await self.send_json_response(writer, result, keep_alive)
+        return keep_alive
+
+    async def send_json_response(self, writer, data, keep_alive, status=HTTPStatus.OK):
+        await self.send_response(writer, status, {"Content-Type": "application/json"},
+                                 json.dumps(data).encode('utf-8'), keep_alive)
+
+    async def send_error(self, writer, status, keep_alive, message=None):
+        body = f"<html><body><h1>{status.value} {html.escape(message or status.phrase)}</h1></body></html>".encode('utf-8')
+        await self.send_response(writer, status, {"Content-Type": "text/html; charset=utf-8"}, body, keep_alive)
+        self.log_message(f"Error {status.value}: {message or status.phrase}")
+
+    def log_message(self, message):
+        """Send a log line to the GUI and the log file, in the same format as NexusShareHandler."""
+        timestamp = time.strftime("%d/%b/%Y %H:%M:%S")
+        message = f"[{timestamp}] {message}\n"
+        if self.nexus_app:
+            self.nexus_app.log_to_gui(message)
+        log_writer.write(message)
+
+# ==============================================================================
+# CONFIGURATION FILE & SERVER FACTORY
+# ==============================================================================
+DEFAULT_CONFIG = {"host": "0.0.0.0", "port": 8080, "max_workers": DEFAULT_MAX_WORKERS, "engine": SERVER_ENGINES[0], "theme": "system",
+                  # Upload admission (MB, 0 = no limit) and bandwidth limits (KB/s, 0 = unlimited)
+                  "max_request_mb": 0, "max_file_mb": 0, "disk_free_margin_mb": DEFAULT_DISK_FREE_MARGIN_MB,
+                  "upload_limit_kbs": 0, "download_limit_kbs": 0, "client_upload_limit_kbs": 0, "client_download_limit_kbs": 0,
+                  # Persistent connections (seconds / requests per connection)
+                  "keepalive_timeout": THREADED_KEEPALIVE_TIMEOUT, "read_timeout": CLIENT_READ_TIMEOUT,
+                  "max_keepalive_requests": MAX_KEEPALIVE_REQUESTS,
+                  # When uploaded files are forced to disk: none, file or batch (see DiskWriter)
+                  "fsync_mode": FSYNC_MODES[0],
+                  # Memory cache for small downloads (total MB, 0 = off; largest cached file in KB)
+                  "hot_cache_mb": HOT_CACHE_MAX_MB, "hot_cache_max_file_kb": HOT_CACHE_MAX_FILE_KB}
+
+
+def read_config():
+    """Load nexus_config.json, falling back to the defaults."""
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict(DEFAULT_CONFIG)
+
+
+def write_config(config):
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(config, f, indent=4)
+
+
+def create_server(host, port, engine=SERVER_ENGINES[0], max_workers=DEFAULT_MAX_WORKERS, max_queue=None):
+    """Create and bind a server using the selected engine."""
+    if engine == "asyncio":
+        return AsyncNexusServer((host, port))
+    return NexusShareServer((host, port), NexusShareHandler, max_workers=max_workers, max_queue=max_queue)
+
+
+class ConsoleLog:
+    """Takes the place of the GUI in headless mode: server log lines go to stdout."""
+    def log_to_gui(self, message):
+        sys.stdout.write(message)
+        sys.stdout.flush()
+
+# ==============================================================================
+# MAIN EXECUTION
+# ==============================================================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog=APP_NAME, description=f"{APP_NAME} v{APP_VERSION} - file sharing server")
+    parser.add_argument("--headless", action="store_true", help="run the server without the GUI")
+    parser.add_argument("--host", help="address to bind (default: from nexus_config.json, else 0.0.0.0)")
+    parser.add_argument("--port", type=int, help="port to listen on (default: from nexus_config.json, else 8080)")
+    parser.add_argument("--dir", help=f"directory to share and store uploads in (default: {UPLOAD_DIR})")
+    parser.add_argument("--workers", type=int, help="maximum concurrent connections for the threaded engine")
+    parser.add_argument("--engine", choices=SERVER_ENGINES, help="server implementation to use")
+    parser.add_argument("--quiet", action="store_true", help="headless mode: don't echo the request log to stdout")
+    parser.add_argument("--sync-from", metavar="URL",
+                        help="also pull new and changed files from another NexusShare instance, e.g. http://10.0.0.2:8080")
+    parser.add_argument("--sync-interval", type=float, default=SYNC_INTERVAL, metavar="SECONDS",
+                        help=f"seconds between sync passes (default: {SYNC_INTERVAL:g}); 0 syncs once and exits "
+                             "without serving")
+    parser.add_argument("--sync-parallel", type=int, default=SYNC_PARALLEL, metavar="N",
+                        help=f"files transferred at the same time while syncing (default: {SYNC_PARALLEL})")
+    args = parser.parse_args(argv)
+    if args.sync_from:
+        try:
+            args.peer_sync = PeerSync(args.sync_from, args.sync_parallel)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        args.peer_sync = None
+    return args
+
+
+def run_sync_once(args):
+    """Pull once from the peer, print the report as JSON and exit (status 1 if anything failed)."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    apply_limits(read_config())
+    args.peer_sync.nexus_app = ConsoleLog()
+    try:
+        report = args.peer_sync.run_once()
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        print(f"Sync from {args.peer_sync.peer} failed: {e}", file=sys.stderr, flush=True)
+        sys.exit(1)
+    finally:
+        log_writer.close()
+    print(json.dumps(report), flush=True)
+    if report["failed"]:
+        sys.exit(1)
+
+
+def run_headless(args):
+    """Serve until interrupted, without importing any GUI library."""
+    config = read_config()
+    host = args.host or config.get("host", DEFAULT_CONFIG["host"])
+    port = args.port if args.port is not None else int(config.get("port", DEFAULT_CONFIG["port"]))
+    engine = args.engine or config.get("engine", SERVER_ENGINES[0])
+    max_workers = args.workers or int(config.get("max_workers", DEFAULT_MAX_WORKERS))
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    apply_limits(config)
+    server = create_server(host, port, engine, max_workers, config.get("max_queue"))
+    server.nexus_app = None if args.quiet else ConsoleLog()
+    upload_index.start_reconciler()
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    details = "asyncio engine" if engine == "asyncio" else f"{max_workers} workers"
+    print(f"{APP_NAME} v{APP_VERSION} serving {os.path.abspath(UPLOAD_DIR)} on "
+          f"http://{host}:{server.server_address[1]} ({details})", flush=True)
+    if args.peer_sync:
+        args.peer_sync.nexus_app = server.nexus_app
+        args.peer_sync.start(args.sync_interval)
+        print(f"Syncing from {args.peer_sync.peer} every {args.sync_interval:g}s", flush=True)
+    try:
+        while server_thread.is_alive() and not stop.wait(1):
+            pass
+    finally:
+        if args.peer_sync:
+            args.peer_sync.stop()
+        server.shutdown()
+        server.server_close()
+        server_thread.join(timeout=5)
+        log_writer.close()
+        print("Server stopped.", flush=True)
+
+
+def main(argv=None):
+    global UPLOAD_DIR
+    args = parse_args(argv)
+    if args.dir:
+        UPLOAD_DIR = args.dir
+    if args.peer_sync and args.sync_interval <= 0:
+        run_sync_once(args)
+        return
+    if args.headless:
+        run_headless(args)
+        return
+
+    # Make 'import NexusShare' in the GUI module resolve to this module even
+    # when it is running as __main__, instead of loading a second copy
+    sys.modules.setdefault("NexusShare", sys.modules[__name__])
+    from nexus_gui import NexusShareApp
     app = NexusShareApp()
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
+    if args.peer_sync:
+        args.peer_sync.nexus_app = app
+        args.peer_sync.start(args.sync_interval)
     app.mainloop()
+    if args.peer_sync:
+        args.peer_sync.stop()
+
+
+if __name__ == "__main__":
+    # Frozen builds re-run this script in spawned thumbnail workers; hand those over to multiprocessing
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,372 @@
+# NexusShare - Load and throughput benchmark
+# Developed by: Ahmed Nour Ahmed from Qena
+# Version: 1.0.0
+#
+# Starts a headless NexusShare server on localhost in a temporary directory,
+# drives it with concurrent HTTP clients and reports requests/s, MB/s, latency
+# percentiles and the server's peak RSS. Results are saved as JSON and can be
+# compared against an earlier run to flag regressions:
+#
+#   python nexus_benchmark.py --output base.json
+#   python nexus_benchmark.py --compare base.json --threshold 10
+
+# ==============================================================================
+# IMPORTS
+# ==============================================================================
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+
+from NexusShare import APP_NAME, APP_VERSION, SERVER_ENGINES, DEFAULT_MAX_WORKERS
+
+# ==============================================================================
+# CONFIGURATION & CONSTANTS
+# ==============================================================================
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NexusShare.py")
+WORKLOADS = ("small", "large", "mixed", "download")
+SERVER_START_TIMEOUT = 15  # Seconds to wait for the server to report its address
+BODY_BLOCK_SIZE = 1024 * 1024  # Random block repeated to build large request bodies
+# Metrics compared by --compare: name -> True if higher is better
+COMPARED_METRICS = {"requests_per_s": True, "mb_per_s": True, "p50_ms": False, "p95_ms": False,
+                    "p99_ms": False, "peak_rss_mb": False}
+
+
+def parse_size(value):
+    """Parse sizes such as '16K', '256M' or '2G' into bytes."""
+    value = value.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+# ==============================================================================
+# SERVER PROCESS
+# ==============================================================================
+class BenchmarkServer:
+    """A headless NexusShare process serving a fresh temporary directory."""
+    def __init__(self, engine, workers):
+        self.engine = engine
+        self.workers = workers
+        self.workdir = tempfile.mkdtemp(prefix="nexus-bench-")
+        self.upload_dir = os.path.join(self.workdir, "uploads")
+        self.process = None
+        self.port = None
+
+    def start(self):
+        # Run inside the temporary directory so the log and config files land there too
+        self.process = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, "--headless", "--quiet", "--host", "127.0.0.1", "--port", "0",
+             "--dir", self.upload_dir, "--engine", self.engine, "--workers", str(self.workers)],
+            cwd=self.workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            line = self.process.stdout.readline()
+            if not line:
+                break
+            if " on http://" in line:
+                self.port = int(line.split(" on http://", 1)[1].split()[0].rsplit(":", 1)[1])
+                # Keep draining stdout so the server never blocks on a full pipe
+                threading.Thread(target=self.process.stdout.read, daemon=True).start()
+                return self
+        self.stop()
+        raise RuntimeError("The server did not start; is the port or directory usable?")
+
+    def peak_rss(self):
+        """Peak resident set size of the server process in bytes, or None if unknown."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            import psutil  # Optional: used where /proc is unavailable
+            info = psutil.Process(self.process.pid).memory_info()
+            return getattr(info, "peak_wset", info.rss)
+        except Exception:
+            return None
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+# ==============================================================================
+# HTTP CLIENT OPERATIONS
+# ==============================================================================
+class RepeatedBody:
+    """Iterable request body of `size` bytes built from one random block, so huge uploads need no memory."""
+    def __init__(self, prefix, size, suffix, block):
+        self.prefix, self.size, self.suffix, self.block = prefix, size, suffix, block
+
+    def __len__(self):
+        return len(self.prefix) + self.size + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        remaining = self.size
+        while remaining > 0:
+            piece = self.block[:remaining]
+            remaining -= len(piece)
+            yield piece
+        yield self.suffix
+
+
+def multipart_body(filename, size, block):
+    boundary = uuid.uuid4().hex
+    prefix = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"files[]\"; filename=\"{filename}\"\r\n"
+              f"Content-Type: application/octet-stream\r\n\r\n").encode("utf-8")
+    # A unique first few bytes keep the server from deduplicating the uploads
+    tag = uuid.uuid4().bytes[:size]
+    suffix = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return f"multipart/form-data; boundary={boundary}", RepeatedBody(prefix + tag, size - len(tag), suffix, block)
+
+
+def upload(conn, filename, size, block):
+    """POST one file as multipart/form-data. Returns the bytes sent."""
+    content_type, body = multipart_body(filename, size, block)
+    conn.request("POST", "/", body=iter(body), headers={"Content-Type": content_type, "Content-Length": str(len(body))})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"Upload failed with HTTP {response.status}")
+    return len(body)
+
+
+def download(conn, filename):
+    """GET one file, discarding the body. Returns the bytes received."""
+    conn.request("GET", "/" + filename)
+    response = conn.getresponse()
+    received = 0
+    while True:
+        data = response.read(BODY_BLOCK_SIZE)
+        if not data:
+            break
+        received += len(data)
+    if response.status != 200:
+        raise RuntimeError(f"Download failed with HTTP {response.status}")
+    return received
+
+# ==============================================================================
+# WORKLOADS
+# ==============================================================================
+def run_clients(server, operations, clients):
+    """
+    Run the (callable, label) operations on `clients` concurrent connections.
+    Each callable takes an HTTPConnection and returns bytes transferred.
+    Returns (wall seconds, latencies, bytes, errors).
+    """
+    pending = list(operations)
+    lock = threading.Lock()
+    latencies, totals, errors = [], [0], []
+
+    def client_loop():
+        conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=300)
+        while True:
+            with lock:
+                if not pending:
+                    break
+                operation = pending.pop()
+            started = time.perf_counter()
+            try:
+                transferred = operation(conn)
+            except Exception as e:
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=300)
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                totals[0] += transferred
+        conn.close()
+
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, totals[0], errors
+
+
+def seed_files(server, count, size, block):
+    """Create downloadable files directly in the server's directory."""
+    os.makedirs(server.upload_dir, exist_ok=True)
+    names = []
+    for i in range(count):
+        name = f"seed_{i:05d}.bin"
+        with open(os.path.join(server.upload_dir, name), "wb") as f:
+            remaining = size
+            while remaining > 0:
+                remaining -= f.write(block[:remaining])
+        names.append(name)
+    return names
+
+
+def build_workload(name, args, server, block, rng):
+    """Return the list of operations for a workload."""
+    if name == "small":
+        return [lambda conn, i=i: upload(conn, f"small_{i:06d}.bin", args.small_size, block)
+                for i in range(args.small_count)]
+    if name == "large":
+        return [lambda conn, i=i: upload(conn, f"large_{i:03d}.bin", args.large_size, block)
+                for i in range(args.large_count)]
+    if name == "download":
+        names = seed_files(server, args.download_files, args.download_size, block)
+        return [lambda conn, n=rng.choice(names): download(conn, n) for _ in range(args.download_count)]
+    # mixed: GETs of seeded files interleaved with small uploads
+    names = seed_files(server, args.download_files, args.small_size, block)
+    operations = []
+    for i in range(args.mixed_count):
+        if rng.random() < args.mixed_get_ratio:
+            operations.append(lambda conn, n=rng.choice(names): download(conn, n))
+        else:
+            operations.append(lambda conn, i=i: upload(conn, f"mixed_{i:06d}.bin", args.small_size, block))
+    return operations
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_workload(name, args, block):
+    """Run one workload against a fresh server and return its result dict."""
+    rng = random.Random(f"{args.seed}:{name}")
+    server = BenchmarkServer(args.engine, args.workers).start()
+    try:
+        operations = build_workload(name, args, server, block, rng)
+        wall, latencies, transferred, errors = run_clients(server, operations, args.clients)
+        peak_rss = server.peak_rss()
+    finally:
+        server.stop()
+
+    latencies.sort()
+    result = {"requests": len(latencies), "errors": len(errors), "seconds": round(wall, 3),
+              "requests_per_s": round(len(latencies) / wall, 1) if wall else None,
+              "mb_per_s": round(transferred / wall / 1024 ** 2, 2) if wall else None,
+              "peak_rss_mb": round(peak_rss / 1024 ** 2, 1) if peak_rss else None}
+    for label, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        value = percentile(latencies, q)
+        result[label] = round(value * 1000, 2) if value is not None else None
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+# ==============================================================================
+# REPORTING & COMPARISON
+# ==============================================================================
+def print_results(results):
+    header = f"{'workload':<10}{'req/s':>10}{'MB/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>9}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["workloads"].items():
+        cells = [r["requests_per_s"], r["mb_per_s"], r["p50_ms"], r["p95_ms"], r["p99_ms"]]
+        line = f"{name:<10}" + "".join(f"{'-' if v is None else v:>10}" for v in cells)
+        print(line + f"{'-' if r['peak_rss_mb'] is None else r['peak_rss_mb']:>9}{r['errors']:>8}")
+
+
+def compare_results(baseline, results, threshold):
+    """Print the change of every metric against a baseline run. Returns the list of regressions."""
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('timestamp', 'baseline')} (threshold {threshold:g}%):")
+    for name, current in results["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < -threshold if higher_is_better else change > threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {name:<10}{metric:<16}{old:>10} -> {new:<10} ({change:+.1f}%){flag}")
+            if worse:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+# ==============================================================================
+# MAIN EXECUTION
+# ==============================================================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=f"{APP_NAME} v{APP_VERSION} load and throughput benchmark")
+    parser.add_argument("--engine", choices=SERVER_ENGINES, default=SERVER_ENGINES[0])
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="server worker threads (threaded engine)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client connections")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"comma-separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument("--small-count", type=int, default=2000, help="uploads in the 'small' workload")
+    parser.add_argument("--small-size", type=parse_size, default="16K")
+    parser.add_argument("--large-count", type=int, default=3, help="uploads in the 'large' workload")
+    parser.add_argument("--large-size", type=parse_size, default="256M")
+    parser.add_argument("--mixed-count", type=int, default=2000, help="requests in the 'mixed' workload")
+    parser.add_argument("--mixed-get-ratio", type=float, default=0.8, help="share of GETs in the 'mixed' workload")
+    parser.add_argument("--download-count", type=int, default=500, help="requests in the 'download' workload")
+    parser.add_argument("--download-files", type=int, default=50, help="files seeded for 'download' and 'mixed'")
+    parser.add_argument("--download-size", type=parse_size, default="4M")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the request mix and file contents")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        raise SystemExit(f"Unknown workload(s): {', '.join(sorted(unknown))}")
+
+    block = random.Random(args.seed).randbytes(BODY_BLOCK_SIZE)
+    results = {"meta": {"app_version": APP_VERSION, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                        "python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(),
+                        "settings": {key: value for key, value in vars(args).items()
+                                     if key not in ("output", "compare", "threshold")}},
+               "workloads": {}}
+    for name in workloads:
+        print(f"Running '{name}' ({args.engine} engine, {args.clients} clients)...", flush=True)
+        results["workloads"][name] = run_workload(name, args, block)
+
+    print()
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("settings") != results["meta"]["settings"]:
+            print("\nWarning: the baseline was recorded with different settings.")
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
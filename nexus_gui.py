@@ -0,0 +1,720 @@
+# NexusShare - Desktop interface (CustomTkinter)
+# Developed by: Ahmed Nour Ahmed from Qena
+# Version: 1.0.0
+#
+# Imported by NexusShare.py only when the GUI is started, so headless servers
+# never load Tk, Pillow or qrcode.
+
+# ==============================================================================
+# IMPORTS
+# ==============================================================================
+import os
+import math
+import shutil
+import threading
+import socket
+import webbrowser
+import subprocess
+import platform
+import time
+from collections import deque
+from datetime import datetime
+from tkinter import ttk
+
+# Third-party libraries (must be installed: pip install customtkinter Pillow qrcode)
+try:
+    import customtkinter as ctk
+    from PIL import Image, ImageTk
+    import qrcode
+except ImportError:
+    print("FATAL ERROR: Required libraries are missing.")
+    print("Please install them by running: pip install customtkinter Pillow qrcode")
+    raise SystemExit(1)
+
+from NexusShare import (
+    APP_NAME, APP_VERSION, DEVELOPER, LOCATION, UPLOAD_DIR, ICON_FILE,
+    DEFAULT_MAX_WORKERS, DEFAULT_DISK_FREE_MARGIN_MB, FSYNC_MODES, HOT_CACHE_MAX_MB, HOT_CACHE_MAX_FILE_KB, SERVER_ENGINES, upload_index, metrics, apply_limits,
+    create_server, read_config, write_config,
+)
+
+# ==============================================================================
+# CONFIGURATION & CONSTANTS
+# ==============================================================================
+GUI_LOG_FLUSH_MS = 200  # Interval for pushing buffered log lines into the GUI
+GUI_LOG_MAX_LINES = 5000  # Lines kept in the Server Log textbox
+FM_ROW_HEIGHT = 24  # Pixel height of a row in the file manager list
+METRICS_POLL_MS = 1000  # Refresh interval of the live traffic figures in the Statistics tab
+
+# Set appearance modes and color themes for CustomTkinter
+ctk.set_appearance_mode("System")  # Default: System
+ctk.set_default_color_theme("blue")  # Default: Blue
+
+# ==============================================================================
+# MAIN APPLICATION CLASS (GUI)
+# ==============================================================================
+class NexusShareApp(ctk.CTk):
+    def __init__(self):
+        super().__init__()
+
+        # Server variables
+        self.server = None
+        self.server_thread = None
+        self.is_running = False
+
+        # Log lines from server threads, pushed to the GUI in batches by flush_gui_log
+        self.gui_log_buffer = deque(maxlen=GUI_LOG_MAX_LINES)
+        self.gui_log_lock = threading.Lock()
+
+        # File manager view state (see render_file_manager)
+        self.fm_entries = []  # All files, sorted by the current column
+        self.fm_view = []  # Entries matching the search term, same order
+        self.fm_filter_term = ""
+        self.fm_sort_column = "mtime"
+        self.fm_sort_reverse = True
+        self.fm_offset = 0
+        self.fm_visible_rows = 20
+
+        # Load configuration
+        self.config = self.load_config()
+        apply_limits(self.config)
+
+        # --- Window Setup ---
+        self.title(f"{APP_NAME} v{APP_VERSION}")
+        self.geometry("1100x700")
+        self.minsize(900, 600)
+        
+        # Set icon if it exists
+        if os.path.exists(ICON_FILE):
+            try:
+                self.iconphoto(True, ImageTk.PhotoImage(Image.open(ICON_FILE)))
+            except Exception as e:
+                print(f"Could not load icon: {e}")
+
+        # --- Configure Grid Layout ---
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        # --- Create Sidebar ---
+        self.create_sidebar()
+
+        # --- Create Main Content Area with Tabs ---
+        self.create_main_content()
+
+        # --- Initial Setup ---
+        self.update_ip_address()
+        self.fm_generation = None
+        self.refresh_file_manager()
+        upload_index.start_reconciler()
+        self.after(1000, self.poll_upload_index)
+        self.after(GUI_LOG_FLUSH_MS, self.flush_gui_log)
+        self.metrics_sample = (time.monotonic(), metrics.snapshot())
+        self.after(METRICS_POLL_MS, self.poll_metrics)
+        self.log_message("NexusShare initialized. Ready to start.")
+        self.log_message(f"Developer: {DEVELOPER} from {LOCATION}")
+
+    def create_sidebar(self):
+        """Creates the left sidebar with controls."""
+        self.sidebar_frame = ctk.CTkFrame(self, width=280, corner_radius=0)
+        self.sidebar_frame.grid(row=0, column=0, sticky="nsew")
+        self.sidebar_frame.grid_rowconfigure(14, weight=1) # Make the log area expand
+
+        # --- Title ---
+        self.logo_label = ctk.CTkLabel(self.sidebar_frame, text=APP_NAME, font=ctk.CTkFont(size=24, weight="bold"))
+        self.logo_label.grid(row=0, column=0, padx=20, pady=(20, 10))
+
+        self.version_label = ctk.CTkLabel(self.sidebar_frame, text=f"v{APP_VERSION}", font=ctk.CTkFont(size=12))
+        self.version_label.grid(row=1, column=0, padx=20, pady=(0, 20))
+
+        # --- Server Controls ---
+        self.start_button = ctk.CTkButton(self.sidebar_frame, text="▶ Start Server", command=self.start_server, height=40, font=ctk.CTkFont(size=14, weight="bold"))
+        self.start_button.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
+
+        self.stop_button = ctk.CTkButton(self.sidebar_frame, text="⏸ Stop Server", command=self.stop_server, height=40, font=ctk.CTkFont(size=14, weight="bold"), state="disabled")
+        self.stop_button.grid(row=3, column=0, padx=20, pady=10, sticky="ew")
+
+        self.restart_button = ctk.CTkButton(self.sidebar_frame, text="↻ Restart", command=self.restart_server, height=40, font=ctk.CTkFont(size=14, weight="bold"), state="disabled")
+        self.restart_button.grid(row=4, column=0, padx=20, pady=10, sticky="ew")
+        
+        # --- Configuration ---
+        self.separator = ctk.CTkSeparator(self.sidebar_frame)
+        self.separator.grid(row=5, column=0, padx=20, pady=20, sticky="ew")
+
+        self.host_label = ctk.CTkLabel(self.sidebar_frame, text="Host/IP Address:", anchor="w")
+        self.host_label.grid(row=6, column=0, padx=20, pady=(10, 0))
+        self.host_entry = ctk.CTkEntry(self.sidebar_frame, placeholder_text="0.0.0.0")
+        self.host_entry.grid(row=7, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.host_entry.insert(0, self.config.get("host", "0.0.0.0"))
+
+        self.port_label = ctk.CTkLabel(self.sidebar_frame, text="Port:", anchor="w")
+        self.port_label.grid(row=8, column=0, padx=20, pady=(10, 0))
+        self.port_entry = ctk.CTkEntry(self.sidebar_frame, placeholder_text="8080")
+        self.port_entry.grid(row=9, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.port_entry.insert(0, str(self.config.get("port", 8080)))
+
+        self.workers_label = ctk.CTkLabel(self.sidebar_frame, text="Max Workers:", anchor="w")
+        self.workers_label.grid(row=10, column=0, padx=20, pady=(10, 0))
+        self.workers_entry = ctk.CTkEntry(self.sidebar_frame, placeholder_text=str(DEFAULT_MAX_WORKERS))
+        self.workers_entry.grid(row=11, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.workers_entry.insert(0, str(self.config.get("max_workers", DEFAULT_MAX_WORKERS)))
+
+        self.engine_label = ctk.CTkLabel(self.sidebar_frame, text="Server Engine:", anchor="w")
+        self.engine_label.grid(row=12, column=0, padx=20, pady=(10, 0))
+        self.engine_optionmenu = ctk.CTkOptionMenu(self.sidebar_frame, values=[engine.capitalize() for engine in SERVER_ENGINES])
+        self.engine_optionmenu.grid(row=13, column=0, padx=20, pady=(0, 10), sticky="ew")
+        self.engine_optionmenu.set(self.config.get("engine", SERVER_ENGINES[0]).capitalize())
+
+        # --- Server Status ---
+        self.status_frame = ctk.CTkFrame(self.sidebar_frame)
+        self.status_frame.grid(row=14, column=0, padx=20, pady=10, sticky="nsew")
+        self.status_frame.grid_columnconfigure(0, weight=1)
+        self.status_frame.grid_rowconfigure(2, weight=1)
+
+        ctk.CTkLabel(self.status_frame, text="Server Status", font=ctk.CTkFont(size=14, weight="bold")).grid(row=0, column=0, padx=10, pady=(10,5))
+        self.status_label = ctk.CTkLabel(self.status_frame, text="● Stopped", font=ctk.CTkFont(size=12), text_color="#d93025")
+        self.status_label.grid(row=1, column=0, padx=10, pady=5)
+        
+        self.url_label = ctk.CTkTextbox(self.status_frame, height=60, font=ctk.CTkFont(size=11))
+        self.url_label.grid(row=2, column=0, padx=10, pady=(5, 10), sticky="nsew")
+        self.url_label.insert("0.0", "URL will appear here...")
+        self.url_label.configure(state="disabled")
+
+    def create_main_content(self):
+        """Creates the main content area with tabs."""
+        self.main_tabview = ctk.CTkTabview(self)
+        self.main_tabview.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
+
+        # --- File Manager Tab ---
+        self.file_manager_tab = self.main_tabview.add("📁 File Manager")
+        self.file_manager_tab.grid_columnconfigure(0, weight=1)
+        self.file_manager_tab.grid_rowconfigure(1, weight=1)
+        
+        fm_controls_frame = ctk.CTkFrame(self.file_manager_tab)
+        fm_controls_frame.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
+        fm_controls_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkButton(fm_controls_frame, text="🔄 Refresh", command=self.rescan_uploads).grid(row=0, column=0, padx=5, pady=5)
+        self.search_entry = ctk.CTkEntry(fm_controls_frame, placeholder_text="Search files...")
+        self.search_entry.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.search_entry.bind("<KeyRelease>", self.filter_files)
+        ctk.CTkButton(fm_controls_frame, text="🗑️ Delete Selected", command=self.delete_selected_file).grid(row=0, column=2, padx=5, pady=5)
+        ctk.CTkButton(fm_controls_frame, text="📂 Open Folder", command=self.open_upload_folder).grid(row=0, column=3, padx=5, pady=5)
+
+        # Virtualized list: the Treeview only ever holds the rows that are on screen,
+        # the scrollbar is driven by hand from the in-memory view
+        fm_list_frame = ctk.CTkFrame(self.file_manager_tab)
+        fm_list_frame.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="nsew")
+        fm_list_frame.grid_columnconfigure(0, weight=1)
+        fm_list_frame.grid_rowconfigure(0, weight=1)
+
+        ttk.Style().configure("Treeview", rowheight=FM_ROW_HEIGHT)
+        self.file_tree = ttk.Treeview(fm_list_frame, columns=("name", "size", "mtime"), show="headings", selectmode="extended")
+        for column, heading, width, anchor in (("name", "File Name", 420, "w"), ("size", "Size", 120, "e"), ("mtime", "Modified Date", 170, "w")):
+            self.file_tree.heading(column, text=heading, command=lambda c=column: self.sort_file_manager(c))
+            self.file_tree.column(column, width=width, anchor=anchor, stretch=(column == "name"))
+        self.file_tree.grid(row=0, column=0, sticky="nsew")
+        self.file_tree.bind("<Configure>", self.on_file_tree_resize)
+        self.file_tree.bind("<MouseWheel>", lambda event: self.scroll_file_manager(-3 if event.delta > 0 else 3))
+        self.file_tree.bind("<Button-4>", lambda event: self.scroll_file_manager(-3))
+        self.file_tree.bind("<Button-5>", lambda event: self.scroll_file_manager(3))
+        self.file_tree.bind("<Prior>", lambda event: self.scroll_file_manager(-self.fm_visible_rows))
+        self.file_tree.bind("<Next>", lambda event: self.scroll_file_manager(self.fm_visible_rows))
+
+        self.fm_scrollbar = ctk.CTkScrollbar(fm_list_frame, command=self.on_file_scrollbar)
+        self.fm_scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.fm_status_label = ctk.CTkLabel(self.file_manager_tab, text="", anchor="w")
+        self.fm_status_label.grid(row=2, column=0, padx=15, pady=(0, 10), sticky="ew")
+        
+        # --- Server Log Tab ---
+        self.log_tab = self.main_tabview.add("📜 Server Log")
+        self.log_tab.grid_columnconfigure(0, weight=1)
+        self.log_tab.grid_rowconfigure(0, weight=1)
+        
+        self.log_textbox = ctk.CTkTextbox(self.log_tab, font=ctk.CTkFont(family="Consolas", size=11))
+        self.log_textbox.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        
+        # --- Statistics Tab ---
+        self.stats_tab = self.main_tabview.add("📊 Statistics")
+        self.stats_tab.grid_columnconfigure(0, weight=1)
+        
+        stats_frame = ctk.CTkFrame(self.stats_tab)
+        stats_frame.grid(row=0, column=0, padx=20, pady=20, sticky="ew")
+        stats_frame.grid_columnconfigure(1, weight=1)
+
+        self.stats_labels = {}
+        stats_info = [
+            ("Total Files:", "total_files"),
+            ("Total Size:", "total_size"),
+            ("Largest File:", "largest_file"),
+            ("File Types:", "file_types")
+        ]
+        for i, (label_text, key) in enumerate(stats_info):
+            ctk.CTkLabel(stats_frame, text=label_text, font=ctk.CTkFont(size=14, weight="bold")).grid(row=i, column=0, padx=10, pady=10, sticky="w")
+            self.stats_labels[key] = ctk.CTkLabel(stats_frame, text="Calculating...", font=ctk.CTkFont(size=14))
+            self.stats_labels[key].grid(row=i, column=1, padx=10, pady=10, sticky="w")
+
+        traffic_frame = ctk.CTkFrame(self.stats_tab)
+        traffic_frame.grid(row=1, column=0, padx=20, pady=(0, 20), sticky="ew")
+        traffic_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(traffic_frame, text="Live Traffic", font=ctk.CTkFont(size=18, weight="bold")).grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky="w")
+        traffic_info = [
+            ("Upload Speed:", "upload_speed"),
+            ("Download Speed:", "download_speed"),
+            ("Requests:", "requests"),
+            ("Active Connections:", "active_connections"),
+            ("Latency (p50 / p95 / p99):", "latency"),
+            ("Memory Cache Hit Rate:", "hot_cache")
+        ]
+        for i, (label_text, key) in enumerate(traffic_info, start=1):
+            ctk.CTkLabel(traffic_frame, text=label_text, font=ctk.CTkFont(size=14, weight="bold")).grid(row=i, column=0, padx=10, pady=10, sticky="w")
+            self.stats_labels[key] = ctk.CTkLabel(traffic_frame, text="N/A", font=ctk.CTkFont(size=14))
+            self.stats_labels[key].grid(row=i, column=1, padx=10, pady=10, sticky="w")
+
+        # --- Settings Tab ---
+        self.settings_tab = self.main_tabview.add("⚙️ Settings")
+        self.settings_tab.grid_columnconfigure(0, weight=1)
+        
+        settings_frame = ctk.CTkFrame(self.settings_tab)
+        settings_frame.grid(row=0, column=0, padx=20, pady=20, sticky="ew")
+        settings_frame.grid_columnconfigure(0, weight=1)
+        
+        ctk.CTkLabel(settings_frame, text="Appearance", font=ctk.CTkFont(size=18, weight="bold")).grid(row=0, column=0, padx=10, pady=(10, 20))
+        
+        self.appearance_mode_label = ctk.CTkLabel(settings_frame, text="Theme Mode:", anchor="w")
+        self.appearance_mode_label.grid(row=1, column=0, padx=10, pady=0)
+        self.appearance_mode_optionemenu = ctk.CTkOptionMenu(settings_frame, values=["Light", "Dark", "System"], command=self.change_appearance_mode_event)
+        self.appearance_mode_optionemenu.grid(row=2, column=0, padx=10, pady=(0, 20), sticky="ew")
+        
+        ctk.CTkButton(settings_frame, text="Clear All Uploads", command=self.clear_uploads, fg_color="red", hover_color="#aa0000").grid(row=3, column=0, padx=10, pady=20, sticky="ew")
+
+        limits_frame = ctk.CTkFrame(self.settings_tab)
+        limits_frame.grid(row=1, column=0, padx=20, pady=(0, 20), sticky="ew")
+        limits_frame.grid_columnconfigure(1, weight=1)
+
+        ctk.CTkLabel(limits_frame, text="Upload & Bandwidth Limits", font=ctk.CTkFont(size=18, weight="bold")).grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5))
+        ctk.CTkLabel(limits_frame, text="0 means no limit. Changes apply immediately, also to a running server.", text_color="gray").grid(row=1, column=0, columnspan=2, padx=10, pady=(0, 10))
+
+        self.limit_entries = {}
+        limits_info = [
+            ("Max request size (MB):", "max_request_mb", 0),
+            ("Max file size (MB):", "max_file_mb", 0),
+            ("Keep free on disk (MB):", "disk_free_margin_mb", DEFAULT_DISK_FREE_MARGIN_MB),
+            ("Total upload limit (KB/s):", "upload_limit_kbs", 0),
+            ("Total download limit (KB/s):", "download_limit_kbs", 0),
+            ("Per-client upload limit (KB/s):", "client_upload_limit_kbs", 0),
+            ("Per-client download limit (KB/s):", "client_download_limit_kbs", 0),
+            ("Download memory cache (MB, 0 = off):", "hot_cache_mb", HOT_CACHE_MAX_MB),
+            ("Cache files up to (KB):", "hot_cache_max_file_kb", HOT_CACHE_MAX_FILE_KB)
+        ]
+        for i, (label_text, key, default) in enumerate(limits_info, start=2):
+            ctk.CTkLabel(limits_frame, text=label_text, anchor="w").grid(row=i, column=0, padx=10, pady=5, sticky="w")
+            self.limit_entries[key] = ctk.CTkEntry(limits_frame, width=120)
+            self.limit_entries[key].insert(0, str(self.config.get(key, default)))
+            self.limit_entries[key].grid(row=i, column=1, padx=10, pady=5, sticky="w")
+
+        fsync_row = len(limits_info) + 2
+        ctk.CTkLabel(limits_frame, text="Disk sync of uploads:", anchor="w").grid(row=fsync_row, column=0, padx=10, pady=5, sticky="w")
+        self.fsync_optionmenu = ctk.CTkOptionMenu(limits_frame, values=[mode.capitalize() for mode in FSYNC_MODES], width=120)
+        self.fsync_optionmenu.set(self.config.get("fsync_mode", FSYNC_MODES[0]).capitalize())
+        self.fsync_optionmenu.grid(row=fsync_row, column=1, padx=10, pady=5, sticky="w")
+
+        ctk.CTkButton(limits_frame, text="Apply Limits", command=self.apply_limit_settings).grid(row=fsync_row + 1, column=0, columnspan=2, padx=10, pady=(10, 15), sticky="ew")
+
+        # --- QR Code Tab ---
+        self.qr_tab = self.main_tabview.add("📱 QR Code")
+        self.qr_tab.grid_columnconfigure(0, weight=1)
+        self.qr_tab.grid_rowconfigure(0, weight=1)
+        
+        self.qr_frame = ctk.CTkFrame(self.qr_tab)
+        self.qr_frame.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
+        self.qr_frame.grid_columnconfigure(0, weight=1)
+        self.qr_frame.grid_rowconfigure(1, weight=1)
+
+        ctk.CTkLabel(self.qr_frame, text="Scan to connect from mobile", font=ctk.CTkFont(size=16, weight="bold")).grid(row=0, column=0, pady=10)
+        self.qr_image_label = ctk.CTkLabel(self.qr_frame, text="QR Code will appear here when server starts.")
+        self.qr_image_label.grid(row=1, column=0, pady=10)
+
+        # --- About Tab ---
+        self.about_tab = self.main_tabview.add("ℹ️ About")
+        self.about_tab.grid_columnconfigure(0, weight=1)
+        
+        about_frame = ctk.CTkFrame(self.about_tab)
+        about_frame.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
+        about_frame.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(about_frame, text=APP_NAME, font=ctk.CTkFont(size=28, weight="bold")).grid(row=0, column=0, pady=(20, 5))
+        ctk.CTkLabel(about_frame, text=f"Version {APP_VERSION}", font=ctk.CTkFont(size=14)).grid(row=1, column=0, pady=5)
+        ctk.CTkLabel(about_frame, text="A modern, powerful, and professional file sharing solution.", font=ctk.CTkFont(size=12), justify="center").grid(row=2, column=0, padx=20, pady=5)
+        
+        separator = ctk.CTkSeparator(about_frame)
+        separator.grid(row=3, column=0, padx=40, pady=20, sticky="ew")
+
+        ctk.CTkLabel(about_frame, text=f"Developed with ❤️ by", font=ctk.CTkFont(size=12)).grid(row=4, column=0, pady=5)
+        ctk.CTkLabel(about_frame, text=DEVELOPER, font=ctk.CTkFont(size=16, weight="bold")).grid(row=5, column=0, pady=5)
+        ctk.CTkLabel(about_frame, text=LOCATION, font=ctk.CTkFont(size=12)).grid(row=6, column=0, pady=5)
+        
+        ctk.CTkLabel(about_frame, text="© 2024 All Rights Reserved.", font=ctk.CTkFont(size=10)).grid(row=7, column=0, pady=(20, 10))
+
+    # --- SERVER LOGIC ---
+    def start_server(self):
+        if self.is_running:
+            self.log_message("Server is already running.")
+            return
+
+        try:
+            host = self.host_entry.get()
+            port = int(self.port_entry.get())
+            max_workers = max(1, int(self.workers_entry.get() or DEFAULT_MAX_WORKERS))
+            engine = self.engine_optionmenu.get().lower()
+            
+            # Save config
+            self.config["host"] = host
+            self.config["port"] = port
+            self.config["max_workers"] = max_workers
+            self.config["engine"] = engine
+            self.save_config()
+
+            self.server = create_server(host, port, engine, max_workers, self.config.get("max_queue"))
+            self.server.nexus_app = self # Link handler to this app instance for logging
+
+            self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.server_thread.start()
+            self.is_running = True
+            
+            self.update_ui_state(running=True)
+            details = "asyncio engine" if engine == "asyncio" else f"{max_workers} workers"
+            self.log_message(f"Server started successfully on http://{host}:{port} ({details})")
+            self.update_ip_address()
+            self.generate_qr_code()
+            webbrowser.open(f"http://{host}:{port}")
+
+        except Exception as e:
+            self.log_message(f"Failed to start server: {e}")
+            self.update_ui_state(running=False)
+
+    def stop_server(self):
+        if not self.is_running:
+            return
+
+        try:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread.join(timeout=5)
+            self.is_running = False
+            self.update_ui_state(running=False)
+            self.log_message("Server stopped.")
+        except Exception as e:
+            self.log_message(f"Error stopping server: {e}")
+
+    def restart_server(self):
+        self.log_message("Restarting server...")
+        self.stop_server()
+        time.sleep(1) # Give it a moment to shut down
+        self.start_server()
+
+    # --- UI UPDATE METHODS ---
+    def update_ui_state(self, running: bool):
+        state_normal = "normal" if not running else "disabled"
+        state_disabled = "disabled" if not running else "normal"
+        
+        self.start_button.configure(state=state_normal)
+        self.stop_button.configure(state=state_disabled)
+        self.restart_button.configure(state=state_disabled)
+        self.host_entry.configure(state=state_normal)
+        self.port_entry.configure(state=state_normal)
+        self.workers_entry.configure(state=state_normal)
+        self.engine_optionmenu.configure(state=state_normal)
+
+        if running:
+            self.status_label.configure(text="● Running", text_color="#1e8e3e")
+            host = self.host_entry.get()
+            port = self.port_entry.get()
+            url_text = f"Local: http://127.0.0.1:{port}\nNetwork: http://{self.get_local_ip()}:{port}"
+            self.url_label.configure(state="normal")
+            self.url_label.delete("0.0", "end")
+            self.url_label.insert("0.0", url_text)
+            self.url_label.configure(state="disabled")
+        else:
+            self.status_label.configure(text="● Stopped", text_color="#d93025")
+            self.url_label.configure(state="normal")
+            self.url_label.delete("0.0", "end")
+            self.url_label.insert("0.0", "URL will appear here...")
+            self.url_label.configure(state="disabled")
+            self.qr_image_label.configure(image=ctk.CTkImage(Image.new('RGB', (200, 200), color='white')), text="QR Code will appear here when server starts.")
+
+    def log_to_gui(self, message):
+        """Thread-safe method to append log messages to the GUI (buffered, see flush_gui_log)."""
+        with self.gui_log_lock:
+            self.gui_log_buffer.append(message)
+
+    def flush_gui_log(self):
+        """Move all buffered server log lines into the textbox with a single insert."""
+        with self.gui_log_lock:
+            lines = list(self.gui_log_buffer)
+            self.gui_log_buffer.clear()
+        if lines:
+            self.append_log_lines(lines)
+        self.after(GUI_LOG_FLUSH_MS, self.flush_gui_log)
+
+    def log_message(self, message):
+        """Appends a message to the log textbox."""
+        self.append_log_lines([message])
+
+    def append_log_lines(self, lines):
+        text = "".join(line if line.endswith("\n") else line + "\n" for line in lines)
+        self.log_textbox.configure(state="normal")
+        self.log_textbox.insert("end", text)
+        # Keep only the newest GUI_LOG_MAX_LINES lines
+        line_count = int(self.log_textbox.index("end-1c").split(".")[0])
+        if line_count > GUI_LOG_MAX_LINES:
+            self.log_textbox.delete("1.0", f"{line_count - GUI_LOG_MAX_LINES + 1}.0")
+        self.log_textbox.see("end")
+        self.log_textbox.configure(state="disabled")
+
+    # --- FILE MANAGER METHODS ---
+    def refresh_file_manager(self):
+        """Reload the file list from the in-memory upload index (no disk access)."""
+        self.fm_generation, self.fm_entries = upload_index.snapshot()
+        self.sort_entries(self.fm_entries)
+        self.fm_view = self.match_entries(self.fm_entries, self.fm_filter_term)
+        self.render_file_manager()
+        self.update_statistics()
+
+    def sort_entries(self, entries):
+        key = {"name": lambda entry: entry.name.lower(),
+               "size": lambda entry: entry.size,
+               "mtime": lambda entry: entry.mtime}[self.fm_sort_column]
+        entries.sort(key=key, reverse=self.fm_sort_reverse)
+
+    @staticmethod
+    def match_entries(entries, term):
+        """Filter `entries` (keeping their order) through the server's filename search index."""
+        if not term:
+            return entries
+        names = upload_index.match(term)
+        return [entry for entry in entries if entry.name in names]
+
+    def sort_file_manager(self, column):
+        """Column heading click: re-sort in memory, toggling the direction on repeated clicks."""
+        if self.fm_sort_column == column:
+            self.fm_sort_reverse = not self.fm_sort_reverse
+        else:
+            self.fm_sort_column = column
+            self.fm_sort_reverse = column != "name"
+        self.sort_entries(self.fm_entries)
+        self.fm_view = self.match_entries(self.fm_entries, self.fm_filter_term)
+        self.fm_offset = 0
+        self.render_file_manager()
+
+    def render_file_manager(self):
+        """Show the slice of the current view that fits on screen."""
+        total = len(self.fm_view)
+        self.fm_offset = max(0, min(self.fm_offset, total - self.fm_visible_rows))
+        selected = set(self.file_tree.selection())
+        self.file_tree.delete(*self.file_tree.get_children())
+        for entry in self.fm_view[self.fm_offset:self.fm_offset + self.fm_visible_rows]:
+            mtime = datetime.fromtimestamp(entry.mtime).strftime('%Y-%m-%d %H:%M:%S')
+            self.file_tree.insert("", "end", iid=entry.name, values=(entry.name, self.format_file_size(entry.size), mtime))
+        self.file_tree.selection_set([name for name in selected if self.file_tree.exists(name)])
+
+        if total:
+            self.fm_scrollbar.set(self.fm_offset / total, min(1.0, (self.fm_offset + self.fm_visible_rows) / total))
+        else:
+            self.fm_scrollbar.set(0.0, 1.0)
+        shown = f"{len(self.fm_view)} of {len(self.fm_entries)}" if self.fm_filter_term else f"{total}"
+        self.fm_status_label.configure(text=f"{shown} file(s)")
+
+    def scroll_file_manager(self, rows):
+        self.fm_offset += rows
+        self.render_file_manager()
+        return "break"
+
+    def on_file_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.fm_offset = int(float(value) * len(self.fm_view))
+            self.render_file_manager()
+        elif action == "scroll":
+            self.scroll_file_manager(int(value) * (self.fm_visible_rows if unit == "pages" else 1))
+
+    def on_file_tree_resize(self, event):
+        # Subtract the heading row from the available height
+        visible_rows = max(1, (event.height - FM_ROW_HEIGHT) // FM_ROW_HEIGHT)
+        if visible_rows != self.fm_visible_rows:
+            self.fm_visible_rows = visible_rows
+            self.render_file_manager()
+
+    def rescan_uploads(self):
+        """Refresh button: have the index pick up outside changes, then redraw."""
+        upload_index.request_reconcile()
+        self.refresh_file_manager()
+
+    def poll_upload_index(self):
+        """Redraw the file manager whenever the upload index changes."""
+        if upload_index.generation != self.fm_generation:
+            self.refresh_file_manager()
+        self.after(1000, self.poll_upload_index)
+
+    def filter_files(self, event=None):
+        search_term = self.search_entry.get().lower()
+        if search_term == self.fm_filter_term:
+            return
+        if self.fm_filter_term and search_term.startswith(self.fm_filter_term):
+            # Typing more characters can only narrow the previous result set
+            self.fm_view = self.match_entries(self.fm_view, search_term)
+        else:
+            self.fm_view = self.match_entries(self.fm_entries, search_term)
+        self.fm_filter_term = search_term
+        self.fm_offset = 0
+        self.render_file_manager()
+
+    def delete_selected_file(self):
+        filenames = list(self.file_tree.selection())
+        if not filenames:
+            # Nothing selected in the list: fall back to asking for the name
+            filename = ctk.CTkInputDialog(text="Enter the exact filename to delete:", title="Delete File").get_input()
+            filenames = [filename] if filename else []
+        for filename in filenames:
+            path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+            try:
+                if os.path.isfile(path):
+                    os.remove(path)
+                    upload_index.remove(filename)
+                    self.log_message(f"Deleted file: {filename}")
+                else:
+                    self.log_message(f"File not found: {filename}")
+            except Exception as e:
+                self.log_message(f"Error deleting file {filename}: {e}")
+        if filenames:
+            self.refresh_file_manager()
+
+    def open_upload_folder(self):
+        if platform.system() == "Windows":
+            os.startfile(UPLOAD_DIR)
+        elif platform.system() == "Darwin": # macOS
+            subprocess.Popen(["open", UPLOAD_DIR])
+        else: # Linux
+            subprocess.Popen(["xdg-open", UPLOAD_DIR])
+
+    def clear_uploads(self):
+        if ctk.CTkInputDialog(text="Type 'DELETE' to confirm", title="Confirm Deletion").get_input() == "DELETE":
+            try:
+                shutil.rmtree(UPLOAD_DIR)
+                os.makedirs(UPLOAD_DIR)
+                upload_index.rescan()
+                self.log_message("All uploads cleared.")
+                self.refresh_file_manager()
+            except Exception as e:
+                self.log_message(f"Error clearing uploads: {e}")
+
+    # --- STATISTICS & UTILITIES ---
+    def update_statistics(self):
+        try:
+            stats = upload_index.stats()
+            largest = stats["largest"]
+            largest_file = f"{largest.name} ({self.format_file_size(largest.size)})" if largest and largest.size else "N/A"
+            file_types_str = ", ".join([f"{ext} ({count})" for ext, count in stats["file_types"].items()])
+
+            self.stats_labels["total_files"].configure(text=str(stats["total_files"]))
+            self.stats_labels["total_size"].configure(text=self.format_file_size(stats["total_size"]))
+            self.stats_labels["largest_file"].configure(text=largest_file)
+            self.stats_labels["file_types"].configure(text=file_types_str if file_types_str else "N/A")
+
+        except Exception as e:
+            self.log_message(f"Error updating statistics: {e}")
+
+    def poll_metrics(self):
+        """Update the Live Traffic figures from the server metrics once per METRICS_POLL_MS."""
+        now, snapshot = time.monotonic(), metrics.snapshot()
+        then, previous = self.metrics_sample
+        self.metrics_sample = (now, snapshot)
+        elapsed = max(now - then, 1e-3)
+        upload_rate = (snapshot["bytes_in"] - previous["bytes_in"]) / elapsed / 1024 ** 2
+        download_rate = (snapshot["bytes_out"] - previous["bytes_out"]) / elapsed / 1024 ** 2
+        request_rate = (snapshot["requests"] - previous["requests"]) / elapsed
+
+        self.stats_labels["upload_speed"].configure(text=f"{upload_rate:.2f} MB/s")
+        self.stats_labels["download_speed"].configure(text=f"{download_rate:.2f} MB/s")
+        self.stats_labels["requests"].configure(text=f"{snapshot['requests']} total, {request_rate:.1f}/s")
+        self.stats_labels["active_connections"].configure(text=str(snapshot["active_connections"]))
+        if snapshot["p50"] is not None:
+            self.stats_labels["latency"].configure(
+                text=" / ".join(f"{snapshot[name] * 1000:.1f} ms" for name in ("p50", "p95", "p99")))
+        hot_cache = snapshot["hot_cache"]
+        lookups = hot_cache["hits"] + hot_cache["misses"]
+        if lookups:
+            self.stats_labels["hot_cache"].configure(
+                text=f"{hot_cache['hits'] / lookups:.1%} of {lookups} downloads "
+                     f"({hot_cache['files']} files, {self.format_file_size(hot_cache['bytes'])} in memory)")
+        self.after(METRICS_POLL_MS, self.poll_metrics)
+
+    def format_file_size(self, size_bytes):
+        if size_bytes == 0: return "0 Bytes"
+        k = 1024
+        i = int(math.log(size_bytes, k))
+        return f"{size_bytes / k**i:.2f} {['Bytes', 'KB', 'MB', 'GB', 'TB'][i]}"
+    
+    def get_local_ip(self):
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]
+            s.close()
+            return ip
+        except Exception:
+            return "127.0.0.1"
+
+    def update_ip_address(self):
+        self.local_ip = self.get_local_ip()
+
+    def generate_qr_code(self):
+        if self.is_running:
+            host = self.host_entry.get()
+            port = self.port_entry.get()
+            # Use local IP for QR code as it's more useful for other devices on the network
+            url = f"http://{self.local_ip}:{port}"
+            qr = qrcode.QRCode(
+                version=1,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            qr.add_data(url)
+            qr.make(fit=True)
+            
+            img = qr.make_image(fill_color="black", back_color="white")
+            ctk_img = ctk.CTkImage(img, size=(250, 250))
+            self.qr_image_label.configure(image=ctk_img, text="")
+
+    # --- SETTINGS & CONFIG ---
+    def change_appearance_mode_event(self, new_appearance_mode: str):
+        ctk.set_appearance_mode(new_appearance_mode.lower())
+        self.config["theme"] = new_appearance_mode.lower()
+        self.save_config()
+
+    def apply_limit_settings(self):
+        """Validate the Settings tab limits, save them and apply them to the server."""
+        try:
+            values = {key: int(entry.get() or 0) for key, entry in self.limit_entries.items()}
+        except ValueError:
+            self.log_message("Error: limits must be whole numbers.")
+            return
+        if any(value < 0 for value in values.values()):
+            self.log_message("Error: limits cannot be negative.")
+            return
+        self.config.update(values)
+        self.config["fsync_mode"] = self.fsync_optionmenu.get().lower()
+        self.save_config()
+        apply_limits(self.config)
+        self.log_message("Upload and bandwidth limits applied.")
+
+    def load_config(self):
+        return read_config()
+
+    def save_config(self):
+        write_config(self.config)
+
+    def on_closing(self):
+        if self.is_running:
+            self.stop_server()
+        self.destroy()
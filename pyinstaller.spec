@@ -11,7 +11,7 @@ a = Analysis(
         ('nexus_config.json', '.'),
         ('NexusShare.jpg', '.')
     ],
-    hiddenimports=['customtkinter', 'PIL', 'qrcode'],
+    hiddenimports=['nexus_gui', 'customtkinter', 'PIL', 'qrcode'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],